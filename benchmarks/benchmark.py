@@ -0,0 +1,237 @@
+import argparse
+import datetime
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from src.timeseriesencoder import JSONEncoder, CSVEncoder
+
+__all__ = ['BenchmarkData', 'Benchmark']
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+DEFAULT_BASELINE = 'benchmarks/baseline.json'
+PATHS = ['json_encode', 'json_decode', 'csv_encode', 'csv_decode']
+
+# Points per series for the many_keys generator
+KEY_SERIES_LENGTH = 100
+START_TIME = datetime.datetime(2022, 1, 1).timestamp()
+
+class BenchmarkData:
+    @staticmethod
+    def timestamps(n, regular=True, seed=0):
+        if regular:
+            offsets = np.arange(n) * 60
+        else:
+            rng = np.random.default_rng(seed)
+            offsets = np.cumsum(rng.integers(1, 600, n))
+        utc = START_TIME + offsets
+        return np.datetime_as_string(utc.astype('datetime64[s]'), unit='s').tolist()
+
+    @staticmethod
+    def series(times, values):
+        return [{"UTC": t + 'Z', "Value": v} for t, v in zip(times, values)]
+
+    @staticmethod
+    def regular(n, seed=0):
+        rng = np.random.default_rng(seed)
+        values = np.round(rng.uniform(0, 100, n), 2).tolist()
+        return {"series": BenchmarkData.series(BenchmarkData.timestamps(n), values)}
+
+    @staticmethod
+    def irregular(n, seed=0):
+        rng = np.random.default_rng(seed)
+        values = np.round(rng.uniform(0, 100, n), 2).tolist()
+        return {"series": BenchmarkData.series(BenchmarkData.timestamps(n, regular=False, seed=seed), values)}
+
+    @staticmethod
+    def static(n, seed=0):
+        return {"series": BenchmarkData.series(BenchmarkData.timestamps(n), [42.5] * n)}
+
+    @staticmethod
+    def signed_floats(n, seed=0):
+        rng = np.random.default_rng(seed)
+        values = np.round(rng.normal(0, 1000, n), 4).tolist()
+        return {"series": BenchmarkData.series(BenchmarkData.timestamps(n, regular=False, seed=seed), values)}
+
+    @staticmethod
+    def wide_precision(n, seed=0):
+        # Six decimals on large magnitudes need more than 64 bits per value
+        rng = np.random.default_rng(seed)
+        values = np.round(rng.uniform(-5e13, 5e13, n), 6).tolist()
+        return {"series": BenchmarkData.series(BenchmarkData.timestamps(n), values)}
+
+    @staticmethod
+    def many_keys(n, seed=0):
+        rng = np.random.default_rng(seed)
+        document = {}
+        for k, start in enumerate(range(0, n, KEY_SERIES_LENGTH)):
+            length = min(KEY_SERIES_LENGTH, n - start)
+            values = np.round(rng.uniform(0, 100, length), 2).tolist()
+            document[f'key_{k}'] = BenchmarkData.series(BenchmarkData.timestamps(length, regular=False, seed=seed + k), values)
+        return document
+
+    @staticmethod
+    def to_csv(document):
+        lines = ['UTC,Key,Value']
+        for key, series in document.items():
+            lines.extend(f'{point["UTC"]},{key},{point["Value"]}' for point in series)
+        return '\n'.join(lines) + '\n'
+
+CASES = {
+    'regular': BenchmarkData.regular,
+    'irregular': BenchmarkData.irregular,
+    'static': BenchmarkData.static,
+    'signed_floats': BenchmarkData.signed_floats,
+    'wide_precision': BenchmarkData.wide_precision,
+    'many_keys': BenchmarkData.many_keys,
+}
+
+class Benchmark:
+    @staticmethod
+    def prepare(path, document):
+        # Returns the callable under test and a factory for its input, the encoders leave their input unchanged
+        if path == 'json_encode':
+            return lambda data: JSONEncoder.encode_json(data, ts_key='UTC', ts_value='Value'), lambda: document
+        if path == 'json_decode':
+            encoded = JSONEncoder.encode_json(document, ts_key='UTC', ts_value='Value')
+            return JSONEncoder.decode_json, lambda: encoded
+        csv = BenchmarkData.to_csv(document)
+        if path == 'csv_encode':
+            return lambda data: CSVEncoder.encode_csv(data, time_column='UTC', key_columns=['Key']), lambda: csv
+        if path == 'csv_decode':
+            encoded = CSVEncoder.encode_csv(csv, time_column='UTC', key_columns=['Key'])
+            return CSVEncoder.decode_csv, lambda: encoded
+        raise ValueError(f'Unsupported benchmark path: {path}, expected one of {PATHS}.')
+
+    @staticmethod
+    def output_size(output):
+        if isinstance(output, (str, bytes)):
+            return len(output)
+        return len(json.dumps(output))
+
+    @staticmethod
+    def run_case(case, path, size, warmup=1, repeat=5, seed=0):
+        document = CASES[case](size, seed)
+        function, make_input = Benchmark.prepare(path, document)
+
+        for _ in range(warmup):
+            function(make_input())
+
+        timings = []
+        for _ in range(repeat):
+            data = make_input()
+            gc.collect()
+            start = time.perf_counter()
+            output = function(data)
+            timings.append(time.perf_counter() - start)
+
+        # Peak memory is measured on a separate call, tracing slows the timed runs down
+        data = make_input()
+        gc.collect()
+        tracemalloc.start()
+        function(data)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        median = float(np.median(timings))
+        return {
+            "case": case,
+            "path": path,
+            "size": size,
+            "median_seconds": median,
+            "best_seconds": float(np.min(timings)),
+            "points_per_second": size / median if median > 0 else float('inf'),
+            "peak_memory": peak_memory,
+            "output_size": Benchmark.output_size(output),
+        }
+
+    @staticmethod
+    def run(cases=None, paths=None, sizes=None, warmup=1, repeat=5, seed=0, verbose=False):
+        results = []
+        for case in cases or list(CASES):
+            for path in paths or PATHS:
+                for size in sizes or DEFAULT_SIZES:
+                    result = Benchmark.run_case(case, path, size, warmup, repeat, seed)
+                    if verbose:
+                        print(Benchmark.format_result(result))
+                    results.append(result)
+        return results
+
+    @staticmethod
+    def result_key(result):
+        return f'{result["case"]}/{result["path"]}/{result["size"]}'
+
+    @staticmethod
+    def format_result(result):
+        return f'{Benchmark.result_key(result):<40} {result["median_seconds"] * 1000:>10.2f} ms {result["points_per_second"]:>14,.0f} pts/s {result["peak_memory"] / 2 ** 20:>9.2f} MiB {result["output_size"]:>12,} chars'
+
+    @staticmethod
+    def compare(results, baseline, time_tolerance=0.25, memory_tolerance=0.25, time_slack=0.002):
+        # Returns a message per regression, output sizes are deterministic and must not grow at all. The time slack keeps
+        # timer noise on the smallest sizes from failing the run
+        regressions = []
+        for result in results:
+            key = Benchmark.result_key(result)
+            reference = baseline.get(key)
+            if reference is None:
+                continue
+            if result["median_seconds"] > reference["median_seconds"] * (1 + time_tolerance) + time_slack:
+                regressions.append(f'{key}: median time {result["median_seconds"]:.4f}s exceeds baseline {reference["median_seconds"]:.4f}s')
+            if result["peak_memory"] > reference["peak_memory"] * (1 + memory_tolerance):
+                regressions.append(f'{key}: peak memory {result["peak_memory"]} exceeds baseline {reference["peak_memory"]}')
+            if result["output_size"] > reference["output_size"]:
+                regressions.append(f'{key}: output size {result["output_size"]} exceeds baseline {reference["output_size"]}')
+        return regressions
+
+    @staticmethod
+    def load_baseline(path):
+        with open(path, 'r') as ifile:
+            return json.load(ifile)
+
+    @staticmethod
+    def save_baseline(results, path):
+        baseline = {Benchmark.result_key(result): result for result in results}
+        with open(path, 'w') as ofile:
+            json.dump(baseline, ofile, indent=1, sort_keys=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the json and csv encode and decode paths.')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--paths', nargs='+', choices=PATHS, default=PATHS)
+    parser.add_argument('--sizes', nargs='+', type=lambda s: int(float(s)), default=DEFAULT_SIZES, help='Number of points per run, 1e2 up to 1e7')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help='Write the results to the baseline file instead of comparing')
+    parser.add_argument('--time-tolerance', type=float, default=0.25)
+    parser.add_argument('--memory-tolerance', type=float, default=0.25)
+    parser.add_argument('--output', help='Also write the raw results to this json file')
+    args = parser.parse_args(argv)
+
+    results = Benchmark.run(args.cases, args.paths, args.sizes, args.warmup, args.repeat, args.seed, verbose=True)
+    if args.output:
+        with open(args.output, 'w') as ofile:
+            json.dump(results, ofile, indent=1)
+
+    if args.update_baseline:
+        Benchmark.save_baseline(results, args.baseline)
+        return 0
+
+    try:
+        baseline = Benchmark.load_baseline(args.baseline)
+    except FileNotFoundError:
+        print(f'No baseline found at {args.baseline}, run with --update-baseline to create one.')
+        return 0
+
+    regressions = Benchmark.compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
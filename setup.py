@@ -25,5 +25,10 @@ setuptools.setup(
         "numpyencoder",
         "pandas",
         "sklearn"
-    ]
+    ],
+    extras_require={
+        "zstd": ["zstandard"],
+        "lz4": ["lz4"],
+        "fast": ["orjson"]
+    }
 )
\ No newline at end of file
@@ -1,4 +1,6 @@
 from .encoders.numeric_encoder import *
 from .encoders.time_series_encoder import *
+from .encoders.compression import *
+from .encoders.profiling import *
 
-__all__ = (encoders.numeric_encoder.__all__ + encoders.time_series_encoder.__all__)
\ No newline at end of file
+__all__ = (encoders.numeric_encoder.__all__ + encoders.time_series_encoder.__all__ + encoders.compression.__all__ + encoders.profiling.__all__)
\ No newline at end of file
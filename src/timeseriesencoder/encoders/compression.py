@@ -0,0 +1,181 @@
+import gzip
+import json
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+__all__ = ['Codec', 'GzipCodec', 'ZlibCodec', 'ZstdCodec', 'LZ4Codec', 'CodecRegistry']
+
+# Framed payloads start with a magic, a format version, the codec id and the id of the dictionary used (0 for none)
+FRAME_MAGIC = b'TSE'
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('>3sBBI')
+
+class Codec:
+    codec_id = None
+    name = None
+
+    def __init__(self, level: int = None):
+        self.level = level
+        self.dictionary_id = 0
+
+    def compress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+    def decompress(self, data: bytes) -> bytes:
+        raise NotImplementedError
+
+class GzipCodec(Codec):
+    codec_id = 1
+    name = 'gzip'
+
+    def __init__(self, level: int = 9):
+        super().__init__(level)
+
+    def compress(self, data):
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def decompress(self, data):
+        return gzip.decompress(data)
+
+class ZlibCodec(Codec):
+    codec_id = 2
+    name = 'zlib'
+
+    def __init__(self, level: int = 6):
+        super().__init__(level)
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+class ZstdCodec(Codec):
+    codec_id = 3
+    name = 'zstd'
+
+    def __init__(self, level: int = 3, dictionary=None):
+        if zstandard is None:
+            raise ImportError('The zstd codec requires the zstandard package, install it with pip install zstandard')
+        super().__init__(level)
+        if isinstance(dictionary, (bytes, bytearray)):
+            dictionary = zstandard.ZstdCompressionDict(bytes(dictionary))
+        self.dictionary = dictionary
+        if dictionary is not None:
+            self.dictionary_id = dictionary.dict_id()
+            self._compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=level)
+            self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+
+    @staticmethod
+    def train(samples, dict_size: int = 16384, level: int = 3):
+        # Samples are encoded outputs, either json objects, strings or bytes
+        if zstandard is None:
+            raise ImportError('The zstd codec requires the zstandard package, install it with pip install zstandard')
+        raw = []
+        for sample in samples:
+            if isinstance(sample, str):
+                sample = sample.encode()
+            elif not isinstance(sample, (bytes, bytearray)):
+                sample = json.dumps(sample).encode()
+            raw.append(bytes(sample))
+        dictionary = zstandard.train_dictionary(dict_size, raw)
+        codec = ZstdCodec(level=level, dictionary=dictionary)
+        CodecRegistry.register_dictionary(codec)
+        return codec
+
+class LZ4Codec(Codec):
+    codec_id = 4
+    name = 'lz4'
+
+    def __init__(self, level: int = 0):
+        if lz4_frame is None:
+            raise ImportError('The lz4 codec requires the lz4 package, install it with pip install lz4')
+        super().__init__(level)
+
+    def compress(self, data):
+        return lz4_frame.compress(data, compression_level=self.level)
+
+    def decompress(self, data):
+        return lz4_frame.decompress(data)
+
+class CodecRegistry:
+    codecs = {}
+    dictionaries = {}
+
+    @staticmethod
+    def register(codec_class):
+        CodecRegistry.codecs[codec_class.codec_id] = codec_class
+        CodecRegistry.codecs[codec_class.name] = codec_class
+        return codec_class
+
+    @staticmethod
+    def register_dictionary(codec):
+        CodecRegistry.dictionaries[(codec.codec_id, codec.dictionary_id)] = codec
+
+    @staticmethod
+    def get_codec(compression):
+        # Accepts a codec instance, a registered name, or a name and level such as 'zlib:1'
+        if isinstance(compression, Codec):
+            return compression
+        if compression is True:
+            compression = 'gzip'
+        name, _, level = str(compression).partition(':')
+        if name not in CodecRegistry.codecs:
+            raise ValueError(f'Unsupported compression codec: {compression}, registered codecs are {sorted(k for k in CodecRegistry.codecs if isinstance(k, str))}.')
+        codec_class = CodecRegistry.codecs[name]
+        if level:
+            return codec_class(level=int(level))
+        return codec_class()
+
+    @staticmethod
+    def is_framed(data):
+        return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:len(FRAME_MAGIC)]) == FRAME_MAGIC
+
+    @staticmethod
+    def compress(data, compression):
+        codec = CodecRegistry.get_codec(compression)
+        if isinstance(data, str):
+            data = data.encode()
+        header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, codec.codec_id, codec.dictionary_id)
+        return header + codec.compress(data)
+
+    @staticmethod
+    def decompress(data, compression=None):
+        magic, version, codec_id, dictionary_id = FRAME_HEADER.unpack_from(data)
+        if magic != FRAME_MAGIC or version != FRAME_VERSION:
+            raise ValueError('Data is not a compressed frame produced by this package.')
+
+        codec = None
+        if isinstance(compression, Codec) and compression.codec_id == codec_id and compression.dictionary_id == dictionary_id:
+            codec = compression
+        elif dictionary_id != 0:
+            codec = CodecRegistry.dictionaries.get((codec_id, dictionary_id))
+            if codec is None:
+                raise ValueError(f'Data was compressed with dictionary {dictionary_id}, which has not been registered.')
+        elif codec_id in CodecRegistry.codecs:
+            codec = CodecRegistry.codecs[codec_id]()
+        else:
+            raise ValueError(f'Data was compressed with unknown codec id {codec_id}.')
+        return codec.decompress(bytes(data[FRAME_HEADER.size:]))
+
+for _codec in [GzipCodec, ZlibCodec, ZstdCodec, LZ4Codec]:
+    CodecRegistry.register(_codec)
@@ -1,26 +1,96 @@
 
 from argparse import ArgumentError
-import copy
+from collections import OrderedDict
+import threading
 import numpy as np
 
 __all__ = ['NumericEncoder']
 
+# Values wider than 64 bits are held as two uint64 halves, worked on as four 32 bit limbs so every product and carry fits in a uint64
+LIMB_BITS = np.uint64(32)
+LIMB_MASK = np.uint64(0xFFFFFFFF)
+LIMB_COUNT = 4
+WIDE_STATES = 2 ** 128
+
+# Encoding and decoding tables per encoding size, built on first use and shared read-only by every encoder
+CHARACTER_TABLES = {}
+
+# Alphabets by encoding size, registered with NumericEncoder.register_alphabet
+ALPHABETS = {}
+
+# Encoding sizes of the built in alphabets. Serialized encoders only record their encoding size, so these can never be
+# replaced without changing how existing data decodes
+BUILTIN_ALPHABETS = set()
+
+# Characters json escapes inside strings, json safe alphabets may not use them
+JSON_ESCAPED = set(range(0, 32)) | {34, 92, 127}
+
+# Words are held in str with one character per byte, latin-1 maps the bytes 0 to 255 to the same code points
+WORD_ENCODING = 'latin-1'
+
+# Serialized settings, in the order they are written
+ENCODER_FIELDS = ['numeric_type', 'encoding_depth', 'float_precision', 'signed', 'encoding_size', 'step', 'delta', 'bit_width', 'reference']
+
+# Packed states are held in a uint64
+MAX_BIT_WIDTH = 64
+
+# Packed values are converted to bits in chunks of character_bits * PACK_CHUNK values, so a chunk always ends on a
+# character boundary and the bit matrices stay a few MiB whatever the length of the series
+PACK_CHUNK = 8192
+
+# Shared encoders kept by NumericEncoder.cached, the least recently used is dropped past this count. Settings such as
+# step and reference differ per series, so a long running process would otherwise keep one encoder per series
+MAX_CACHED_ENCODERS = 1024
+CACHE_LOCK = threading.Lock()
+
 class NumericEncoder:
-    def __init__(self, numeric_type: str = None, float_precision: int = None, signed: bool = None, encoding_depth: int = None, encoding_size: int = None):
+    __slots__ = ENCODER_FIELDS + ['encoding_table', 'decoding_table', '_frozen']
+
+    # Encoders cannot be changed after construction, so deserialize shares one instance per set of settings
+    instances = OrderedDict()
+
+    def __init__(self, numeric_type: str = None, float_precision: int = None, signed: bool = None, encoding_depth: int = None, encoding_size: int = None, step: int = None, delta: bool = None, bit_width: int = None, reference: int = None):
         self.numeric_type = numeric_type or 'float'
         self.encoding_depth = encoding_depth or 1
         self.float_precision = float_precision or 0
         self.signed = signed or False
         self.encoding_size = encoding_size or 64
 
+        # Lossy quantization step, in units of the last decimal kept by float_precision
+        self.step = step
+        # Encode the difference to the previous value instead of the value itself
+        self.delta = delta or False
+        # Pack every value in exactly bit_width bits instead of encoding_depth characters, the bitstream is then
+        # written with as many whole bits per character as the alphabet holds
+        self.bit_width = bit_width
+        if bit_width is not None and not 0 < bit_width <= MAX_BIT_WIDTH:
+            raise ValueError(f'Unsupported bit width: {bit_width}, packed values take 1 to {MAX_BIT_WIDTH} bits.')
+        # Frame of reference, a state subtracted from every value so series far from zero need fewer states
+        self.reference = reference
+
         # Default to base64, but accept an input character set
         self.set_encoding_character_set(self.encoding_size)
 
         if numeric_type == 'int':
             self.float_precision = 0
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError(f'NumericEncoder is immutable, {name} cannot be set after construction.')
+        object.__setattr__(self, name, value)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def get_max_state(self):
-        number_of_states = self.encoding_size ** self.encoding_depth
+        if self.bit_width is not None:
+            number_of_states = 2 ** self.bit_width
+        else:
+            number_of_states = self.encoding_size ** self.encoding_depth
         if self.signed:
             max_state = int(number_of_states / 2)
         else:
@@ -29,13 +99,15 @@ class NumericEncoder:
 
     @staticmethod
     def serialize(encoder):
-        msg = copy.copy(encoder.__dict__)
-        del msg["encoding_table"]
-        del msg["decoding_table"]
+        msg = {key: getattr(encoder, key) for key in ENCODER_FIELDS}
 
         defaults = {
             "signed" : False,
-            "encoding_size" : 64
+            "encoding_size" : 64,
+            "step" : None,
+            "delta" : False,
+            "bit_width" : None,
+            "reference" : None
         }
 
         for key in defaults:
@@ -49,21 +121,44 @@ class NumericEncoder:
 
     @staticmethod
     def deserialize(msg):
+        msg = dict(msg)
         defaults = {
             "signed" : False,
-            "encoding_size" : 64
+            "encoding_size" : 64,
+            "step" : None,
+            "delta" : False,
+            "bit_width" : None,
+            "reference" : None
         }
 
         for key in defaults:
             msg[key] = msg.get(key) or defaults[key]
 
-        encoder = NumericEncoder(
+        return NumericEncoder.cached(
             numeric_type=msg["numeric_type"], 
             float_precision=msg["float_precision"], 
             signed=msg["signed"], 
             encoding_depth=msg["encoding_depth"], 
-            encoding_size= msg["encoding_size"]
+            encoding_size= msg["encoding_size"],
+            step=msg["step"],
+            delta=msg["delta"],
+            bit_width=msg["bit_width"],
+            reference=msg["reference"]
         )
+
+    @staticmethod
+    def cached(numeric_type: str = None, float_precision: int = None, signed: bool = None, encoding_depth: int = None, encoding_size: int = None, step: int = None, delta: bool = None, bit_width: int = None, reference: int = None):
+        key = (numeric_type, float_precision, signed, encoding_depth, encoding_size, step, delta, bit_width, reference)
+        with CACHE_LOCK:
+            encoder = NumericEncoder.instances.get(key)
+            if encoder is not None:
+                NumericEncoder.instances.move_to_end(key)
+                return encoder
+        encoder = NumericEncoder(*key)
+        with CACHE_LOCK:
+            encoder = NumericEncoder.instances.setdefault(key, encoder)
+            while len(NumericEncoder.instances) > MAX_CACHED_ENCODERS:
+                NumericEncoder.instances.popitem(last=False)
         return encoder
 
     @staticmethod
@@ -81,86 +176,372 @@ class NumericEncoder:
         character_set = np.concatenate([np.arange(48, 58, 1, dtype=np.uint8), np.arange(65, 91, 1, dtype=np.uint8), np.arange(97, 123, 1, dtype=np.uint8), np.asarray([45, 33, 35, 36, 37, 38, 40, 41, 42, 43, 44, 46, 47, 58, 59, 60, 61, 62, 63, 64, 91, 93, 94, 95, 96, 123, 124, 125, 126], dtype=np.uint8)])
         return character_set
 
+    @staticmethod
+    def get_base_85():
+        # The Z85 alphabet
+        return np.frombuffer(b'0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ.-:+=^!/*?&<>()[]{}@%$#', dtype=np.uint8).copy()
+
+    @staticmethod
+    def get_base_93():
+        # Every printable ascii character json does not escape
+        characters = NumericEncoder.get_base_64()
+        rest = [c for c in range(32, 127) if c not in characters and c not in JSON_ESCAPED]
+        return np.concatenate([characters, np.asarray(sorted(rest, key=lambda c: c == 32), dtype=np.uint8)])
+
+    @staticmethod
+    def get_base_128():
+        return np.arange(128, dtype=np.uint8)
+
+    @staticmethod
+    def get_base_256():
+        return np.arange(256, dtype=np.uint8)
+
+    @staticmethod
+    def register_alphabet(characters, json_safe: bool = True, replace: bool = False):
+        # Characters are a str, bytes or byte values, the alphabet is used for encoding_size=len(characters). Binary
+        # alphabets (json_safe=False) produce valid json, but the escaped characters make it larger, they are meant for
+        # transports that carry the data as bytes
+        if isinstance(characters, str):
+            characters = characters.encode(WORD_ENCODING)
+        alphabet = np.asarray(bytearray(characters) if isinstance(characters, (bytes, bytearray)) else characters)
+        if alphabet.ndim != 1 or alphabet.shape[0] < 2 or np.min(alphabet) < 0 or np.max(alphabet) > 255:
+            raise ValueError('An alphabet needs at least two characters with code points below 256.')
+        alphabet = alphabet.astype(np.uint8)
+        if np.unique(alphabet).shape[0] != alphabet.shape[0]:
+            raise ValueError('Alphabet characters must be unique.')
+        escaped = sorted(set(alphabet.tolist()) & JSON_ESCAPED)
+        if json_safe and escaped:
+            raise ValueError(f'Alphabet contains characters json has to escape: {[chr(c) for c in escaped]}, register it with json_safe=False to allow them.')
+
+        encoding_size = alphabet.shape[0]
+        if encoding_size in BUILTIN_ALPHABETS:
+            raise ValueError(f'Encoding size {encoding_size} uses a built in alphabet, which cannot be replaced.')
+        if encoding_size in ALPHABETS and not replace:
+            raise ValueError(f'An alphabet for encoding size {encoding_size} is already registered, pass replace=True to replace it.')
+        alphabet.setflags(write=False)
+        ALPHABETS[encoding_size] = alphabet
+        # Tables and encoders built from a replaced alphabet are dropped
+        CHARACTER_TABLES.pop(encoding_size, None)
+        with CACHE_LOCK:
+            for key in [key for key in NumericEncoder.instances if key[4] == encoding_size]:
+                del NumericEncoder.instances[key]
+        return encoding_size
+
     @staticmethod
     def get_character_set(encoding_size):
-        # Check encoding size
-        if encoding_size == 16:
-            character_set = NumericEncoder.get_base_16()
-        elif encoding_size is None or encoding_size == 64:
-            character_set = NumericEncoder.get_base_64()
-        elif encoding_size == 91:
-            character_set = NumericEncoder.get_base_91()
-        else:
-            raise ValueError(f'Unsupported encoding size: {encoding_size}, currently we only support base 16, 64, and 91.')
-        return character_set
+        if encoding_size is None:
+            encoding_size = 64
+        if encoding_size not in ALPHABETS:
+            raise ValueError(f'Unsupported encoding size: {encoding_size}, registered alphabets are {sorted(ALPHABETS)}.')
+        return ALPHABETS[encoding_size]
+
+    @staticmethod
+    def words_to_text(words):
+        return words.tobytes().decode(WORD_ENCODING)
+
+    @staticmethod
+    def text_to_words(string, encoding_depth):
+        return np.frombuffer(string.encode(WORD_ENCODING), dtype=np.uint8).reshape(-1, encoding_depth)
         
     
     def set_encoding_character_set(self, encoding_size):
-        self.encoding_table = NumericEncoder.get_character_set(encoding_size)
+        tables = CHARACTER_TABLES.get(encoding_size)
+        if tables is None:
+            encoding_table = NumericEncoder.get_character_set(encoding_size)
+            decoding_table = np.zeros(256, dtype=np.uint8)
+            decoding_table[encoding_table] = np.arange(len(encoding_table))
+            decoding_table.setflags(write=False)
+            tables = CHARACTER_TABLES.setdefault(encoding_size, (encoding_table, decoding_table))
+        self.encoding_table, self.decoding_table = tables
         self.encoding_size = len(self.encoding_table)
-        self.decoding_table = np.zeros(256, dtype=np.uint8)
-        for i, idx in enumerate(self.encoding_table):
-            self.decoding_table[idx] = i
+
+    def character_bits(self):
+        # Whole bits a character of the alphabet carries in packed mode
+        return self.encoding_size.bit_length() - 1
+
+    def packed_length(self, count):
+        # Characters taken by count packed values
+        return -(-count * self.bit_width // self.character_bits())
 
     def encode(self, numeric_data, joined=True):
+        new_bytes = self.encode_bytes(numeric_data)
+        if joined == True:
+            return NumericEncoder.words_to_text(new_bytes)
+        if self.bit_width is not None:
+            raise ValueError('Packed values do not fall on character boundaries, encode them with joined=True.')
+        text = NumericEncoder.words_to_text(new_bytes)
+        depth = self.encoding_depth
+        return [text[i:i + depth] for i in range(0, len(text), depth)]
+
+    def scale(self, numeric_data):
+        # Values in units of the last decimal kept, before the sign shift
         vector = np.copy(numeric_data)
 
         if self.numeric_type == 'float':
             vector = vector * (10 ** self.float_precision)
 
+        if self.step is not None:
+            # Rounded here, a value just below zero that quantizes to zero must not keep its sign
+            vector = np.rint(vector / self.step)
+
+        if self.delta:
+            vector = np.diff(np.rint(vector), prepend=0)
+
+        if self.reference is not None:
+            # The reference is the smallest state, so it is taken from rounded values
+            vector = np.rint(vector) - self.reference
+        return vector
+
+    def unscale(self, vector):
+        if self.reference is not None:
+            if vector.dtype.kind in 'iu':
+                vector = vector.astype(np.int64) + np.int64(self.reference)
+            else:
+                vector = vector + self.reference
+
+        if self.delta:
+            vector = np.cumsum(vector)
+
+        if self.step is not None:
+            vector = vector * self.step
+
+        if self.numeric_type == 'float':
+            vector =  np.divide(vector, (10 ** self.float_precision))
+        return vector
+
+    def encode_bytes(self, numeric_data):
+        # Characters of every word as a uint8 matrix with one row per value, or a single row of packed characters
+        vector = self.scale(numeric_data)
+
+        if self.bit_width is not None:
+            encoded_bytes = self.encode_packed(vector)
+        elif self.is_wide() and vector.dtype.kind == 'f' and np.max(np.abs(vector), initial=0) < WIDE_STATES:
+            encoded_bytes = self.encode_wide(vector)
+        else:
+            if self.signed:
+                vector = vector + np.float64(self.get_max_state())
+
+            if (np.min(vector) < 0):
+                print(vector)
+                raise AssertionError("Invalid encoding, encoding algorithm only works for positive numbers")
+            if np.max(vector) < 18446744073709551615:
+                vector = np.rint(vector).astype(np.uint64)
+            else:
+                # Slower, but necessary for extremely large encodings
+                vector = np.rint(vector).astype(object)
+            encoded_bytes = np.zeros((vector.shape[0], self.encoding_depth), dtype=np.uint8)
+            for i in range(self.encoding_depth):
+                place_value = (self.encoding_size ** (self.encoding_depth - i - 1))
+                encoded_bytes[:, i][vector >= place_value] = np.floor_divide(vector[vector >= place_value], place_value)
+                vector[vector >= place_value] = vector[vector >= place_value] % place_value
+
+        return self.encoding_table[encoded_bytes]
+
+    def encode_packed(self, vector):
+        vector = np.rint(vector)
+        low = -self.get_max_state() if self.signed else 0
+        if vector.shape[0] and (np.min(vector) < low or np.max(vector) >= low + 2 ** self.bit_width):
+            raise AssertionError(f'Invalid encoding, packed values must fit in {self.bit_width} bits')
+        # The sign shift is done in integer space, where it stays exact up to 64 bits
         if self.signed:
-            vector = vector + np.float64(self.get_max_state())
+            states = vector.astype(np.int64).astype(np.uint64) + np.uint64(self.get_max_state())
+        else:
+            states = vector.astype(np.uint64)
 
-        if (np.min(vector) < 0):
-            print(vector)
-            raise AssertionError("Invalid encoding, encoding algorithm only works for positive numbers")
-        if np.max(vector) < 18446744073709551615:
-            vector = np.rint(vector).astype(np.uint64)
+        character_bits = self.character_bits()
+        encoded = np.empty(self.packed_length(states.shape[0]), dtype=np.uint8)
+        chunk = character_bits * PACK_CHUNK
+        for start in range(0, states.shape[0], chunk):
+            # The big endian bytes of every state give its bits most significant first, cut to the bit width and
+            # regrouped into characters
+            bits = np.unpackbits(states[start:start + chunk].astype('>u8').view(np.uint8).reshape(-1, 8), axis=1)[:, 64 - self.bit_width:].ravel()
+            bits = np.concatenate([bits, np.zeros(-bits.shape[0] % character_bits, dtype=np.uint8)]).reshape(-1, character_bits)
+            position = start * self.bit_width // character_bits
+            encoded[position:position + bits.shape[0]] = np.packbits(bits, axis=1)[:, 0] >> (8 - character_bits)
+        return encoded.reshape(1, -1)
+
+    def decode_packed(self, string, count):
+        character_bits = self.character_bits()
+        digits = self.decoding_table[np.frombuffer(string.encode(WORD_ENCODING), dtype=np.uint8)].astype(np.uint8)
+        vector = np.empty(count, dtype=np.uint64)
+        chunk = character_bits * PACK_CHUNK
+        for start in range(0, count, chunk):
+            size = min(chunk, count - start)
+            position = start * self.bit_width // character_bits
+            characters = digits[position:position + -(-size * self.bit_width // character_bits)]
+            bits = np.unpackbits((characters << (8 - character_bits))[:, np.newaxis], axis=1)[:, :character_bits].ravel()
+            # Every value is widened to 64 bits and read back as a big endian uint64
+            words = np.zeros((size, 64), dtype=np.uint8)
+            words[:, 64 - self.bit_width:] = bits[:size * self.bit_width].reshape(size, self.bit_width)
+            vector[start:start + size] = np.packbits(words, axis=1).view('>u8')[:, 0]
+        if self.signed:
+            vector = (vector - np.uint64(self.get_max_state())).astype(np.int64)
+        return self.unscale(vector)
+
+    def decode(self, string, count=None):
+        return self.decode_array(string, count).tolist()
+
+    def decode_array(self, string, count=None):
+        # Packed strings may end in padding that holds whole values, so their count is needed
+        if self.bit_width is not None:
+            if count is None:
+                count = len(string) * self.character_bits() // self.bit_width
+            return self.decode_packed(string, count)
+
+        vector = NumericEncoder.text_to_words(string, self.encoding_depth)
+        new_vector = self.decoding_table[vector]
+        number_of_states = self.encoding_size ** self.encoding_depth
+        if number_of_states <= 2 ** 64:
+            vector = new_vector.astype(np.uint64)
+            for i in range(self.encoding_depth - 1):
+                vector[:, i] = vector[:, i] * np.uint64(self.encoding_size ** (self.encoding_depth - i - 1))
+            vector = np.sum(vector, axis=1, dtype=np.uint64)
+        elif number_of_states <= WIDE_STATES:
+            vector = self.decode_wide(new_vector)
         else:
             # Slower, but necessary for extremely large encodings
-            vector = np.rint(vector).astype(object)
+            vector = new_vector.astype(object)
+            for i in range(self.encoding_depth - 1):
+                vector[:, i] = vector[:, i] * (self.encoding_size ** (self.encoding_depth - i - 1))
+            vector = np.sum(vector, axis=1)
+
+        # Adjust for signage, the wide path has already removed the offset
+        if self.signed and number_of_states <= 2 ** 64:
+            vector = vector - np.float64(self.get_max_state())
+        return self.unscale(vector)
+
+    def is_wide(self):
+        number_of_states = self.encoding_size ** self.encoding_depth
+        return 2 ** 64 < number_of_states <= WIDE_STATES
+
+    def encode_wide(self, vector):
+        vector = np.rint(vector)
+        negative = vector < 0
+        if negative.any() and not self.signed:
+            raise AssertionError("Invalid encoding, encoding algorithm only works for positive numbers")
+        # States past the word would wrap modulo the limbs, the bounds are checked on exact integers
+        low = -self.get_max_state() if self.signed else 0
+        high = self.get_max_state() if self.signed else self.encoding_size ** self.encoding_depth
+        if vector.shape[0] and (int(np.min(vector)) < low or int(np.max(vector)) >= high):
+            raise AssertionError(f'Invalid encoding, values must fit in {self.encoding_depth} characters')
+
+        limbs = NumericEncoder.float_to_limbs(np.abs(vector))
+        if self.signed:
+            # Shift by the max state in integer space so the low digits of small values survive
+            max_state = NumericEncoder.int_to_limbs(self.get_max_state())
+            limbs = np.where(negative, NumericEncoder.limbs_subtract(max_state, limbs), NumericEncoder.limbs_add(limbs, max_state))
+
         encoded_bytes = np.zeros((vector.shape[0], self.encoding_depth), dtype=np.uint8)
+        for i in range(self.encoding_depth - 1, -1, -1):
+            limbs, digit = NumericEncoder.limbs_divmod(limbs, self.encoding_size)
+            encoded_bytes[:, i] = digit
+        return encoded_bytes
+
+    def decode_wide(self, digits):
+        limbs = np.zeros((LIMB_COUNT, digits.shape[0]), dtype=np.uint64)
         for i in range(self.encoding_depth):
-            place_value = (self.encoding_size ** (self.encoding_depth - i - 1))
-            encoded_bytes[:, i][vector >= place_value] = np.floor_divide(vector[vector >= place_value], place_value)
-            vector[vector >= place_value] = vector[vector >= place_value] % place_value
-
-        offsets = self.encoding_table - np.arange(0, len(self.encoding_table), 1)
-        new_bytes = np.copy(encoded_bytes)
-        for i, o in enumerate(offsets):
-            new_bytes[encoded_bytes == i] = encoded_bytes[encoded_bytes == i] + o 
-        codes = new_bytes.view('c').view(f'S{self.encoding_depth}').astype('U').ravel()
-        tokenized = codes.tolist()
-        
-        if joined == True:
-            return ''.join(tokenized)
-        else:
-            return tokenized
-
-    def decode(self, string):
-        vector = np.frombuffer(string.encode('utf-8'), dtype=f'S1').reshape(int(len(string) / self.encoding_depth), self.encoding_depth)
-        vector = vector.view(np.uint8)
-        offsets = self.decoding_table - np.arange(0, len(self.decoding_table), 1)
-        valid_offsets = set(self.encoding_table)
-        new_vector = np.copy(vector)
-        for i, o in enumerate(offsets):
-            if i in valid_offsets:
-                new_vector[vector == i] = vector[vector == i] + o 
-        vector = new_vector.astype(int)
-        for i in range(self.encoding_depth - 1):
-            offset = (self.encoding_size ** (self.encoding_depth - i - 1))
-            try:
-                vector[:, i] = vector[:, i] * offset
-            except OverflowError:
-                vector = vector.astype(object)
-                vector[:, i] = vector[:, i] * offset
-        vector = np.sum(vector, axis=1)
-
-        # Adjust for signage
-        if self.signed:
-            vector = vector - np.float64(self.get_max_state())
+            limbs = NumericEncoder.limbs_multiply_add(limbs, self.encoding_size, digits[:, i].astype(np.uint64))
 
+        if self.signed:
+            max_state = NumericEncoder.int_to_limbs(self.get_max_state())
+            positive = NumericEncoder.limbs_greater_equal(limbs, max_state)
+            magnitude = np.where(positive, NumericEncoder.limbs_subtract(limbs, max_state), NumericEncoder.limbs_subtract(max_state, limbs))
+            if self.numeric_type == 'float':
+                return np.where(positive, 1.0, -1.0) * NumericEncoder.limbs_to_float(magnitude)
+            magnitude = NumericEncoder.limbs_to_int(magnitude)
+            return np.where(positive, magnitude, -magnitude)
         if self.numeric_type == 'float':
-            vector =  np.divide(vector, (10 ** self.float_precision))
-        return vector.tolist()
-    
\ No newline at end of file
+            return NumericEncoder.limbs_to_float(limbs)
+        return NumericEncoder.limbs_to_int(limbs)
+
+    @staticmethod
+    def float_to_limbs(vector):
+        # Splitting on a power of two is exact for integral floats below 2 ** 128
+        high = np.floor(vector / 2.0 ** 64)
+        low = vector - high * 2.0 ** 64
+        limbs = np.zeros((LIMB_COUNT, vector.shape[0]), dtype=np.uint64)
+        for i, half in enumerate([low.astype(np.uint64), high.astype(np.uint64)]):
+            limbs[2 * i] = half & LIMB_MASK
+            limbs[2 * i + 1] = half >> LIMB_BITS
+        return limbs
+
+    @staticmethod
+    def int_to_limbs(value):
+        return np.asarray([(value >> (32 * i)) & 0xFFFFFFFF for i in range(LIMB_COUNT)], dtype=np.uint64).reshape(LIMB_COUNT, 1)
+
+    @staticmethod
+    def limbs_halves(limbs):
+        low = (limbs[1] << LIMB_BITS) | limbs[0]
+        high = (limbs[3] << LIMB_BITS) | limbs[2]
+        return low, high
+
+    @staticmethod
+    def limbs_to_float(limbs):
+        # Exact whenever the value fits a float64, as each half then holds at most 53 significant bits
+        low, high = NumericEncoder.limbs_halves(limbs)
+        return high.astype(np.float64) * 2.0 ** 64 + low.astype(np.float64)
+
+    @staticmethod
+    def limbs_to_int(limbs):
+        low, high = NumericEncoder.limbs_halves(limbs)
+        return high.astype(object) * 2 ** 64 + low.astype(object)
+
+    @staticmethod
+    def limbs_add(a, b):
+        a, b = np.broadcast_arrays(a, b)
+        result = np.empty(a.shape, dtype=np.uint64)
+        carry = np.uint64(0)
+        for i in range(LIMB_COUNT):
+            total = a[i] + b[i] + carry
+            result[i] = total & LIMB_MASK
+            carry = total >> LIMB_BITS
+        return result
+
+    @staticmethod
+    def limbs_subtract(a, b):
+        # Assumes a >= b, otherwise the result wraps modulo 2 ** 128
+        a, b = np.broadcast_arrays(a, b)
+        result = np.empty(a.shape, dtype=np.uint64)
+        borrow = np.uint64(0)
+        for i in range(LIMB_COUNT):
+            total = a[i] + (LIMB_MASK + np.uint64(1)) - b[i] - borrow
+            result[i] = total & LIMB_MASK
+            borrow = np.uint64(1) - (total >> LIMB_BITS)
+        return result
+
+    @staticmethod
+    def limbs_greater_equal(a, b):
+        a, b = np.broadcast_arrays(a, b)
+        greater = np.zeros(a.shape[1], dtype=bool)
+        decided = np.zeros(a.shape[1], dtype=bool)
+        for i in range(LIMB_COUNT - 1, -1, -1):
+            greater |= ~decided & (a[i] > b[i])
+            decided |= a[i] != b[i]
+        return greater | ~decided
+
+    @staticmethod
+    def limbs_divmod(limbs, divisor):
+        divisor = np.uint64(divisor)
+        quotient = np.empty_like(limbs)
+        remainder = np.zeros(limbs.shape[1], dtype=np.uint64)
+        for i in range(LIMB_COUNT - 1, -1, -1):
+            current = (remainder << LIMB_BITS) | limbs[i]
+            quotient[i] = current // divisor
+            remainder = current - quotient[i] * divisor
+        return quotient, remainder
+
+    @staticmethod
+    def limbs_multiply_add(limbs, multiplier, addend):
+        multiplier = np.uint64(multiplier)
+        result = np.empty_like(limbs)
+        carry = addend
+        for i in range(LIMB_COUNT):
+            total = limbs[i] * multiplier + carry
+            result[i] = total & LIMB_MASK
+            carry = total >> LIMB_BITS
+        return result
+    
+
+for _alphabet, _json_safe in [(NumericEncoder.get_base_16(), True), (NumericEncoder.get_base_64(), True), (NumericEncoder.get_base_85(), True), (NumericEncoder.get_base_91(), True), (NumericEncoder.get_base_93(), True), (NumericEncoder.get_base_128(), False), (NumericEncoder.get_base_256(), False)]:
+    NumericEncoder.register_alphabet(_alphabet, json_safe=_json_safe)
+BUILTIN_ALPHABETS.update(ALPHABETS)
@@ -0,0 +1,97 @@
+import contextlib
+import threading
+import time
+
+__all__ = ['Profiler']
+
+# Returned by Profiler.stage when nothing is recording, so disabled profiling costs a single lookup per stage
+NULL_STAGE = contextlib.nullcontext()
+
+_local = threading.local()
+
+class ProfileStage:
+    def __init__(self, profiler, stage, info):
+        self.profiler = profiler
+        self.record = {"stage": stage}
+        self.record.update(profiler.labels)
+        self.record.update(info)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.record["seconds"] = time.perf_counter() - self.start
+        self.profiler.add(self.record)
+        return False
+
+class ProfileContext:
+    def __init__(self, profiler, labels):
+        self.profiler = profiler
+        self.labels = labels
+
+    def __enter__(self):
+        self.previous = self.profiler.labels
+        self.profiler.labels = dict(self.previous, **self.labels)
+        return self.profiler
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.labels = self.previous
+        return False
+
+class Profiler:
+    def __init__(self, callback=None):
+        # The callback receives every record as it is made, for forwarding to a metrics client
+        self.callback = callback
+        self.records = []
+        self.labels = {}
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = getattr(_local, 'profiler', None)
+        _local.profiler = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.profiler = self._previous
+        self._previous = None
+        return False
+
+    @staticmethod
+    def active():
+        return getattr(_local, 'profiler', None)
+
+    @staticmethod
+    def stage(stage, **info):
+        # Times the enclosed block, the record it yields can be extended with details only known afterwards
+        profiler = getattr(_local, 'profiler', None)
+        if profiler is None:
+            return NULL_STAGE
+        return ProfileStage(profiler, stage, info)
+
+    @staticmethod
+    def context(**labels):
+        # Labels such as the series path or csv column are added to every stage recorded inside the block
+        profiler = getattr(_local, 'profiler', None)
+        if profiler is None:
+            return NULL_STAGE
+        return ProfileContext(profiler, labels)
+
+    def add(self, record):
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def summary(self):
+        # Totals per stage, in the order each stage was first seen
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record["stage"], {"count": 0, "seconds": 0.0, "points": 0, "bytes": 0})
+            total["count"] += 1
+            total["seconds"] += record.get("seconds", 0.0)
+            total["points"] += record.get("points", 0)
+            total["bytes"] += record.get("bytes", 0)
+        return totals
+
+    def to_dict(self):
+        return {"records": self.records, "summary": self.summary()}
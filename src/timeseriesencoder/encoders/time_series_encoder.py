@@ -1,67 +1,213 @@
 
+from collections import OrderedDict
+from collections.abc import Sequence
 import copy
+import hashlib
+import io
 from io import StringIO
 import ciso8601
-from .numeric_encoder import NumericEncoder
+from .numeric_encoder import NumericEncoder, MAX_BIT_WIDTH
+from .compression import CodecRegistry
+from .profiling import Profiler
 import numpy as np
 import datetime
 import gzip
 import json
+import re
+import threading
 import pandas as pd
 from sklearn.preprocessing import PolynomialFeatures
 from sklearn.linear_model import LinearRegression
 from numpyencoder import NumpyEncoder
 
-__all__ = ['TimeSeriesEncoder', 'JSONEncoder', 'CSVEncoder']
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+__all__ = ['TimeSeriesEncoder', 'JSONEncoder', 'CSVEncoder', 'IncrementalCSVEncoder', 'EncodingPlan', 'LazySeries', 'DecodedSeries']
 
 MAX_FLOATING_PRECISION = 6
 
+# Number of values checked at once when detecting decimal precision
+SCALE_BLOCK_SIZE = 4096
+
+# Powers of ten tested for each maximum precision, built on first use
+DECIMAL_POWERS = {}
+
+# Candidate bases for encoding_size='auto', in order of preference when estimates tie
+AUTO_ENCODING_SIZES = [64, 91, 16]
+
+# Key under which encode_json(index=True) records the paths of the encoded series
+SERIES_INDEX_KEY = '__series__'
+
+# Path selectors are $ followed by .key, ['key'], [index], .* or [*]
+PATH_TOKEN = re.compile(r"\.([^.\[\]']+)|\[(\*|\d+)\]|\['([^']*)'\]")
+PLAIN_KEY = re.compile(r"[^.\[\]'*]+")
+
+# Fastest installed json library, used for the compressed and file outputs and for parsing them
+JSON_BACKENDS = ['orjson', 'ujson', 'json']
+JSON_BACKEND = 'orjson' if orjson is not None else 'ujson' if ujson is not None else 'json'
+
+# Plans kept by EncodingPlan.register, the least recently used is dropped past this count. Data encoded with a dropped
+# plan decodes again once the plan is registered anew, for example through EncodingPlan.deserialize
+MAX_REGISTERED_PLANS = 256
+PLAN_LOCK = threading.Lock()
+
 class EncoderHelpers:
     @staticmethod
-    def precision_and_scale_np(x, max_magnitude):
-        max_magnitude = max(max_magnitude, 1)
-        int_part = np.abs(x).astype(np.uint64)
-        magnitudes = np.ones_like(int_part)
-        magnitudes[int_part != 0] = np.log10(int_part[int_part != 0]) + 1
-    
-        frac_part = np.abs(x) - int_part
-        multiplier = 10 ** (max_magnitude - magnitudes)
-        frac_digits = multiplier + (multiplier * frac_part + 0.5).astype(np.uint64)
+    def max_decimal_scale(values, max_precision=None):
+        # Checks every candidate scale against a block of values at once, the scale is set by the trailing zeros all
+        # values share once rounded at the maximum precision
+        if max_precision is None:
+            max_precision = MAX_FLOATING_PRECISION
+        powers = DECIMAL_POWERS.get(max_precision)
+        if powers is None:
+            powers = DECIMAL_POWERS.setdefault(max_precision, 10.0 ** np.arange(1, max_precision + 1))
+
+        values = np.asarray(values, dtype=np.float64).ravel()
+        # Integers need no decimals, and scaling large ones by 10 ** max_precision passes 2 ** 53 where the trailing
+        # zeros are lost, so only the other values are checked
+        values = values[np.rint(values) != values]
+        if values.shape[0] == 0:
+            return 0
+        zeros = max_precision
+        for start in range(0, values.shape[0], SCALE_BLOCK_SIZE):
+            if zeros == 0:
+                break
+            scaled = np.rint(values[start:start + SCALE_BLOCK_SIZE] * (10 ** max_precision))
+            if start > 0:
+                # Later blocks usually share the scale already found, which a single check confirms
+                quotient = scaled / powers[zeros - 1]
+                if np.all(quotient == np.rint(quotient)):
+                    continue
+            quotients = np.divide.outer(scaled, powers[:zeros])
+            zeros = int(np.count_nonzero(np.all(quotients == np.rint(quotients), axis=0)))
+        return max_precision - zeros
 
-        while np.any(frac_digits % 10 == 0):
-            frac_digits[frac_digits % 10 == 0] = frac_digits[frac_digits % 10 == 0] / 10
-        scale = np.log10(frac_digits).astype(np.uint64)
-        return np.max(scale)
+    @staticmethod
+    def max_decimal_scales(values, starts, max_precision=None):
+        # max_decimal_scale of every series in a ragged array, series i starts at starts[i]
+        if max_precision is None:
+            max_precision = MAX_FLOATING_PRECISION
+        values = np.asarray(values, dtype=np.float64)
+        integers = np.rint(values) == values
+        scaled = np.rint(values * (10 ** max_precision))
+        zeros = np.zeros(len(starts), dtype=np.int64)
+        for power in range(1, max_precision + 1):
+            quotient = scaled / 10.0 ** power
+            zeros += np.logical_and.reduceat(integers | (quotient == np.rint(quotient)), starts)
+        return max_precision - zeros
+
+    @staticmethod
+    def set_json_backend(backend: str):
+        global JSON_BACKEND
+        if backend not in JSON_BACKENDS or (backend == 'orjson' and orjson is None) or (backend == 'ujson' and ujson is None):
+            raise ValueError(f'Json backend {backend} is not available, expected one of {JSON_BACKENDS} with its package installed.')
+        JSON_BACKEND = backend
+
+    @staticmethod
+    def json_dumps(obj) -> str:
+        # The encoders emit native types, so the C serializers apply, anything else goes through NumpyEncoder
+        try:
+            if JSON_BACKEND == 'orjson':
+                return orjson.dumps(obj).decode()
+            if JSON_BACKEND == 'ujson':
+                return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+            return json.dumps(obj, separators=(',', ':'))
+        except (TypeError, OverflowError):
+            return json.dumps(obj, separators=(',', ':'), cls=NumpyEncoder)
+
+    @staticmethod
+    def json_loads(data):
+        if JSON_BACKEND == 'orjson':
+            return orjson.loads(data)
+        if JSON_BACKEND == 'ujson':
+            return ujson.loads(data)
+        return json.loads(data)
 
     @staticmethod
-    def gzip_str(string_: str) -> bytes:
-        return gzip.compress(string_.encode())
+    def gzip_str(string_: str, compresslevel: int = 9) -> bytes:
+        return gzip.compress(string_.encode(), compresslevel=compresslevel)
 
     @staticmethod
     def gunzip_bytes_obj(bytes_obj: bytes) -> str:
         return gzip.decompress(bytes_obj).decode()
 
+    @staticmethod
+    def json_dump(obj, fileobj, cls=None):
+        # json.dump writes in chunks, so the full document string is never built in memory. The faster backends only
+        # serialize whole documents, so files always go through the standard library
+        writer = io.TextIOWrapper(fileobj, encoding='utf-8')
+        json.dump(obj, writer, separators=(',', ':'), cls=cls)
+        writer.flush()
+        writer.detach()
+
+    @staticmethod
+    def json_load(fileobj):
+        # json.load reads the whole file before parsing as well, so the faster backends cost no extra memory
+        if JSON_BACKEND != 'json':
+            return EncoderHelpers.json_loads(fileobj.read())
+        reader = io.TextIOWrapper(fileobj, encoding='utf-8')
+        try:
+            return json.load(reader)
+        finally:
+            reader.detach()
+
+    @staticmethod
+    def gzip_dump(obj, fileobj, compresslevel: int = 9, cls=None):
+        with gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=compresslevel) as zfile:
+            EncoderHelpers.json_dump(obj, zfile, cls=cls)
+
+    @staticmethod
+    def gunzip_load(fileobj):
+        with gzip.GzipFile(fileobj=fileobj, mode='rb') as zfile:
+            return EncoderHelpers.json_load(zfile)
+
     @staticmethod
     def _calculate_bit_depth(max_val, encoding_size):
-        bitdepth = 0
-        while max_val >= 1:
-            max_val /= encoding_size
+        # Smallest depth where encoding_size ** depth > max_val
+        if max_val < 1:
+            return 0
+        bitdepth = int(np.log(max_val) / np.log(encoding_size)) + 1
+
+        # Correct for rounding of the logarithm around exact powers of the base
+        if encoding_size ** bitdepth <= max_val:
             bitdepth += 1
+        elif encoding_size ** (bitdepth - 1) > max_val:
+            bitdepth -= 1
         return bitdepth
 
     @staticmethod
-    def calculate_bit_depth(values, encoding_size):
+    def calculate_bit_depths(max_values, encoding_size):
+        # Vectorized _calculate_bit_depth, powers past 2 ** 53 are not exact as floats and are checked one by one
+        max_values = np.asarray(max_values, dtype=np.float64)
+        depths = np.zeros(max_values.shape[0], dtype=np.int64)
+        positive = max_values >= 1
+        depths[positive] = (np.log(max_values[positive]) / np.log(encoding_size)).astype(np.int64) + 1
+        powers = np.power(float(encoding_size), depths)
+        depths[positive & (powers <= max_values)] += 1
+        depths[positive & (powers / encoding_size > max_values)] -= 1
+        for i in np.flatnonzero(positive & (powers >= 2.0 ** 53)):
+            depths[i] = EncoderHelpers._calculate_bit_depth(max_values[i], encoding_size)
+        return depths
+
+    @staticmethod
+    def calculate_value_range(values):
+        values = np.asarray(values)
         max_value = np.max(values)
         min_value = np.min(values)
         max_value = max(abs(max_value), abs(min_value))
 
-        vals = np.copy(values)
-        maximum_precision = 0
-        while np.all(np.rint(vals) == vals) == False:
-            maximum_precision += 1
-            if maximum_precision >= MAX_FLOATING_PRECISION:
-                break
-            vals *= 10
+        if values.dtype.kind == 'f':
+            maximum_precision = EncoderHelpers.max_decimal_scale(values)
+        else:
+            maximum_precision = 0
 
         if maximum_precision != 0:
             numeric_type = "float"
@@ -74,9 +220,95 @@ class EncoderHelpers:
             max_value *= 2
         else:
             signed = False
+        return max_value, maximum_precision, numeric_type, signed
+
+    @staticmethod
+    def calculate_quantization(values, error_bound, error_mode='absolute'):
+        # Coarsest step of 1, 2 or 5 times a power of ten whose rounding error stays within the bound
+        if error_mode == 'relative':
+            error_bound = error_bound * np.max(np.abs(values))
+        elif error_mode != 'absolute':
+            raise ValueError(f'Unsupported error mode: {error_mode}, expected absolute or relative.')
+        if error_bound <= 0:
+            return None, None
+
+        width = 2 * error_bound
+        exponent = int(np.floor(np.log10(width)))
+        for multiple in [5, 2, 1]:
+            if multiple * 10.0 ** exponent <= width:
+                break
+        if exponent >= 0:
+            return 0, multiple * 10 ** exponent
+        return -exponent, multiple
+
+    @staticmethod
+    def calculate_value_encoding(values, error_bound=None, error_mode='absolute', delta=False, frame_of_reference=False):
+        max_value, maximum_precision, numeric_type, signed = EncoderHelpers.calculate_value_range(values)
+        step = None
+        if error_bound is not None:
+            precision, quantum = EncoderHelpers.calculate_quantization(values, error_bound, error_mode)
+            # Only quantize when the step is coarser than the precision the data already has. That precision is
+            # capped, so a finer step is also used when rounding at the cap would break the bound
+            if precision is not None and (quantum * 10.0 ** -precision > 10.0 ** -maximum_precision or EncoderHelpers.rounding_error(values, maximum_precision) > quantum * 10.0 ** -precision / 2):
+                maximum_precision = precision
+                step = quantum
+                numeric_type = "float"
+
+        if step is None and not delta and not frame_of_reference:
+            return max_value, maximum_precision, numeric_type, signed, step, None
+
+        # Size the encoding from the states actually written
+        states = np.rint(np.asarray(values, dtype=np.float64) * (10 ** maximum_precision) / (step or 1))
+        if delta:
+            states = np.diff(states, prepend=0)
+        # The frame of reference moves the smallest state to zero
+        reference = int(np.min(states)) if frame_of_reference else 0
+        if reference != 0:
+            return np.max(states) - reference, maximum_precision, numeric_type, False, step, reference
+        max_value, signed = EncoderHelpers.state_range(states)
+        return max_value, maximum_precision, numeric_type, signed, step, None
+
+    @staticmethod
+    def rounding_error(values, precision):
+        values = np.asarray(values, dtype=np.float64)
+        return np.max(np.abs(np.rint(values * (10 ** precision)) / (10 ** precision) - values))
+
+    @staticmethod
+    def state_range(states):
+        # Largest state to encode and whether the states need a sign
+        max_value = max(abs(np.max(states)), abs(np.min(states)))
+        signed = bool(np.min(states) < 0)
+        if signed:
+            max_value *= 2
+        return max_value, signed
+
+    @staticmethod
+    def calculate_bit_depth(values, encoding_size):
+        max_value, maximum_precision, numeric_type, signed = EncoderHelpers.calculate_value_range(values)
         valuebitsize = EncoderHelpers._calculate_bit_depth(max_value, encoding_size)
         return valuebitsize, maximum_precision, numeric_type, signed
 
+    @staticmethod
+    def choose_encoding_size(max_values, count=1, compressed=False):
+        # max_values holds the largest state of each word written per point, e.g. the time offset and the scaled value
+        best_size = None
+        best_length = None
+        for encoding_size in AUTO_ENCODING_SIZES:
+            depth = sum(EncoderHelpers._calculate_bit_depth(v, encoding_size) for v in max_values)
+            length = count * depth
+            if compressed:
+                # Compression recovers the unused states of each character, so compare the information content instead
+                length = length * np.log2(encoding_size)
+            if best_length is None or length < best_length:
+                best_size = encoding_size
+                best_length = length
+        return best_size
+
+    @staticmethod
+    def is_number(value):
+        # Booleans are ints to python, they are kept as values of a lookup
+        return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
     @staticmethod
     def create_lookup_table(values, encoding_size=64):
         values = list(set(values))
@@ -92,8 +324,18 @@ class EncoderHelpers:
             lookup[s] = encoded_states[i]
         return lookup, encoding_depth
 
+    @staticmethod
+    def create_indexed_lookup(values, encoding_size=64, encoding_depth=None):
+        # Codes follow the position of each value, so appending values never changes the code of an earlier one
+        if encoding_depth is None:
+            encoding_depth = EncoderHelpers.calculate_bit_depth(np.arange(1, len(values) + 1), encoding_size=encoding_size)[0]
+        values = values[:encoding_size ** encoding_depth]
+        encoder = NumericEncoder(numeric_type='int', encoding_depth=encoding_depth, encoding_size=encoding_size)
+        encoded_states = encoder.encode(np.arange(0, len(values)), joined=False)
+        return dict(zip(values, encoded_states)), encoding_depth
+
 class TimeSeriesEncoder:
-    def __init__(self, timeseries = None, ts_key='UTC', ts_value='Value', sort_values=False, encoding_size = 64):
+    def __init__(self, timeseries = None, ts_key='UTC', ts_value='Value', sort_values=False, encoding_size = 64, compressed = False, error_bound = None, error_mode = 'absolute', delta = False, packed = False, frame_of_reference = False, block_size = None, lookups = None):
         # Save raw timeseries
         self.timeseries = timeseries
         self.encoding_size = encoding_size
@@ -102,29 +344,61 @@ class TimeSeriesEncoder:
         self.sort_values = sort_values
         self.static = None
         self.regular = False
+        # Packed series write times and values as bitstreams, which do not show the number of points
+        self.packed = packed
+        self.frame_of_reference = frame_of_reference
+        # Distinct values of the keys whose values are not numbers, such values are encoded by their position
+        self.lookups = {} if lookups is None else lookups
 
         if timeseries is not None:
             # Create the optimal encoder
-            self.np_timeseries = self.get_np_timeseries(timeseries)
-            self.encoding_start = np.min(self.np_timeseries[0, 0])
+            with Profiler.stage('parse_timestamps', points=len(timeseries)):
+                self.np_timeseries = self.get_np_timeseries(timeseries)
+
+            if block_size is not None and self.np_timeseries.shape[0] > block_size:
+                self._analyze_blocks(block_size, compressed, error_bound, error_mode, delta)
+            else:
+                self._analyze(compressed, error_bound, error_mode, delta)
+
+    def _analyze(self, compressed=False, error_bound=None, error_mode='absolute', delta=False):
+        with Profiler.stage('analyze', points=self.np_timeseries.shape[0]) as record:
+            self.encoding_start = self.np_timeseries[0, 0]
+
+            if self.encoding_size == 'auto':
+                # Pick the base with the shortest estimated output for this series
+                self.encoding_size = self._choose_encoding_size(compressed, error_bound, error_mode, delta, self.frame_of_reference)
 
             # Determine regularity of data
             gaps = np.diff(self.np_timeseries[:, 0], axis=0)
-            if np.all(gaps == gaps[0]):
+            if len(gaps) == 0:
+                # A single point, such as the last block of a series, is regular with no interval
+                self.regular = True
+                self.interval = 0.0
+            elif np.all(gaps == gaps[0]):
                 # Series is regular
                 self.regular = True
                 self.interval = gaps[0]
             else:
                 self.regular = False
+                # Offsets are taken from the earliest point so unsorted series stay positive
+                self.encoding_start = np.min(self.np_timeseries[:, 0])
                 offsets = self.np_timeseries[:, 0] - self.encoding_start
                 largest_offset = np.max(offsets)
-
-                timebitsize = 0
-                while largest_offset >= 1:
-                    largest_offset /= encoding_size
-                    timebitsize += 1
-                
-                self.timeEncoder = NumericEncoder(encoding_depth = timebitsize, signed=False, numeric_type='int', encoding_size=encoding_size)
+                self.timeEncoder = self._numeric_encoder(largest_offset, signed=False, numeric_type='int')
+
+            if isinstance(self.ts_value, list):
+                # Every value key is a column with its own encoder, a constant column is stored once
+                self.value_columns = {}
+                for j, key in enumerate(self.ts_value):
+                    values = self.np_timeseries[:, 1 + j]
+                    if np.std(values) == 0:
+                        self.value_columns[key] = {"static": values[0].item()}
+                    else:
+                        self.value_columns[key] = {"encoder": self._value_encoder(values, None if key in self.lookups else error_bound, error_mode, delta)}
+                self.count = self.np_timeseries.shape[0]
+                if record is not None:
+                    record["encoding"] = self.describe()
+                return
 
             # Determine value bounds
             values = self.np_timeseries[:, 1]
@@ -136,56 +410,201 @@ class TimeSeriesEncoder:
                 self.static['value'] = values[0].item()
                 self.static['count'] = self.np_timeseries.shape[0]
             else:
-                valuebitsize, maximum_precision, numeric_type, signed = EncoderHelpers.calculate_bit_depth(values, encoding_size)
-                if valuebitsize != 0:
-                    self.encoder = NumericEncoder(encoding_depth = valuebitsize, signed=signed, numeric_type=numeric_type, float_precision=maximum_precision, encoding_size=encoding_size)
+                self.encoder = self._value_encoder(values, None if self.ts_value in self.lookups else error_bound, error_mode, delta)
+                if self.packed:
+                    self.count = self.np_timeseries.shape[0]
+        if record is not None:
+            record["encoding"] = self.describe()
+
+    def _value_encoder(self, values, error_bound=None, error_mode='absolute', delta=False):
+        encoding = EncoderHelpers.calculate_value_encoding(values, error_bound, error_mode, delta, self.frame_of_reference)
+        if encoding[5] is not None:
+            # The reference costs a field in the header, it is only kept when it shortens the words
+            plain = EncoderHelpers.calculate_value_encoding(values, error_bound, error_mode, delta)
+            if self._state_size(plain[0]) <= self._state_size(encoding[0]):
+                encoding = plain
+        max_value, maximum_precision, numeric_type, signed, step, reference = encoding
+        return self._numeric_encoder(max_value, signed=signed, numeric_type=numeric_type, float_precision=maximum_precision, step=step, delta=delta, reference=reference)
+
+    def _analyze_blocks(self, block_size, compressed=False, error_bound=None, error_mode='absolute', delta=False):
+        # Every block of block_size points chooses its own encoders, so a spike only widens the words of its block.
+        # The blocks are encoded right away, their lengths form the directory written in the header
+        self.block_size = block_size
+        self.encoding_start = np.min(self.np_timeseries[:, 0])
+        self.blocks = []
+        data = []
+        for start in range(0, self.np_timeseries.shape[0], block_size):
+            with Profiler.context(block=len(self.blocks)):
+                block = self._new_block()
+                block.np_timeseries = self.np_timeseries[start:start + block_size]
+                block._analyze(compressed, error_bound, error_mode, delta)
+                data.append(block.encode_arrays(block.np_timeseries))
+            block.length = len(data[-1])
+            self.blocks.append(block)
+        self.block_data = ''.join(data)
+
+    def _new_block(self, timeseries = None, **encoder_options):
+        # Blocks share the lookups of the series
+        return TimeSeriesEncoder(timeseries, ts_key=self.ts_key, ts_value=self.ts_value, sort_values=self.sort_values, encoding_size=self.encoding_size, packed=self.packed, frame_of_reference=self.frame_of_reference, lookups=self.lookups, **encoder_options)
+
+    def split_blocks(self, data = None):
+        # The encoder and data of every block, a series without blocks is a single block
+        data = data or ''
+        if getattr(self, 'blocks', None) is None:
+            return [(self, data)]
+        parts = []
+        position = 0
+        for block in self.blocks:
+            parts.append((block, data[position:position + block.length]))
+            position += block.length
+        return parts
+
+    def _numeric_encoder(self, max_value, **options):
+        # Quantization can round every value to zero, which still needs one character (or bit) per point
+        encoding_depth = EncoderHelpers._calculate_bit_depth(max_value, self.encoding_size) or 1
+        bit_width = None
+        if self.packed:
+            bit_width = EncoderHelpers._calculate_bit_depth(max_value, 2) or 1
+            if bit_width > MAX_BIT_WIDTH:
+                # Wider states are written as character words
+                bit_width = None
+        return NumericEncoder(encoding_depth=encoding_depth, encoding_size=self.encoding_size, bit_width=bit_width, **options)
+
+    def _state_size(self, max_value):
+        # Bits per point when packed, characters otherwise
+        return EncoderHelpers._calculate_bit_depth(max_value, 2 if self.packed else self.encoding_size)
+
+    def _choose_encoding_size(self, compressed=False, error_bound=None, error_mode='absolute', delta=False, frame_of_reference=False):
+        times = self.np_timeseries[:, 0]
+        max_states = []
+        gaps = np.diff(times, axis=0)
+        if len(gaps) > 0 and not np.all(gaps == gaps[0]):
+            max_states.append(np.max(times) - np.min(times))
+        for values in self.np_timeseries[:, 1:].T:
+            if np.std(values) != 0:
+                max_states.append(EncoderHelpers.calculate_value_encoding(values, error_bound, error_mode, delta, frame_of_reference)[0])
+        return EncoderHelpers.choose_encoding_size(max_states, len(times), compressed)
+
+    def describe(self):
+        # Summary of the chosen encoding, used by the profiler
+        description = {"encoding_size": self.encoding_size, "regular": self.regular, "static": self.static is not None, "packed": self.packed}
+        if getattr(self, 'timeEncoder', None) is not None:
+            description["time_depth"] = self.timeEncoder.encoding_depth
+        if getattr(self, 'encoder', None) is not None:
+            description["value_depth"] = self.encoder.encoding_depth
+            description["signed"] = self.encoder.signed
+            description["float_precision"] = self.encoder.float_precision
+        if getattr(self, 'value_columns', None) is not None:
+            description["value_depths"] = {key: column["encoder"].encoding_depth for key, column in self.value_columns.items() if "encoder" in column}
+        return description
 
     def get_np_timeseries(self, timeseries):
+        if isinstance(self.ts_value, list) or len(self.lookups) > 0:
+            return self._get_np_columns(timeseries)
+
         raw = np.zeros((len(timeseries), 2))
         for i, k in enumerate(timeseries):
-            unix_time = ciso8601.parse_datetime(k['UTC']).timestamp()
+            value = k[self.ts_value]
+            if type(value) is not float and type(value) is not int:
+                # Strings, booleans and None go through a lookup, numpy numbers are checked by the general path
+                return self._get_np_columns(timeseries)
+            unix_time = ciso8601.parse_datetime(k[self.ts_key]).timestamp()
             raw[i][0] = unix_time
-            raw[i][1] = k['Value']
+            raw[i][1] = value
 
         if self.sort_values:
             raw = raw[raw[:, 0].argsort()]
         return raw
 
-    def encode(self, timeseries):
+    def _get_np_columns(self, timeseries):
+        # One column per value key after the epoch seconds, a key with values that are not numbers holds lookup codes
+        keys = self.ts_value if isinstance(self.ts_value, list) else [self.ts_value]
+        raw = np.zeros((len(timeseries), 1 + len(keys)))
+        raw[:, 0] = [ciso8601.parse_datetime(k[self.ts_key]).timestamp() for k in timeseries]
+        for j, key in enumerate(keys):
+            values = [k[key] for k in timeseries]
+            if key in self.lookups or not all(EncoderHelpers.is_number(value) for value in values):
+                raw[:, 1 + j] = self._lookup_codes(key, values)
+            else:
+                raw[:, 1 + j] = values
+
+        if self.sort_values:
+            raw = raw[raw[:, 0].argsort()]
+        return raw
+
+    def _lookup_codes(self, key, values):
+        # New values are added to the end of the lookup, so the code of a known value never changes.
+        # Codes are keyed by type as well, 1, 1.0 and True are different values
+        lookup = self.lookups.setdefault(key, [])
+        codes = {(type(value), value): code for code, value in enumerate(lookup)}
+        for value in values:
+            if (type(value), value) not in codes:
+                codes[(type(value), value)] = len(lookup)
+                lookup.append(value)
+        return [codes[(type(value), value)] for value in values]
+
+    def _lookup_values(self, key, codes):
+        return np.array(self.lookups[key], dtype=object)[codes.astype(np.int64)]
+
+    def _parse_appended(self, timeseries):
+        # Earlier points of a key without a lookup are encoded as numbers, so its new values must be numbers too
+        keys = set(self.lookups)
         raw = self.get_np_timeseries(timeseries)
+        if set(self.lookups) != keys:
+            raise ValueError('Only numbers can be appended to a value key that was encoded without a lookup.')
+        return raw
+
+    def encode(self, timeseries):
+        if getattr(self, 'blocks', None) is not None:
+            if timeseries is not self.timeseries:
+                raise ValueError('A blocked encoder only encodes the series it was created from.')
+            return self.block_data
+        if timeseries is getattr(self, 'timeseries', None) and getattr(self, 'np_timeseries', None) is not None:
+            # Already parsed while choosing the encoding
+            raw = self.np_timeseries
+        else:
+            with Profiler.stage('parse_timestamps', points=len(timeseries)):
+                raw = self.get_np_timeseries(timeseries)
+        return self.encode_arrays(raw)
+
+    def encode_arrays(self, raw):
+        # Encodes the parsed series, epoch seconds and values in two columns
+        if isinstance(self.ts_value, list):
+            return self._encode_columns(raw)
         encoded = None
 
         if self.regular == False:
             data = np.copy(raw)
-            if self.sort_values:
-                data[:, 0] = np.insert(np.diff(data[:, 0], axis=0), 0, 0)
-            else:
-                data[:, 0] = data[:, 0] - self.encoding_start
+            data[:, 0] = data[:, 0] - self.encoding_start
 
-            encoded_time = self.timeEncoder.encode(data[:, 0])
+            with Profiler.stage('encode_times', points=len(data)) as record:
+                encoded_time = self.timeEncoder.encode(data[:, 0])
+            if record is not None:
+                record["bytes"] = len(encoded_time)
             if self.static is None:
-                encoded_data = self.encoder.encode(raw[:, 1])
+                with Profiler.stage('encode_values', points=len(raw)) as record:
+                    encoded_data = self.encoder.encode(raw[:, 1])
+                if record is not None:
+                    record["bytes"] = len(encoded_data)
 
                 # Zip together the two encodings
-                encoded = ''
-                encoded_length = len(encoded_time)+len(encoded_data)
-                word_size = self.timeEncoder.encoding_depth + self.encoder.encoding_depth
-                for idx, s in enumerate(range(0, encoded_length, word_size)):
-                    encoded_time_byte = encoded_time[idx*self.timeEncoder.encoding_depth:(idx+1)*self.timeEncoder.encoding_depth]
-                    encoded_data_byte = encoded_data[idx*self.encoder.encoding_depth:(idx+1)*self.encoder.encoding_depth]
-                    encoded = encoded + encoded_time_byte + encoded_data_byte
+                with Profiler.stage('interleave', points=len(raw)):
+                    encoded = self.join_words(encoded_time, encoded_data)
             else:
                 encoded = encoded_time
         else:
             if self.static is None:
-                encoded_data = self.encoder.encode(raw[:, 1])
+                with Profiler.stage('encode_values', points=len(raw)) as record:
+                    encoded_data = self.encoder.encode(raw[:, 1])
+                if record is not None:
+                    record["bytes"] = len(encoded_data)
                 encoded = encoded_data
 
         return encoded or ''
 
 
     def __decode_regular(self, data, time_index):
-        decoded = self.encoder.decode(data)
+        decoded = self.encoder.decode(data, self.count_points(data))
         json_values = [''] * len(decoded)
         for i, datum in enumerate(decoded):
             utc = datetime.datetime.utcfromtimestamp(time_index)
@@ -208,7 +627,7 @@ class TimeSeriesEncoder:
         return json_values
 
     def __decode_nonregular_static(self, data):
-        decoded = self.timeEncoder.decode(data)
+        decoded = self.timeEncoder.decode(data, self.count_points(data))
         json_values = [''] * len(decoded)
         for i, datum in enumerate(decoded):
             timestamp = datum + self.encoding_start
@@ -220,15 +639,10 @@ class TimeSeriesEncoder:
         return json_values
 
     def __decode_nonregular(self, data):
-        wordsize = self.timeEncoder.encoding_depth + self.encoder.encoding_depth
-        offsets = ''
-        words = ''
-        for idx in range(0, len(data), wordsize):
-            offsets += data[idx:idx+self.timeEncoder.encoding_depth]
-            words += data[idx+self.timeEncoder.encoding_depth:idx+wordsize]
-
-        decoded_offsets = self.timeEncoder.decode(offsets)
-        decoded_words = self.encoder.decode(words)
+        count = self.count_points(data)
+        offsets, words = self.split_words(data)
+        decoded_offsets = self.timeEncoder.decode(offsets, count)
+        decoded_words = self.encoder.decode(words, count)
 
         json_values = [''] * len(decoded_words)
         for i, (o, w) in enumerate(zip(decoded_offsets, decoded_words)):
@@ -240,7 +654,316 @@ class TimeSeriesEncoder:
             }
         return json_values
 
-    def decode(self, data = None):
+    def join_words(self, encoded_time, encoded_data):
+        # Interleaves the time and value word of every point, packed streams are written one after the other
+        if self.packed:
+            return encoded_time + encoded_data
+        times = NumericEncoder.text_to_words(encoded_time, self.timeEncoder.encoding_depth)
+        values = NumericEncoder.text_to_words(encoded_data, self.encoder.encoding_depth)
+        return NumericEncoder.words_to_text(np.hstack([times, values]))
+
+    def _encode_columns(self, raw):
+        streams = []
+        for encoder, j in self.streams():
+            stage = 'encode_times' if j == 0 else 'encode_values'
+            with Profiler.stage(stage, points=len(raw)) as record:
+                streams.append(encoder.encode(raw[:, j] - self.encoding_start if j == 0 else raw[:, j]))
+            if record is not None:
+                record["bytes"] = len(streams[-1])
+        with Profiler.stage('interleave', points=len(raw)):
+            return self.join_streams(streams)
+
+    def streams(self):
+        # The encoder of every stream of a multi-value series and the column of the parsed series it holds
+        streams = [] if self.regular else [(self.timeEncoder, 0)]
+        for j, key in enumerate(self.ts_value):
+            column = self.value_columns[key]
+            if "encoder" in column:
+                streams.append((column["encoder"], 1 + j))
+        return streams
+
+    def join_streams(self, encoded):
+        # Interleaves the words of every point like join_words, packed streams are written one after the other
+        if self.packed:
+            return ''.join(encoded)
+        if len(encoded) == 0:
+            return ''
+        words = [NumericEncoder.text_to_words(text, encoder.encoding_depth) for text, (encoder, _) in zip(encoded, self.streams())]
+        return NumericEncoder.words_to_text(np.hstack(words))
+
+    def split_streams(self, data):
+        streams = self.streams()
+        if self.packed:
+            parts = []
+            position = 0
+            for encoder, _ in streams:
+                length = self._stream_length(encoder, self.count)
+                parts.append(data[position:position + length])
+                position += length
+            return parts
+        if len(streams) == 0:
+            return []
+        bounds = np.cumsum([0] + [encoder.encoding_depth for encoder, _ in streams]).tolist()
+        words = NumericEncoder.text_to_words(data, bounds[-1])
+        return [NumericEncoder.words_to_text(words[:, bounds[i]:bounds[i + 1]]) for i in range(len(streams))]
+
+    def split_words(self, data):
+        if self.packed:
+            time_length = self._stream_length(self.timeEncoder, self.count_points(data))
+            return data[:time_length], data[time_length:]
+        time_depth = self.timeEncoder.encoding_depth
+        words = NumericEncoder.text_to_words(data, time_depth + self.encoder.encoding_depth)
+        return NumericEncoder.words_to_text(words[:, :time_depth]), NumericEncoder.words_to_text(words[:, time_depth:])
+
+    def count_points(self, data = None):
+        if getattr(self, 'blocks', None) is not None:
+            return sum(block.count_points(block_data) for block, block_data in self.split_blocks(data))
+        if self.static is not None:
+            return self.static['count']
+        if self.packed or isinstance(self.ts_value, list):
+            return self.count
+        if self.regular:
+            return len(data) // self.encoder.encoding_depth
+        return len(data) // (self.timeEncoder.encoding_depth + self.encoder.encoding_depth)
+
+    def extend(self, data, timeseries):
+        # Appends points to encoded data, a stream is only re-encoded when the new points do not fit its encoder
+        if getattr(self, 'blocks', None) is not None:
+            return self._extend_blocks(data, timeseries)
+        if isinstance(self.ts_value, list):
+            return self._extend_columns(data, timeseries)
+        raw = self._parse_appended(timeseries)
+        data = data or ''
+        if raw.shape[0] == 0:
+            return data
+        count = self.count_points(data)
+        times = raw[:, 0]
+        values = raw[:, 1]
+
+        if self.regular:
+            encoded_time = None
+            encoded_data = data
+        elif self.static is not None:
+            encoded_time = data
+            encoded_data = None
+        else:
+            encoded_time, encoded_data = self.split_words(data)
+
+        # Time stream
+        if self.regular and np.array_equal(times, self.encoding_start + self.interval * np.arange(count, count + len(times))):
+            pass
+        elif not self.regular and self._fits_time_encoder(times - self.encoding_start):
+            encoded_time = self._append_stream(self.timeEncoder, encoded_time, count, times - self.encoding_start)
+        else:
+            if self.regular:
+                existing = self.encoding_start + self.interval * np.arange(count)
+                self.regular = False
+                del self.interval
+            else:
+                existing = np.asarray(self.timeEncoder.decode(encoded_time, count)) + self.encoding_start
+            all_times = np.concatenate([existing, times])
+            self.encoding_start = np.min(all_times)
+            offsets = all_times - self.encoding_start
+            self.timeEncoder = self._numeric_encoder(np.max(offsets), signed=False, numeric_type='int')
+            encoded_time = self.timeEncoder.encode(offsets)
+
+        # Value stream
+        if self.static is not None:
+            if np.all(values == self.static['value']):
+                self.static['count'] += len(values)
+            else:
+                all_values = np.concatenate([np.full(count, self.static['value'], dtype=np.float64), values])
+                self.static = None
+                self.encoder = None
+                self._fit_value_encoder(all_values)
+                encoded_data = self.encoder.encode(all_values)
+        elif self._fits_value_encoder(values):
+            encoded_data = self._append_stream(self.encoder, encoded_data, count, values)
+        else:
+            all_values = np.concatenate([np.asarray(self.encoder.decode(encoded_data, count), dtype=np.float64), values])
+            self._fit_value_encoder(all_values)
+            encoded_data = self.encoder.encode(all_values)
+
+        if self.packed and self.static is None:
+            self.count = count + len(values)
+        if self.regular:
+            return encoded_data or ''
+        if self.static is not None:
+            return encoded_time
+        return self.join_words(encoded_time, encoded_data)
+
+    def _extend_blocks(self, data, timeseries):
+        # Fills the last block, the remaining points form new blocks
+        parts = self.split_blocks(data)
+        last, last_data = parts[-1]
+        room = max(self.block_size - last.count_points(last_data), 0)
+        data = data[:len(data) - len(last_data)] + last.extend(last_data, timeseries[:room])
+        last.length = len(data) - sum(block.length for block in self.blocks[:-1])
+
+        # New blocks keep the delta option, the quantization of a lossy series is not part of its header
+        delta = last.uses_delta()
+        for start in range(room, len(timeseries), self.block_size):
+            block = self._new_block(timeseries[start:start + self.block_size], delta=delta)
+            block_data = block.encode(block.timeseries)
+            block.length = len(block_data)
+            self.blocks.append(block)
+            data += block_data
+        self.encoding_start = min(block.encoding_start for block in self.blocks)
+        return data
+
+    def _extend_columns(self, data, timeseries):
+        # The columns of a multi-value series are analyzed again with the new points
+        raw = self._parse_appended(timeseries)
+        data = data or ''
+        if raw.shape[0] == 0:
+            return data
+        times, columns = self._decode_columns(data)
+        self.np_timeseries = np.vstack([np.column_stack([times] + columns), raw])
+        if self.sort_values:
+            self.np_timeseries = self.np_timeseries[self.np_timeseries[:, 0].argsort(kind='stable')]
+        self.__dict__.pop('interval', None)
+        self.__dict__.pop('timeEncoder', None)
+        self._analyze(delta=self.uses_delta())
+        encoded = self.encode_arrays(self.np_timeseries)
+        del self.np_timeseries
+        return encoded
+
+    def uses_delta(self):
+        if getattr(self, 'value_columns', None) is not None:
+            encoders = [column.get("encoder") for column in self.value_columns.values()]
+        else:
+            encoders = [getattr(self, 'encoder', None)]
+        return any(encoder is not None and encoder.delta for encoder in encoders)
+
+    def _append_stream(self, encoder, encoded, count, new_values):
+        # A packed stream ends in padding, so it is written again with the new values
+        if encoder.bit_width is not None:
+            return encoder.encode(np.concatenate([encoder.decode_array(encoded, count), new_values]))
+        return encoded + encoder.encode(new_values)
+
+    @staticmethod
+    def _stream_length(encoder, count):
+        if encoder.bit_width is not None:
+            return encoder.packed_length(count)
+        return count * encoder.encoding_depth
+
+    def _fits_time_encoder(self, offsets):
+        return np.min(offsets) >= 0 and np.max(offsets) < self.timeEncoder.get_max_state()
+
+    def _fits_value_encoder(self, values, continues=True):
+        encoder = self.encoder
+        # Appended delta words depend on every earlier value, so they are always re-encoded
+        if encoder.delta and continues:
+            return False
+        if encoder.step is None and EncoderHelpers.max_decimal_scale(values) > encoder.float_precision:
+            return False
+        states = np.rint(values * (10 ** encoder.float_precision) / (encoder.step or 1))
+        if encoder.delta:
+            states = np.diff(states, prepend=0)
+        if encoder.reference is not None:
+            states = states - encoder.reference
+        max_state = encoder.get_max_state()
+        if encoder.signed:
+            return np.min(states) >= -max_state and np.max(states) < max_state
+        return np.min(states) >= 0 and np.max(states) < max_state
+
+    def _fit_value_encoder(self, values):
+        # Keeps the quantization step of a lossy encoder, otherwise the precision is detected from the values
+        encoder = getattr(self, 'encoder', None)
+        delta = encoder is not None and encoder.delta
+        if encoder is not None and encoder.step is not None:
+            precision, numeric_type, step = encoder.float_precision, encoder.numeric_type, encoder.step
+        else:
+            _, precision, numeric_type, _ = EncoderHelpers.calculate_value_range(values)
+            step = None
+        states = np.rint(values * (10 ** precision) / (step or 1))
+        if delta:
+            states = np.diff(states, prepend=0)
+        max_value, signed = EncoderHelpers.state_range(states)
+        reference = None
+        if self.frame_of_reference and self._state_size(np.max(states) - np.min(states)) < self._state_size(max_value):
+            reference = int(np.min(states))
+            max_value, signed = np.max(states) - reference, False
+        self.encoder = self._numeric_encoder(max_value, signed=signed, numeric_type=numeric_type, float_precision=precision, step=step, delta=delta, reference=reference)
+
+    def apply_plan(self, timeseries):
+        # Checks a planned encoder against a new series and sets the fields that change per document
+        if getattr(self, 'blocks', None) is not None or isinstance(self.ts_value, list):
+            return False
+        self.timeseries = timeseries
+        self.np_timeseries = self.get_np_timeseries(timeseries)
+        if len(self.np_timeseries) < 2 or len(self.lookups) > 0:
+            return False
+        times = self.np_timeseries[:, 0]
+        values = self.np_timeseries[:, 1]
+
+        if self.regular:
+            if not np.all(np.diff(times) == self.interval):
+                return False
+            self.encoding_start = times[0]
+        else:
+            self.encoding_start = np.min(times)
+            if not self._fits_time_encoder(times - self.encoding_start):
+                return False
+
+        if self.static is not None:
+            if np.std(values) != 0:
+                return False
+            self.static = {'value': values[0].item(), 'count': len(values)}
+        elif not self._fits_value_encoder(values, continues=False):
+            return False
+        elif self.packed:
+            self.count = len(values)
+        return True
+
+    def decode_arrays(self, data = None):
+        # Epoch seconds and values as numpy arrays, without building a dict per point
+        data = data or ''
+        if getattr(self, 'blocks', None) is not None:
+            arrays = [block.decode_arrays(block_data) for block, block_data in self.split_blocks(data)]
+            times = np.concatenate([times for times, _ in arrays])
+            if isinstance(self.ts_value, list):
+                return times, [np.concatenate(columns) for columns in zip(*[values for _, values in arrays])]
+            return times, np.concatenate([values for _, values in arrays])
+        if isinstance(self.ts_value, list):
+            times, columns = self._decode_columns(data)
+            return times, [self._lookup_values(key, column) if key in self.lookups else column for key, column in zip(self.ts_value, columns)]
+        count = self.count_points(data)
+        if self.regular:
+            times = self.encoding_start + np.arange(count) * self.interval
+            if self.static is None:
+                values = self.encoder.decode_array(data, count)
+        elif self.static is None:
+            offsets, words = self.split_words(data)
+            times = self.timeEncoder.decode_array(offsets, count) + self.encoding_start
+            values = self.encoder.decode_array(words, count)
+        else:
+            times = self.timeEncoder.decode_array(data, count) + self.encoding_start
+        if self.static is not None:
+            values = np.full(count, self.static['value'])
+        if self.ts_value in self.lookups:
+            values = self._lookup_values(self.ts_value, values)
+        return times, values
+
+    def _decode_columns(self, data):
+        # Epoch seconds and a list with the values of every value key
+        columns = {key: np.full(self.count, column["static"]) for key, column in self.value_columns.items() if "static" in column}
+        times = None
+        for (encoder, j), stream in zip(self.streams(), self.split_streams(data)):
+            if j == 0:
+                times = encoder.decode_array(stream, self.count) + self.encoding_start
+            else:
+                columns[self.ts_value[j - 1]] = encoder.decode_array(stream, self.count)
+        if times is None:
+            times = self.encoding_start + np.arange(self.count) * self.interval
+        return times, [columns[key] for key in self.ts_value]
+
+    def decode(self, data = None, as_numpy = False):
+        if as_numpy:
+            return DecodedSeries(*self.decode_arrays(data), ts_key=self.ts_key, ts_value=self.ts_value)
+        # Blocks may choose int and float encoders for the same series, the concatenated arrays give every point the same type
+        if isinstance(self.ts_value, list) or len(self.lookups) > 0 or getattr(self, 'blocks', None) is not None:
+            return DecodedSeries(*self.decode_arrays(data), ts_key=self.ts_key, ts_value=self.ts_value).to_list()
         if self.regular == True:
             if self.static is None:
                 json_values = self.__decode_regular(data, self.encoding_start)
@@ -260,33 +983,61 @@ class TimeSeriesEncoder:
             "static" : None,
             "regular" : True,
             "encoding_size": 64,
-            "sort_values": True
+            "sort_values": True,
+            "packed": False,
+            "lookups": {}
         }
 
+        # The option shows in the value encoder, a series that got no reference is not marked
+        del vsl["frame_of_reference"]
         if "timeseries" in vsl:
             del vsl["timeseries"]
         if "np_timeseries" in vsl:
             del vsl["np_timeseries"]
+        if "blocks" in vsl:
+            # The directory leaves out the settings every block shares with the series
+            del vsl["regular"]
+            vsl.pop("block_data", None)
+            shared = {"ts_key": tse.ts_key, "ts_value": tse.ts_value, "sort_values": tse.sort_values, "encoding_size": tse.encoding_size, "packed": tse.packed, "lookups": tse.lookups}
+            entries = []
+            for block in vsl["blocks"]:
+                entry = TimeSeriesEncoder.serialize(block)
+                for key in shared:
+                    if getattr(block, key) == shared[key]:
+                        entry.pop(key, None)
+                    else:
+                        entry[key] = getattr(block, key)
+                entries.append(entry)
+            vsl["blocks"] = entries
         if "encoder" in vsl:
             vsl["encoder"] = NumericEncoder.serialize(vsl["encoder"])
         if "timeEncoder" in vsl:
             vsl["timeEncoder"] = NumericEncoder.serialize(vsl["timeEncoder"])
+        if "value_columns" in vsl:
+            vsl["value_columns"] = {key: {"encoder": NumericEncoder.serialize(column["encoder"])} if "encoder" in column else dict(column) for key, column in vsl["value_columns"].items()}
 
         for key in defaults:
-            if vsl[key] == defaults[key]:
+            if key in vsl and vsl[key] == defaults[key]:
                 del vsl[key]
+
+        for key in vsl:
+            if isinstance(vsl[key], np.generic):
+                vsl[key] = vsl[key].item()
         return vsl
 
     @staticmethod
     def deserialize(msg):
+        msg = dict(msg)
         defaults = {
             "static" : None,
             "encoding_size": 64,
-            "sort_values": True
+            "sort_values": True,
+            "packed": False
         }
         
         for key in defaults:
-            msg[key] = msg.get(key) or defaults[key]
+            if msg.get(key) is None:
+                msg[key] = defaults[key]
 
         tse = TimeSeriesEncoder()
         for key in msg:
@@ -296,55 +1047,616 @@ class TimeSeriesEncoder:
 
         if "encoder" in msg:
             tse.encoder = NumericEncoder.deserialize(msg["encoder"])
+            tse.frame_of_reference = tse.encoder.reference is not None
         if "timeEncoder" in msg:
             tse.timeEncoder = NumericEncoder.deserialize(msg["timeEncoder"])
+        if "value_columns" in msg:
+            tse.value_columns = {key: {"encoder": NumericEncoder.deserialize(column["encoder"])} if "encoder" in column else dict(column) for key, column in msg["value_columns"].items()}
+            tse.frame_of_reference = any(column["encoder"].reference is not None for column in tse.value_columns.values() if "encoder" in column)
+        if "blocks" in msg:
+            shared = {"ts_key": tse.ts_key, "ts_value": tse.ts_value, "sort_values": tse.sort_values, "encoding_size": tse.encoding_size, "packed": tse.packed, "lookups": tse.lookups}
+            tse.blocks = [TimeSeriesEncoder.deserialize(dict(shared, **entry)) for entry in msg["blocks"]]
         return tse
 
+class EncodingPlan:
+    plans = OrderedDict()
+
+    def __init__(self, paths, entries):
+        # Entries hold the serialized series encoders without the fields that change per document
+        self.paths = {path: index for index, path in enumerate(paths)}
+        self.entries = entries
+        digest = hashlib.sha1(json.dumps([paths, entries], sort_keys=True, cls=NumpyEncoder).encode()).hexdigest()
+        self.plan_id = digest[:12]
+
+    @staticmethod
+    def register(plan):
+        with PLAN_LOCK:
+            EncodingPlan.plans[plan.plan_id] = plan
+            EncodingPlan.plans.move_to_end(plan.plan_id)
+            while len(EncodingPlan.plans) > MAX_REGISTERED_PLANS:
+                EncodingPlan.plans.popitem(last=False)
+        return plan
+
+    @staticmethod
+    def get(plan_id):
+        with PLAN_LOCK:
+            plan = EncodingPlan.plans.get(plan_id)
+            if plan is not None:
+                EncodingPlan.plans.move_to_end(plan_id)
+        if plan is None:
+            raise ValueError(f'Data was encoded with plan {plan_id}, which has not been registered.')
+        return plan
+
+    @staticmethod
+    def serialize(plan):
+        paths = sorted(plan.paths, key=plan.paths.get)
+        return {"plan_id": plan.plan_id, "paths": paths, "entries": plan.entries}
+
+    @staticmethod
+    def deserialize(msg):
+        plan = EncodingPlan(msg["paths"], msg["entries"])
+        if plan.plan_id != msg.get("plan_id", plan.plan_id):
+            raise ValueError(f'Plan {msg["plan_id"]} does not match its contents.')
+        return EncodingPlan.register(plan)
+
+    def apply(self, path, timeseries):
+        # Returns the compact series header and its encoder, or None when the series does not fit the plan
+        index = self.paths.get(path)
+        if index is None:
+            return None, None
+        encoder = TimeSeriesEncoder.deserialize(copy.deepcopy(self.entries[index]))
+        if not encoder.apply_plan(timeseries):
+            return None, None
+        encoded_json = {"plan": f'{self.plan_id}/{index}', "encoding_start": encoder.encoding_start.item()}
+        if encoder.static is not None:
+            encoded_json["static"] = encoder.static
+        elif encoder.packed:
+            encoded_json["count"] = encoder.count
+        return encoded_json, encoder
+
+    @staticmethod
+    def resolve(json_data):
+        # Expands a plan reference back into the full series header
+        plan_id, _, index = json_data["plan"].partition('/')
+        msg = copy.deepcopy(EncodingPlan.get(plan_id).entries[int(index)])
+        msg.update((key, value) for key, value in json_data.items() if key != 'plan')
+        return msg
+
 class JSONEncoder(TimeSeriesEncoder):
     @staticmethod
-    def encode_json(json_data, ts_key, ts_value, sort_values = False, encoding_size = 64, inplace=False, gzip=False):
-        if inplace == False:
-            json_data = copy.copy(json_data)
-        encoded = JSONEncoder._encode_json(json_data, ts_key, ts_value, sort_values, encoding_size)
-        if gzip:
-            jstr = json.dumps(encoded, cls=NumpyEncoder)
-            bytes = EncoderHelpers.gzip_str(jstr)
+    def encode_json(json_data, ts_key, ts_value, sort_values = False, encoding_size = 64, inplace=False, gzip=False, compresslevel=9, compression=None, error_bound=None, error_mode='absolute', delta=False, packed=False, frame_of_reference=False, block_size=None, plan=None, paths=None, index=False):
+        # Unless inplace is set the input is never modified, the output shares every subtree without a series with it
+        compressed = gzip or compression is not None
+        encoded = JSONEncoder._encode_document(json_data, ts_key, ts_value, sort_values, encoding_size, compressed, plan, paths, index, inplace, error_bound=error_bound, error_mode=error_mode, delta=delta, packed=packed, frame_of_reference=frame_of_reference, block_size=block_size)
+        if compression is not None or gzip:
+            with Profiler.stage('serialize') as record:
+                jstr = EncoderHelpers.json_dumps(encoded)
+            if record is not None:
+                record["bytes"] = len(jstr)
+            with Profiler.stage('compress') as record:
+                if compression is not None:
+                    # Framed output records the codec, so decode_json picks it automatically
+                    bytes = CodecRegistry.compress(jstr, compression)
+                else:
+                    bytes = EncoderHelpers.gzip_str(jstr, compresslevel)
+            if record is not None:
+                record["bytes"] = len(bytes)
             return bytes
         return encoded
-            
+
     @staticmethod
-    def decode_json(json_data, inplace=False, gzip=False):
+    def encode_json_to_file(json_data, fileobj, ts_key, ts_value, sort_values = False, encoding_size = 64, inplace=False, gzip=False, compresslevel=9, error_bound=None, error_mode='absolute', delta=False, packed=False, frame_of_reference=False, block_size=None, plan=None, paths=None, index=False):
+        # Streams the encoded json into a binary file object, compressing on the fly when gzip is set
+        encoded = JSONEncoder._encode_document(json_data, ts_key, ts_value, sort_values, encoding_size, gzip, plan, paths, index, inplace, error_bound=error_bound, error_mode=error_mode, delta=delta, packed=packed, frame_of_reference=frame_of_reference, block_size=block_size)
+        with Profiler.stage('serialize'):
+            if gzip:
+                EncoderHelpers.gzip_dump(encoded, fileobj, compresslevel, cls=NumpyEncoder)
+            else:
+                EncoderHelpers.json_dump(encoded, fileobj, cls=NumpyEncoder)
+
+    @staticmethod
+    def append(encoded_series, new_points, inplace=False):
+        # Extends a single encoded series, as found in the output of encode_json, with raw points
         if inplace == False:
-            json_data = copy.copy(json_data)
-        if gzip:
-            json_data = EncoderHelpers.gunzip_bytes_obj(json_data)
-            json_data = json.loads(json_data)
-        decoded = JSONEncoder._decode_json(json_data)
+            encoded_series = copy.deepcopy(encoded_series)
+        data = encoded_series.get('data', '')
+        header = encoded_series
+        if 'plan' in header:
+            # The extended series may no longer fit the plan, so it keeps its full header
+            header = EncodingPlan.resolve(header)
+        encoder = TimeSeriesEncoder.deserialize(copy.deepcopy(header))
+        data = encoder.extend(data, new_points)
+
+        encoded_json = TimeSeriesEncoder.serialize(encoder)
+        encoded_json.pop('data', None)
+        if len(data) > 0:
+            encoded_json["data"] = data
+        encoded_series.clear()
+        encoded_series.update(encoded_json)
+        return encoded_series
+
+    @staticmethod
+    def encode_batch(times, values, offsets, ts_key='UTC', ts_value='Value', encoding_size=64):
+        # Encodes many series given as ragged arrays, series i holds the points offsets[i]:offsets[i + 1] of times
+        # (epoch seconds) and values. Returns the encoded series in the format of encode_json
+        if encoding_size == 'auto':
+            raise ValueError('Batches need a fixed encoding size.')
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        counts = np.diff(offsets)
+        if times.shape != values.shape or offsets[0] != 0 or offsets[-1] != values.shape[0]:
+            raise ValueError('Times and values must have the same length, and offsets must run from 0 to that length.')
+        if np.any(counts < 1):
+            raise ValueError('Every series in a batch needs at least one point.')
+        starts = offsets[:-1]
+        series = np.repeat(np.arange(counts.shape[0]), counts)
+
+        with Profiler.stage('analyze', points=values.shape[0]):
+            # A series is regular when every gap equals its first one, a single point is regular with interval 0
+            gaps = np.diff(times)
+            intervals = np.zeros(counts.shape[0])
+            intervals[counts > 1] = gaps[starts[counts > 1]]
+            inner = series[1:] == series[:-1]
+            irregular_gaps = inner & (gaps != intervals[series[:-1]])
+            regular = np.bincount(series[:-1][irregular_gaps], minlength=counts.shape[0]) == 0
+            encoding_start = np.where(regular, times[starts], np.minimum.reduceat(times, starts))
+            time_offsets = times - encoding_start[series]
+            time_depths = np.where(regular, 0, EncoderHelpers.calculate_bit_depths(np.maximum.reduceat(time_offsets, starts), encoding_size))
+
+            max_values = np.maximum.reduceat(values, starts)
+            min_values = np.minimum.reduceat(values, starts)
+            static = max_values == min_values
+            precisions = EncoderHelpers.max_decimal_scales(values, starts)
+            signed = min_values < 0
+            max_states = np.maximum(np.abs(max_values), np.abs(min_values)) * (10.0 ** precisions) * np.where(signed, 2, 1)
+            value_depths = np.where(static, 0, np.maximum(EncoderHelpers.calculate_bit_depths(max_states, encoding_size), 1))
+
+        # Series sharing their encoders are encoded together
+        groups = {}
+        for i, key in enumerate(zip(regular.tolist(), static.tolist(), time_depths.tolist(), value_depths.tolist(), precisions.tolist(), signed.tolist())):
+            groups.setdefault(key, []).append(i)
+
+        encoded = [None] * counts.shape[0]
+        for (is_regular, is_static, time_depth, value_depth, precision, is_signed), members in groups.items():
+            selected = np.zeros(counts.shape[0], dtype=bool)
+            selected[members] = True
+            points = np.flatnonzero(selected[series])
+            # Key order follows TimeSeriesEncoder.serialize, so the output equals encode_json
+            header = {"ts_key": ts_key, "ts_value": ts_value, "sort_values": False}
+            if encoding_size != 64:
+                header = dict({"encoding_size": encoding_size}, **header)
+
+            words = []
+            time_json = None
+            if not is_regular:
+                time_encoder = NumericEncoder.cached(encoding_depth=time_depth, signed=False, numeric_type='int', encoding_size=encoding_size)
+                time_json = NumericEncoder.serialize(time_encoder)
+                with Profiler.stage('encode_times', points=points.shape[0]):
+                    words.append(time_encoder.encode_bytes(time_offsets[points]))
+            value_json = None
+            if not is_static:
+                numeric_type = 'float' if precision != 0 else 'int'
+                value_encoder = NumericEncoder.cached(encoding_depth=value_depth, signed=is_signed, numeric_type=numeric_type, float_precision=precision, encoding_size=encoding_size)
+                value_json = NumericEncoder.serialize(value_encoder)
+                with Profiler.stage('encode_values', points=points.shape[0]):
+                    words.append(value_encoder.encode_bytes(values[points]))
+
+            data = ''
+            width = time_depth + value_depth
+            if len(words) > 0:
+                with Profiler.stage('interleave', points=points.shape[0]):
+                    data = NumericEncoder.words_to_text(np.hstack(words))
+            position = 0
+            for i in members:
+                count = int(counts[i])
+                series_json = dict(header)
+                if is_static:
+                    series_json["static"] = {"value": values[offsets[i]].item(), "count": count}
+                if not is_regular:
+                    series_json["regular"] = False
+                series_json["encoding_start"] = encoding_start[i].item()
+                if is_regular:
+                    series_json["interval"] = intervals[i].item()
+                else:
+                    series_json["timeEncoder"] = dict(time_json)
+                if value_json is not None:
+                    series_json["encoder"] = dict(value_json)
+                if width > 0:
+                    series_json["data"] = data[position:position + count * width]
+                    position += count * width
+                encoded[i] = series_json
+        return encoded
+
+    @staticmethod
+    def decode_batch(encoded_series):
+        # Inverse of encode_batch, returns the times, values and offsets of the series as ragged arrays
+        times = []
+        values = []
+        offsets = [0]
+        for series_json in encoded_series:
+            if 'plan' in series_json:
+                series_json = EncodingPlan.resolve(series_json)
+            encoder = TimeSeriesEncoder.deserialize(series_json)
+            series_times, series_values = encoder.decode_arrays(series_json.get('data'))
+            times.append(series_times)
+            values.append(np.asarray(series_values, dtype=np.float64))
+            offsets.append(offsets[-1] + series_times.shape[0])
+        if len(times) == 0:
+            return np.zeros(0), np.zeros(0), np.asarray(offsets)
+        return np.concatenate(times), np.concatenate(values), np.asarray(offsets)
+
+    @staticmethod
+    def decode_blocks(encoded_series, blocks=None, as_numpy=False, executor=None):
+        # Decodes the chosen blocks of a series encoded with block_size, each on its own. With an executor, such as a
+        # concurrent.futures pool, the blocks are decoded through executor.map
+        if 'plan' in encoded_series:
+            encoded_series = EncodingPlan.resolve(encoded_series)
+        encoder = TimeSeriesEncoder.deserialize(encoded_series)
+        parts = encoder.split_blocks(encoded_series.get('data'))
+        if blocks is not None:
+            parts = [parts[i] for i in blocks]
+        decode = lambda part: part[0].decode(part[1], as_numpy)
+        if executor is None:
+            return list(map(decode, parts))
+        return list(executor.map(decode, parts))
+
+    @staticmethod
+    def create_plan(json_data, ts_key, ts_value, sort_values = False, encoding_size = 64, error_bound=None, error_mode='absolute', delta=False, packed=False, frame_of_reference=False, block_size=None):
+        # Learns the encoding of every series in a sample document, for reuse on documents of the same shape
+        encoded = JSONEncoder._encode_json(json_data, ts_key, ts_value, sort_values, encoding_size, path='$', inplace=False, error_bound=error_bound, error_mode=error_mode, delta=delta, packed=packed, frame_of_reference=frame_of_reference, block_size=block_size)
+        paths = []
+        entries = []
+        for path, series in JSONEncoder._find_encoded_series(encoded, '$'):
+            if 'blocks' in series or 'value_columns' in series or 'lookups' in series:
+                # Blocked, multi-value and lookup series are always encoded in full
+                continue
+            entry = {key: value for key, value in series.items() if key not in ['encoding_start', 'data', 'count']}
+            if 'static' in entry:
+                entry['static'] = {}
+            paths.append(path)
+            entries.append(entry)
+        plan = EncodingPlan(paths, entries)
+        EncodingPlan.register(plan)
+        return plan
+
+    @staticmethod
+    def _find_encoded_series(json_data, path):
+        if type(json_data) == dict:
+            if 'encoding_start' in json_data:
+                yield path, json_data
+            else:
+                for key in json_data:
+                    yield from JSONEncoder._find_encoded_series(json_data[key], JSONEncoder._child_path(path, key))
+        elif type(json_data) == list:
+            for i, item in enumerate(json_data):
+                yield from JSONEncoder._find_encoded_series(item, JSONEncoder._child_path(path, i))
+
+    @staticmethod
+    def decode_json(json_data, inplace=False, gzip=False, compression=None, paths=None, predicate=None, drop=False, lazy=False, as_numpy=False):
+        if CodecRegistry.is_framed(json_data) or gzip:
+            # Freshly parsed, so there is nothing to protect from modification
+            inplace = True
+        json_data = JSONEncoder._load_encoded(json_data, gzip, compression)
+        decoded = JSONEncoder._decode_document(json_data, paths, predicate, drop, lazy, as_numpy, inplace)
         return decoded
 
     @staticmethod
-    def _encode_json(json_data, ts_key, ts_value, sort_values = False, encoding_size = 64):
+    def decode_json_to_bytes(json_data, gzip=False, compression=None, fileobj=None):
+        # Writes the decoded document as json text without building the decoded objects, the result equals
+        # json.dumps(decode_json(json_data)).encode(). Returns the bytes, or writes them to a binary file object
+        json_data = JSONEncoder._load_encoded(json_data, gzip, compression)
+        if type(json_data) == dict and SERIES_INDEX_KEY in json_data:
+            json_data = dict(json_data)
+            del json_data[SERIES_INDEX_KEY]
+        chunks = JSONEncoder._iter_json_text(json_data, JSONEncoder._root_path())
+        if fileobj is None:
+            return ''.join(chunks).encode()
+        for chunk in chunks:
+            fileobj.write(chunk.encode())
+
+    @staticmethod
+    def _load_encoded(json_data, gzip=False, compression=None):
+        if CodecRegistry.is_framed(json_data) or gzip:
+            with Profiler.stage('decompress', bytes=len(json_data)):
+                if CodecRegistry.is_framed(json_data):
+                    json_data = CodecRegistry.decompress(json_data, compression)
+                else:
+                    json_data = EncoderHelpers.gunzip_bytes_obj(json_data)
+            with Profiler.stage('parse_json', bytes=len(json_data)):
+                json_data = EncoderHelpers.json_loads(json_data)
+        return json_data
+
+    @staticmethod
+    def _iter_json_text(json_data, path = None):
         if type(json_data) == dict:
+            if 'encoding_start' in json_data:
+                yield JSONEncoder._series_json_text(json_data, path)
+                return
+            yield '{'
+            for i, key in enumerate(json_data):
+                yield f'{", " if i > 0 else ""}{json.dumps(key)}: '
+                yield from JSONEncoder._iter_json_text(json_data[key], JSONEncoder._child_path(path, key))
+            yield '}'
+        elif type(json_data) == list:
+            yield '['
+            for i, item in enumerate(json_data):
+                if i > 0:
+                    yield ', '
+                yield from JSONEncoder._iter_json_text(item, JSONEncoder._child_path(path, i))
+            yield ']'
+        else:
+            yield json.dumps(json_data)
+
+    @staticmethod
+    def _series_json_text(json_data, path = None):
+        with Profiler.stage('decode_series', series=path) as record:
+            if 'plan' in json_data:
+                json_data = EncodingPlan.resolve(json_data)
+            encoder = TimeSeriesEncoder.deserialize(dict(json_data))
+            series = encoder.decode(json_data.get('data'), as_numpy=True)
+        if record is not None:
+            record["points"] = len(series)
+
+        with Profiler.stage('format_json', series=path, points=len(series)):
+            if len(series) == 0:
+                return '[]'
+            prefix = '{' + json.dumps(encoder.ts_key) + ': "'
+            if isinstance(encoder.ts_value, list):
+                # One formatted list per value key, the first key follows the closing quote of the timestamp
+                columns = [JSONEncoder._format_values(column) for column in series.values]
+                middles = ['", ' + json.dumps(encoder.ts_value[0]) + ': '] + [', ' + json.dumps(key) + ': ' for key in encoder.ts_value[1:]]
+                return '[' + ', '.join([prefix + t + ''.join([m + v for m, v in zip(middles, values)]) + '}' for t, *values in zip(series.timestamps(), *columns)]) + ']'
+            values = JSONEncoder._format_values(series.values)
+            middle = '", ' + json.dumps(encoder.ts_value) + ': '
+            return '[' + ', '.join([f'{prefix}{t}{middle}{v}}}' for t, v in zip(series.timestamps(), values)]) + ']'
+
+    @staticmethod
+    def _format_values(values):
+        # Numbers are formatted by one json.dumps call as they never contain the separator, lookup values may
+        if values.dtype == object:
+            return [json.dumps(value) for value in values.tolist()]
+        return json.dumps(values.tolist())[1:-1].split(', ')
+
+    @staticmethod
+    def decode_json_from_file(fileobj, gzip=False, paths=None, predicate=None, drop=False, lazy=False, as_numpy=False):
+        with Profiler.stage('parse_json'):
+            if gzip:
+                json_data = EncoderHelpers.gunzip_load(fileobj)
+            else:
+                json_data = EncoderHelpers.json_load(fileobj)
+        return JSONEncoder._decode_document(json_data, paths, predicate, drop, lazy, as_numpy, inplace=True)
+
+    @staticmethod
+    def _encode_document(json_data, ts_key, ts_value, sort_values, encoding_size, compressed, plan, paths, index, inplace=True, **encoder_options):
+        series_index = [] if index else None
+        if plan is not None:
+            # Encoding with a plan keeps it registered, so the output stays decodable in this process
+            EncodingPlan.register(plan)
+        if paths is None:
+            encoded = JSONEncoder._encode_json(json_data, ts_key, ts_value, sort_values, encoding_size, compressed, JSONEncoder._root_path(plan, series_index), plan, series_index, inplace, **encoder_options)
+        else:
+            # Only the selected parts of the document are walked
+            encode = lambda node, path: JSONEncoder._encode_json(node, ts_key, ts_value, sort_values, encoding_size, compressed, path, plan, series_index, inplace, **encoder_options)
+            encoded = JSONEncoder._apply_paths(json_data, paths, encode, inplace)
+        if series_index is not None:
+            if type(encoded) != dict:
+                raise ValueError('A series index can only be recorded in a document whose root is an object.')
+            if encoded is json_data and not inplace:
+                encoded = dict(encoded)
+            encoded[SERIES_INDEX_KEY] = series_index
+        return encoded
+
+    @staticmethod
+    def _decode_document(json_data, paths=None, predicate=None, drop=False, lazy=False, as_numpy=False, inplace=True):
+        series_index = None
+        if type(json_data) == dict and SERIES_INDEX_KEY in json_data:
+            json_data = dict(json_data)
+            series_index = json_data.pop(SERIES_INDEX_KEY)
+        if series_index is None and paths is None and predicate is None and not drop and not lazy:
+            return JSONEncoder._decode_json(json_data, JSONEncoder._root_path(), as_numpy, inplace)
+        copied = None if inplace else set()
+
+        # Series outside the selected paths are only located when they have to be dropped
+        chains = JSONEncoder._series_chains(json_data, series_index, None if drop else paths)
+        scopes = None
+        if paths is not None:
+            scopes = [chain for selector in paths for _, chain in JSONEncoder._select(json_data, JSONEncoder._parse_path(selector))]
+
+        # Reverse order keeps list indices valid while series are dropped
+        for chain in reversed(chains):
+            if copied is not None and len(chain) > 0:
+                json_data = JSONEncoder._copy_chain(json_data, chain, copied)
+            parent = None
+            series = json_data
+            for key in chain:
+                parent, series = series, series[key]
+            path = JSONEncoder._chain_path(chain)
+            selected = scopes is None or any(chain[:len(scope)] == scope for scope in scopes)
+            if selected and predicate is not None:
+                selected = predicate(path, series)
+
+            if selected:
+                decoded = LazySeries(series, path, as_numpy) if lazy else JSONEncoder._decode_json(series, path, as_numpy)
+            elif drop:
+                if parent is None:
+                    return None
+                del parent[chain[-1]]
+                continue
+            else:
+                continue
+            if parent is None:
+                return decoded
+            parent[chain[-1]] = decoded
+        return json_data
+
+    @staticmethod
+    def _series_chains(json_data, series_index=None, paths=None):
+        # Key chains of the encoded series, taken from the index when there is one
+        if series_index is not None:
+            return [JSONEncoder._parse_path(path) for path in series_index]
+        if paths is None:
+            return list(JSONEncoder._locate_series(json_data, []))
+        chains = []
+        for selector in paths:
+            for _, chain in JSONEncoder._select(json_data, JSONEncoder._parse_path(selector)):
+                node = json_data
+                for key in chain:
+                    node = node[key]
+                chains.extend(c for c in JSONEncoder._locate_series(node, chain) if c not in chains)
+        return chains
+
+    @staticmethod
+    def _locate_series(json_data, chain):
+        if type(json_data) == dict:
+            if 'encoding_start' in json_data:
+                yield chain
+            else:
+                for key in json_data:
+                    yield from JSONEncoder._locate_series(json_data[key], chain + [key])
+        elif type(json_data) == list:
+            for i, item in enumerate(json_data):
+                yield from JSONEncoder._locate_series(item, chain + [i])
+
+    @staticmethod
+    def _chain_path(chain):
+        path = '$'
+        for key in chain:
+            path = JSONEncoder._child_path(path, key)
+        return path
+
+    @staticmethod
+    def _root_path(plan=None, series_index=None):
+        # Series paths are only built while profiling, applying a plan or indexing, so they cost nothing otherwise
+        return '$' if plan is not None or series_index is not None or Profiler.active() is not None else None
+
+    @staticmethod
+    def _child_path(path, key):
+        if path is None:
+            return None
+        if isinstance(key, int):
+            return f'{path}[{key}]'
+        if PLAIN_KEY.fullmatch(key) is None:
+            return f"{path}['{key}']"
+        return f'{path}.{key}'
+
+    @staticmethod
+    def _parse_path(selector):
+        # Returns the keys and indices of a path selector, None stands for a wildcard
+        if not selector.startswith('$'):
+            raise ValueError(f'Path selectors start with $, got {selector}.')
+        tokens = []
+        position = 1
+        while position < len(selector):
+            match = PATH_TOKEN.match(selector, position)
+            if match is None:
+                raise ValueError(f'Unsupported path selector: {selector}.')
+            key, item, quoted = match.groups()
+            if quoted is not None:
+                tokens.append(quoted)
+            elif item is not None:
+                tokens.append(None if item == '*' else int(item))
+            else:
+                tokens.append(None if key == '*' else key)
+            position = match.end()
+        return tokens
+
+    @staticmethod
+    def _select(node, tokens, path='$'):
+        # Yields the path and key chain of every node matching the tokens, missing keys are skipped
+        if len(tokens) == 0:
+            yield path, []
+            return
+        token = tokens[0]
+        if type(node) == dict:
+            keys = node.keys() if token is None else [token] if token in node else []
+        elif type(node) == list:
+            keys = range(len(node)) if token is None else [token] if isinstance(token, int) and token < len(node) else []
+        else:
+            keys = []
+        for key in list(keys):
+            for child_path, chain in JSONEncoder._select(node[key], tokens[1:], JSONEncoder._child_path(path, key)):
+                yield child_path, [key] + chain
+
+    @staticmethod
+    def _apply_paths(json_data, selectors, function, inplace=True):
+        # Replaces every node matched by the selectors with function(node, path) and returns the new root
+        copied = None if inplace else set()
+        for selector in selectors:
+            for path, chain in list(JSONEncoder._select(json_data, JSONEncoder._parse_path(selector))):
+                if len(chain) == 0:
+                    json_data = function(json_data, path)
+                    continue
+                if copied is not None:
+                    json_data = JSONEncoder._copy_chain(json_data, chain, copied)
+                parent = json_data
+                for key in chain[:-1]:
+                    parent = parent[key]
+                parent[chain[-1]] = function(parent[chain[-1]], path)
+        return json_data
+
+    @staticmethod
+    def _copy_chain(json_data, chain, copied):
+        # Copies the containers leading to the last key of the chain, each container is copied at most once
+        if id(json_data) not in copied:
+            json_data = copy.copy(json_data)
+            copied.add(id(json_data))
+        parent = json_data
+        for key in chain[:-1]:
+            child = parent[key]
+            if id(child) not in copied:
+                child = copy.copy(child)
+                copied.add(id(child))
+                parent[key] = child
+            parent = child
+        return json_data
+
+    @staticmethod
+    def _is_series(items, ts_key, ts_value):
+        if len(items) == 0:
+            return False
+        if isinstance(ts_value, list):
+            # Every point holds the time and each of the value keys
+            keys = {ts_key, *ts_value}
+            return all(type(item) == dict and item.keys() == keys for item in items)
+        for item in items:
+            if type(item) != dict or len(item) != 2 or ts_key not in item or ts_value not in item:
+                return False
+        return True
+
+    @staticmethod
+    def _encode_json(json_data, ts_key, ts_value, sort_values = False, encoding_size = 64, compressed = False, path = None, plan = None, series_index = None, inplace = True, **encoder_options):
+        if type(json_data) == dict:
+            result = json_data
             for key in json_data:
-                json_data[key] = JSONEncoder._encode_json(json_data[key], ts_key, ts_value, sort_values, encoding_size)
-            return json_data
+                encoded = JSONEncoder._encode_json(json_data[key], ts_key, ts_value, sort_values, encoding_size, compressed, JSONEncoder._child_path(path, key), plan, series_index, inplace, **encoder_options)
+                if encoded is not json_data[key]:
+                    # Copy on the first change, unchanged subtrees stay shared
+                    if result is json_data and not inplace:
+                        result = dict(json_data)
+                    result[key] = encoded
+            return result
         elif type(json_data) == list:
-            is_ts = False
-            expected_keys = set([ts_key, ts_value])
-            for item in json_data:
-                if type(item) == dict:
-                    if expected_keys == set(item.keys()):
-                        is_ts = True
-                else:
-                    is_ts = False
-                
-            if is_ts == False:
+            if JSONEncoder._is_series(json_data, ts_key, ts_value) == False:
+                result = json_data
                 for i, j in enumerate(json_data):
-                    json_data[i] = JSONEncoder._encode_json(j, ts_key, ts_value, sort_values, encoding_size)
+                    encoded = JSONEncoder._encode_json(j, ts_key, ts_value, sort_values, encoding_size, compressed, JSONEncoder._child_path(path, i), plan, series_index, inplace, **encoder_options)
+                    if encoded is not j:
+                        if result is json_data and not inplace:
+                            result = list(json_data)
+                        result[i] = encoded
+                json_data = result
             else:
-                encoder = TimeSeriesEncoder(json_data, ts_key=ts_key, ts_value=ts_value, sort_values=sort_values, encoding_size = encoding_size)
-                encoded_json = TimeSeriesEncoder.serialize(encoder)
-                encoded_data = encoder.encode(json_data)
+                if series_index is not None:
+                    series_index.append(path)
+                with Profiler.context(series=path):
+                    encoded_json, encoder = None, None
+                    if plan is not None:
+                        encoded_json, encoder = plan.apply(path, json_data)
+                    if encoder is None:
+                        encoder = TimeSeriesEncoder(json_data, ts_key=ts_key, ts_value=ts_value, sort_values=sort_values, encoding_size = encoding_size, compressed = compressed, **encoder_options)
+                        encoded_json = TimeSeriesEncoder.serialize(encoder)
+                    encoded_data = encoder.encode(json_data)
                 if len(encoded_data) > 0:
                     encoded_json["data"] = encoded_data
                 json_data = encoded_json
@@ -353,11 +1665,17 @@ class JSONEncoder(TimeSeriesEncoder):
             return json_data
 
     @staticmethod
-    def _decode_json(json_data):
+    def _decode_json(json_data, path = None, as_numpy = False, inplace = True):
         if type(json_data) != dict:
             if type(json_data) == list:
+                result = json_data
                 for i, j in enumerate(json_data):
-                    json_data[i] = JSONEncoder._decode_json(j)
+                    decoded = JSONEncoder._decode_json(j, JSONEncoder._child_path(path, i), as_numpy, inplace)
+                    if decoded is not j:
+                        if result is json_data and not inplace:
+                            result = list(json_data)
+                        result[i] = decoded
+                json_data = result
             return json_data
         else:
             encoded_ts = False
@@ -365,23 +1683,125 @@ class JSONEncoder(TimeSeriesEncoder):
                 encoded_ts = True
                     
             if encoded_ts == False:
+                result = json_data
                 for k in json_data:
-                    json_data[k] = JSONEncoder._decode_json(json_data[k])
-                return json_data
+                    decoded = JSONEncoder._decode_json(json_data[k], JSONEncoder._child_path(path, k), as_numpy, inplace)
+                    if decoded is not json_data[k]:
+                        if result is json_data and not inplace:
+                            result = dict(json_data)
+                        result[k] = decoded
+                return result
             else:
-                encoder = TimeSeriesEncoder.deserialize(json_data)
-                if 'data' in json_data:
-                    json_data = encoder.decode(json_data['data'])
-                else:
-                    json_data = encoder.decode()
+                with Profiler.stage('decode_series', series=path) as record:
+                    if 'plan' in json_data:
+                        json_data = EncodingPlan.resolve(json_data)
+                    encoder = TimeSeriesEncoder.deserialize(json_data)
+                    json_data = encoder.decode(json_data.get('data'), as_numpy)
+                if record is not None:
+                    record["points"] = len(json_data)
                 return json_data
 
+class LazySeries(Sequence):
+    # Stands in for an encoded series and decodes it on first access
+    def __init__(self, encoded_series, path=None, as_numpy=False):
+        self.encoded_series = encoded_series
+        self.path = path
+        self.as_numpy = as_numpy
+        self._decoded = None
+
+    def is_decoded(self):
+        return self._decoded is not None
+
+    def decode(self):
+        if self._decoded is None:
+            self._decoded = JSONEncoder._decode_json(dict(self.encoded_series), self.path, self.as_numpy)
+        return self._decoded
+
+    def __getitem__(self, index):
+        return self.decode()[index]
+
+    def __len__(self):
+        return len(self.decode())
+
+    def __iter__(self):
+        return iter(self.decode())
+
+    def __eq__(self, other):
+        if isinstance(other, LazySeries):
+            other = other.decode()
+        return self.decode() == other
+
+    def __repr__(self):
+        if self._decoded is None:
+            return f'LazySeries({self.path or "encoded"})'
+        return f'LazySeries({self._decoded!r})'
+
+class DecodedSeries(Sequence):
+    # A decoded series backed by arrays of epoch seconds and values, points are only built when indexed
+    def __init__(self, times, values, ts_key='UTC', ts_value='Value'):
+        self.times = times
+        self.values = values
+        self.ts_key = ts_key
+        self.ts_value = ts_value
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, index):
+        # A multi-value series holds a list of value arrays, one per value key
+        multi = isinstance(self.ts_value, list)
+        if isinstance(index, slice):
+            values = [column[index] for column in self.values] if multi else self.values[index]
+            return DecodedSeries(self.times[index], values, self.ts_key, self.ts_value)
+        utc = datetime.datetime.utcfromtimestamp(self.times[index])
+        point = {self.ts_key: '%02d-%02d-%02dT%02d:%02d:%02dZ' % (utc.year, utc.month, utc.day, utc.hour, utc.minute, utc.second)}
+        if multi:
+            point.update((key, DecodedSeries._item(column[index])) for key, column in zip(self.ts_value, self.values))
+        else:
+            point[self.ts_value] = DecodedSeries._item(self.values[index])
+        return point
+
+    @staticmethod
+    def _item(value):
+        # Lookup values are held in object arrays as the values themselves
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __iter__(self):
+        if isinstance(self.ts_value, list):
+            for timestamp, *values in zip(self.timestamps(), *[column.tolist() for column in self.values]):
+                point = {self.ts_key: timestamp}
+                point.update(zip(self.ts_value, values))
+                yield point
+            return
+        for timestamp, value in zip(self.timestamps(), self.values.tolist()):
+            yield {self.ts_key: timestamp, self.ts_value: value}
+
+    def __eq__(self, other):
+        if isinstance(other, (DecodedSeries, LazySeries)):
+            other = list(other)
+        return list(self) == other
+
+    def __repr__(self):
+        return f'DecodedSeries({len(self)} points)'
+
+    def timestamps(self):
+        # Formats every timestamp at once
+        return [t + 'Z' for t in np.datetime_as_string(self.times.astype('datetime64[s]'), unit='s').tolist()]
+
+    def to_numpy(self):
+        if isinstance(self.ts_value, list):
+            return np.column_stack((self.times, *self.values))
+        return np.column_stack((self.times, self.values))
+
+    def to_list(self):
+        return list(self)
+
 class CSVEncoder(TimeSeriesEncoder):
     def _set_time_params(self, col_name = None, start = None, lookup=None, encoder=None):
         if col_name is not None:
             self.time["name"] = col_name        
         if start is not None:
-            self.time["start"] = start
+            self.time["start"] = start.item() if isinstance(start, np.generic) else start
         if lookup is not None:
             self.time["lookup"] = lookup
         if encoder is not None:
@@ -431,6 +1851,13 @@ class CSVEncoder(TimeSeriesEncoder):
              }
             
 
+    def _column_encoding_size(self, values, max_state=None):
+        if self.encoding_size != 'auto':
+            return self.encoding_size
+        if max_state is None:
+            max_state = EncoderHelpers.calculate_value_range(values)[0]
+        return EncoderHelpers.choose_encoding_size([max_state], 1, self.compressed)
+
     def encode_time(self, df, time_column):
         times = pd.to_datetime(df[time_column]).astype(int) / 10**9
         self.times = times
@@ -438,10 +1865,11 @@ class CSVEncoder(TimeSeriesEncoder):
         gaps = np.insert(np.diff(times.to_numpy()), 0, 0).astype(np.int64)
 
         # Calculate encoder params
-        encoding_depth, max_prec, num_type, signed = EncoderHelpers.calculate_bit_depth(gaps, encoding_size=self.encoding_size)
+        encoding_size = self._column_encoding_size(gaps)
+        encoding_depth, max_prec, num_type, signed = EncoderHelpers.calculate_bit_depth(gaps, encoding_size=encoding_size)
 
         # Do direct encoding
-        encoder = NumericEncoder(numeric_type=num_type, signed=signed, float_precision=max_prec, encoding_depth=encoding_depth, encoding_size=self.encoding_size)
+        encoder = NumericEncoder(numeric_type=num_type, signed=signed, float_precision=max_prec, encoding_depth=encoding_depth, encoding_size=encoding_size)
         self._set_time_params(encoder=encoder)
         words = encoder.encode(gaps, joined=False)
 
@@ -449,14 +1877,15 @@ class CSVEncoder(TimeSeriesEncoder):
         states = set(words)
         num_states = len(states)
         str_len_states = len(str(states))
-        lookup_bit_depth = EncoderHelpers._calculate_bit_depth(num_states, self.encoding_size)
+        lookup_bit_depth = EncoderHelpers._calculate_bit_depth(num_states, encoding_size)
         if lookup_bit_depth * len(words) + str_len_states < len(words) * encoding_depth:
             # Do lookup table
             lookup, encoding_depth = EncoderHelpers.create_lookup_table(states)
             encoded = list(map(lookup.get, words))
             self._set_time_params(lookup=lookup)
             words = encoded
-        return np.asarray(words).reshape(-1, 1)
+        # Object arrays, numpy str arrays drop trailing null characters of binary alphabets
+        return np.asarray(words, dtype=object).reshape(-1, 1)
     
     def encode_keys(self, df, key_columns):
         #Build unique aggregate key
@@ -468,12 +1897,13 @@ class CSVEncoder(TimeSeriesEncoder):
             else:
                 aggregate_keys += "|" + df[c]
 
-        lookup, encoding_depth = EncoderHelpers.create_lookup_table(aggregate_keys, self.encoding_size)
+        encoding_size = self._column_encoding_size(None, len(set(aggregate_keys)))
+        lookup, encoding_depth = EncoderHelpers.create_lookup_table(aggregate_keys, encoding_size)
         self._set_key_params(col_names=key_columns, lookup=lookup)
         encoded = [0] * len(aggregate_keys)
         for i, v in enumerate(aggregate_keys):
             encoded[i] = lookup[v]
-        return np.asarray(encoded).reshape(-1, 1)
+        return np.asarray(encoded, dtype=object).reshape(-1, 1)
     
     def encode_value(self, df, value_column):
         vals = df[value_column].values
@@ -482,9 +1912,12 @@ class CSVEncoder(TimeSeriesEncoder):
            self._set_static_column(column_name=value_column, column_value=vals[0])
            return
         
+        encoding_size = self.encoding_size
         if vals.dtype != object:
             # Calculate encoder params
-            encoding_depth, max_prec, num_type, signed = EncoderHelpers.calculate_bit_depth(vals, encoding_size=self.encoding_size)
+            max_value, max_prec, num_type, signed, step, _ = EncoderHelpers.calculate_value_encoding(vals, self.error_bound, self.error_mode, self.delta)
+            encoding_size = self._column_encoding_size(None, max_value)
+            encoding_depth = EncoderHelpers._calculate_bit_depth(max_value, encoding_size)
             self._set_value_column_fmt(value_column, max_prec)
 
             if self.functional_compression == True:
@@ -496,64 +1929,107 @@ class CSVEncoder(TimeSeriesEncoder):
                     return
         
             # Do direct encoding
-            encoder = NumericEncoder(numeric_type=num_type, signed=signed, float_precision=max_prec, encoding_depth=encoding_depth, encoding_size=self.encoding_size)
+            encoder = NumericEncoder(numeric_type=num_type, signed=signed, float_precision=max_prec, encoding_depth=encoding_depth, encoding_size=encoding_size, step=step, delta=self.delta)
             words = encoder.encode(vals, joined=False)
             self._set_encoded_column(column_name=value_column, encoder=encoder)
         else:
+            # Strings have no fixed width, so they always go through a lookup table
             words = vals
-            encoded = ''.join(vals)
+            encoding_depth = None
 
         # Decided if we encode the values directly, or use a lookup table
         states = set(words)
         num_states = len(states)
         str_len_states = len(str(states))
-        lookup_bit_depth = EncoderHelpers._calculate_bit_depth(num_states, self.encoding_size)
-        if lookup_bit_depth * len(words) + str_len_states < len(words) * encoding_depth:
+        lookup_bit_depth = EncoderHelpers._calculate_bit_depth(num_states, 64 if encoding_size == 'auto' else encoding_size)
+        if encoding_depth is None or lookup_bit_depth * len(words) + str_len_states < len(words) * encoding_depth:
             # Do lookup table
             lookup, encoding_depth = EncoderHelpers.create_lookup_table(states)
             encoded = list(map(lookup.get, words))
             self._set_lookup_column(column_name=value_column, lookup=lookup)
             words = encoded
-        return np.asarray(words).reshape(-1, 1)
+        return np.asarray(words, dtype=object).reshape(-1, 1)
+
+    @staticmethod
+    def encode_csv(csv, time_column, key_columns, sort_values = True, encoding_size = 64, gzip=False, functional_compression=True, maximum_precision=6, compresslevel=9, compression=None, error_bound=None, error_mode='absolute', delta=False):
+        packet = CSVEncoder._encode_packet(csv, time_column, key_columns, sort_values, encoding_size, functional_compression, maximum_precision, gzip or compression is not None, error_bound=error_bound, error_mode=error_mode, delta=delta)
+        with Profiler.stage('serialize') as record:
+            encoded = EncoderHelpers.json_dumps(packet)
+        if record is not None:
+            record["bytes"] = len(encoded)
+        if compression is not None or gzip:
+            with Profiler.stage('compress') as record:
+                if compression is not None:
+                    encoded = CodecRegistry.compress(encoded, compression)
+                else:
+                    encoded = EncoderHelpers.gzip_str(encoded, compresslevel)
+            if record is not None:
+                record["bytes"] = len(encoded)
+
+        return encoded
+
+    @staticmethod
+    def encode_csv_to_file(csv, fileobj, time_column, key_columns, sort_values = True, encoding_size = 64, gzip=False, functional_compression=True, maximum_precision=6, compresslevel=9, error_bound=None, error_mode='absolute', delta=False):
+        # Streams the encoded packet into a binary file object, compressing on the fly when gzip is set
+        packet = CSVEncoder._encode_packet(csv, time_column, key_columns, sort_values, encoding_size, functional_compression, maximum_precision, gzip, error_bound=error_bound, error_mode=error_mode, delta=delta)
+        with Profiler.stage('serialize'):
+            if gzip:
+                EncoderHelpers.gzip_dump(packet, fileobj, compresslevel)
+            else:
+                EncoderHelpers.json_dump(packet, fileobj)
 
     @staticmethod
-    def encode_csv(csv, time_column, key_columns, sort_values = True, encoding_size = 64, gzip=False, functional_compression=True, maximum_precision=6):
+    def _encode_packet(csv, time_column, key_columns, sort_values = True, encoding_size = 64, functional_compression=True, maximum_precision=6, compressed=False, error_bound=None, error_mode='absolute', delta=False):
         global MAX_FLOATING_PRECISION
         MAX_FLOATING_PRECISION = maximum_precision
-        
-        df = pd.read_csv(StringIO(csv))
-        df = df.dropna()
 
-        if sort_values:
-            df = df.sort_values(time_column, ascending=True)
+        with Profiler.stage('read_csv') as record:
+            if hasattr(csv, 'read'):
+                df = pd.read_csv(csv)
+            else:
+                df = pd.read_csv(StringIO(csv))
+            df = df.dropna()
+
+            if sort_values:
+                df = df.sort_values(time_column, ascending=True)
+        if record is not None:
+            record["points"] = len(df)
 
-        encoder = CSVEncoder(encoding_size=encoding_size, functional_compression=functional_compression)
+        encoder = CSVEncoder(encoding_size=encoding_size, functional_compression=functional_compression, compressed=compressed, error_bound=error_bound, error_mode=error_mode, delta=delta)
         encoder.columns = list(df.columns)
 
-        ndf = pd.DataFrame(encoder.encode_time(df, time_column), columns=[time_column])
-        ndf["keys"] = encoder.encode_keys(df, key_columns)
+        with Profiler.stage('encode_time', column=time_column, points=len(df)) as record:
+            ndf = pd.DataFrame(encoder.encode_time(df, time_column), columns=[time_column])
+        if record is not None:
+            record["encoding"] = copy.deepcopy(encoder.time)
+        with Profiler.stage('encode_keys', column=key_columns, points=len(df)):
+            ndf["keys"] = encoder.encode_keys(df, key_columns)
         
         tscols = set(df.columns) - set([time_column] + key_columns)
         for col in tscols:
-            encoded = encoder.encode_value(df, value_column=col)
+            with Profiler.stage('encode_value', column=col, points=len(df)) as record:
+                encoded = encoder.encode_value(df, value_column=col)
+            if record is not None:
+                record["encoding"] = copy.deepcopy(encoder.value_columns.get(col))
             if encoded is not None:
                 # Static columns will be omit from the dataframe and added to metadata, so this can be None
                 ndf[col] = encoded
         
         packet = encoder.__dict__
-        del packet["times"]
-        data = None
-        for c in ndf.columns:
-            if data is None:
-                data = ndf[c]
-            else:
-                data += ndf[c]
-        packet["data"] = ''.join(data)
-        encoded = json.dumps(packet)
-        if gzip:
-            encoded = EncoderHelpers.gzip_str(encoded)
-
-        return encoded
+        # Encoding options that the decoder does not need
+        for key in ["times", "compressed", "error_bound", "error_mode", "delta"]:
+            del packet[key]
+        with Profiler.stage('interleave', points=len(ndf)) as record:
+            data = None
+            for c in ndf.columns:
+                if data is None:
+                    data = ndf[c]
+                else:
+                    data += ndf[c]
+            packet["data"] = ''.join(data)
+        if record is not None:
+            record["bytes"] = len(packet["data"])
+        return packet
 
     def decode_calculate_token_size(self, json_data):
         timesize = 0
@@ -672,35 +2148,227 @@ class CSVEncoder(TimeSeriesEncoder):
         return times, keys, values
 
     @staticmethod
-    def decode_csv(encoded_data, gzip=False):
-        if gzip:
-            encoded_data = EncoderHelpers.gunzip_bytes_obj(encoded_data)
+    def decode_csv(encoded_data, gzip=False, compression=None):
+        if CodecRegistry.is_framed(encoded_data) or gzip:
+            with Profiler.stage('decompress', bytes=len(encoded_data)):
+                if CodecRegistry.is_framed(encoded_data):
+                    encoded_data = CodecRegistry.decompress(encoded_data, compression)
+                else:
+                    encoded_data = EncoderHelpers.gunzip_bytes_obj(encoded_data)
         
-        json_data = json.loads(encoded_data)
+        with Profiler.stage('parse_json', bytes=len(encoded_data)):
+            json_data = EncoderHelpers.json_loads(encoded_data)
+        return CSVEncoder._decode_packet(json_data)
+
+    @staticmethod
+    def decode_csv_from_file(fileobj, gzip=False):
+        with Profiler.stage('parse_json'):
+            if gzip:
+                json_data = EncoderHelpers.gunzip_load(fileobj)
+            else:
+                json_data = EncoderHelpers.json_load(fileobj)
+        return CSVEncoder._decode_packet(json_data)
+
+    @staticmethod
+    def _decode_blocks(json_data):
+        # Packets written by IncrementalCSVEncoder hold blocks that share the key and string lookups
+        encoding_size = json_data["encoding_size"]
+        header = ','.join(json_data["columns"])
+        rows = []
+        for block in json_data["blocks"]:
+            key_lookup, _ = EncoderHelpers.create_indexed_lookup(json_data["keys"]["values"], encoding_size, block["keys"]["depth"])
+            packet = {
+                "encoding_size": encoding_size,
+                "columns": json_data["columns"],
+                "time": dict(block["time"], name=json_data["time"]["name"]),
+                "keys": {"columns": json_data["keys"]["columns"], "lookup": key_lookup},
+                "value_columns": {},
+                "data": block["data"]
+            }
+            for col, column in block["value_columns"].items():
+                if "lookup_depth" in column:
+                    column = {"lookup": EncoderHelpers.create_indexed_lookup(json_data["lookups"][col], encoding_size, column["lookup_depth"])[0]}
+                packet["value_columns"][col] = column
+            rows.append(CSVEncoder._decode_packet(packet)[len(header) + 1:])
+        return header + '\n' + '\n'.join(rows)
+
+    @staticmethod
+    def _decode_packet(json_data):
+        if "blocks" in json_data:
+            return CSVEncoder._decode_blocks(json_data)
         decoder = CSVEncoder(encoding_size=json_data["encoding_size"])
         time_size, key_size, value_size = decoder.decode_calculate_token_size(json_data)
         data = json_data["data"]
-        times, keys, values = decoder.tokenize(data, time_size, key_size, value_size)
-        ndf = pd.DataFrame(decoder.decode_time(json_data, times), columns=[json_data["time"]["name"]])
-        ndf = ndf.join(decoder.decode_key(json_data, keys))
-        ndf = ndf.join(decoder.decode_values(json_data, values))
+        with Profiler.stage('tokenize', bytes=len(data)) as record:
+            times, keys, values = decoder.tokenize(data, time_size, key_size, value_size)
+        if record is not None:
+            record["points"] = len(times)
+        with Profiler.stage('decode_time', points=len(times)):
+            ndf = pd.DataFrame(decoder.decode_time(json_data, times), columns=[json_data["time"]["name"]])
+        with Profiler.stage('decode_keys', points=len(keys)):
+            ndf = ndf.join(decoder.decode_key(json_data, keys))
+        with Profiler.stage('decode_values', points=len(values)):
+            ndf = ndf.join(decoder.decode_values(json_data, values))
         ndf = ndf[json_data["columns"]]
 
-        rslt = None
-        for c in ndf.columns:
-            if rslt is None:
-                rslt = ndf[c]
-            else:
-                rslt += ',' + ndf[c]
-        return ','.join(ndf.columns) + '\n' + '\n'.join(rslt.values)
+        with Profiler.stage('format_csv', points=len(ndf)) as record:
+            rslt = None
+            for c in ndf.columns:
+                # Static columns without a format decode as numbers
+                column = ndf[c] if ndf[c].dtype == object else ndf[c].astype(str)
+                if rslt is None:
+                    rslt = column
+                else:
+                    rslt += ',' + column
+            decoded = ','.join(ndf.columns) + '\n' + '\n'.join(rslt.values)
+        if record is not None:
+            record["bytes"] = len(decoded)
+        return decoded
 
-    def __init__(self, encoding_size=64, functional_compression=False):
+    def __init__(self, encoding_size=64, functional_compression=False, compressed=False, error_bound=None, error_mode='absolute', delta=False):
         self.encoding_size = encoding_size
+        self.compressed = compressed
+        self.error_bound = error_bound
+        self.error_mode = error_mode
+        self.delta = delta
         self.value_columns = {}
         self.time = {}
         self.keys = {}
         self.functional_compression = functional_compression
 
+class IncrementalCSVEncoder:
+    def __init__(self, time_column, key_columns, encoding_size=64, functional_compression=True, maximum_precision=6, sort_values=True, error_bound=None, error_mode='absolute', delta=False):
+        self.time_column = time_column
+        self.key_columns = list(key_columns)
+        self.encoding_size = encoding_size
+        self.functional_compression = functional_compression
+        self.maximum_precision = maximum_precision
+        self.sort_values = sort_values
+        self.error_bound = error_bound
+        self.error_mode = error_mode
+        self.delta = delta
+
+        # Lookups are shared by every block and only ever grow, so codes written by earlier blocks stay valid
+        self.lookup_size = 64 if encoding_size == 'auto' else encoding_size
+        self.columns = None
+        self.keys = []
+        self.key_codes = {}
+        self.lookups = {}
+        self.lookup_codes = {}
+        self.blocks = []
+
+    def _encode_lookup(self, values, known, codes):
+        for value in pd.unique(values):
+            if value not in codes:
+                codes[value] = len(known)
+                known.append(value)
+        encoding_depth = EncoderHelpers.calculate_bit_depth(np.arange(1, len(known) + 1), encoding_size=self.lookup_size)[0]
+        encoder = NumericEncoder(numeric_type='int', encoding_depth=encoding_depth, encoding_size=self.lookup_size)
+        words = encoder.encode(values.map(codes).to_numpy(), joined=False)
+        return words, encoding_depth
+
+    def add(self, csv):
+        # Encodes a batch of rows into a new block, earlier blocks are left untouched
+        global MAX_FLOATING_PRECISION
+        MAX_FLOATING_PRECISION = self.maximum_precision
+
+        if hasattr(csv, 'read'):
+            df = pd.read_csv(csv)
+        else:
+            df = pd.read_csv(StringIO(csv))
+        df = df.dropna()
+        if len(df) == 0:
+            return None
+
+        if self.columns is None:
+            self.columns = list(df.columns)
+        elif list(df.columns) != self.columns:
+            raise ValueError(f'Rows must have the columns {self.columns}, got {list(df.columns)}.')
+
+        if self.sort_values:
+            df = df.sort_values(self.time_column, ascending=True)
+
+        encoder = CSVEncoder(encoding_size=self.encoding_size, functional_compression=self.functional_compression, error_bound=self.error_bound, error_mode=self.error_mode, delta=self.delta)
+        ndf = pd.DataFrame(encoder.encode_time(df, self.time_column), columns=[self.time_column])
+
+        aggregate_keys = None
+        for c in self.key_columns:
+            if aggregate_keys is None:
+                aggregate_keys = df[c].astype(str)
+            else:
+                aggregate_keys += "|" + df[c].astype(str)
+        ndf["keys"], key_depth = self._encode_lookup(aggregate_keys, self.keys, self.key_codes)
+
+        for col in self.columns:
+            if col == self.time_column or col in self.key_columns:
+                continue
+            vals = df[col].values
+            if vals.dtype == object and not np.all(vals[0] == vals):
+                ndf[col], lookup_depth = self._encode_lookup(df[col].astype(str), self.lookups.setdefault(col, []), self.lookup_codes.setdefault(col, {}))
+                encoder.value_columns[col] = {"lookup_depth": lookup_depth}
+            else:
+                encoded = encoder.encode_value(df, value_column=col)
+                if encoded is not None:
+                    # Static columns will be omit from the dataframe and added to metadata, so this can be None
+                    ndf[col] = encoded
+
+        data = None
+        for c in ndf.columns:
+            if data is None:
+                data = ndf[c]
+            else:
+                data += ndf[c]
+
+        del encoder.time["name"]
+        block = {
+            "rows": len(df),
+            "time": encoder.time,
+            "keys": {"depth": key_depth},
+            "value_columns": encoder.value_columns,
+            "data": ''.join(data)
+        }
+        self.blocks.append(block)
+        return block
+
+    def packet(self):
+        return {
+            "encoding_size": self.lookup_size,
+            "columns": self.columns,
+            "time": {"name": self.time_column},
+            "keys": {"columns": self.key_columns, "values": self.keys},
+            "lookups": self.lookups,
+            "blocks": self.blocks
+        }
+
+    def encode(self, gzip=False, compresslevel=9, compression=None):
+        # Same output types as CSVEncoder.encode_csv, and decoded by CSVEncoder.decode_csv
+        encoded = EncoderHelpers.json_dumps(self.packet())
+        if compression is not None:
+            encoded = CodecRegistry.compress(encoded, compression)
+        elif gzip:
+            encoded = EncoderHelpers.gzip_str(encoded, compresslevel)
+        return encoded
+
+    @staticmethod
+    def load(encoded_data, gzip=False, compression=None, **options):
+        # Resumes from the output of encode, new blocks keep extending the stored lookups
+        if CodecRegistry.is_framed(encoded_data):
+            encoded_data = CodecRegistry.decompress(encoded_data, compression)
+        elif gzip:
+            encoded_data = EncoderHelpers.gunzip_bytes_obj(encoded_data)
+        packet = EncoderHelpers.json_loads(encoded_data)
+
+        options.setdefault("encoding_size", packet["encoding_size"])
+        encoder = IncrementalCSVEncoder(packet["time"]["name"], packet["keys"]["columns"], **options)
+        encoder.lookup_size = packet["encoding_size"]
+        encoder.columns = packet["columns"]
+        encoder.keys = packet["keys"]["values"]
+        encoder.key_codes = {value: code for code, value in enumerate(encoder.keys)}
+        encoder.lookups = packet["lookups"]
+        encoder.lookup_codes = {col: {value: code for code, value in enumerate(values)} for col, values in encoder.lookups.items()}
+        encoder.blocks = packet["blocks"]
+        return encoder
+
 
 
 if __name__ == '__main__':
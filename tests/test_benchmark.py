@@ -0,0 +1,23 @@
+from benchmarks.benchmark import Benchmark, BenchmarkData, CASES
+from src.timeseriesencoder import JSONEncoder
+
+def test_generators():
+    for case in CASES:
+        document = CASES[case](250)
+        assert sum(len(series) for series in document.values()) == 250
+        assert JSONEncoder.decode_json(JSONEncoder.encode_json(document, ts_key='UTC', ts_value='Value')) == CASES[case](250)
+
+def test_run_and_compare():
+    results = Benchmark.run(cases=['irregular'], sizes=[100], warmup=0, repeat=1)
+    assert [r["path"] for r in results] == ['json_encode', 'json_decode', 'csv_encode', 'csv_decode']
+    assert all(r["output_size"] > 0 and r["peak_memory"] > 0 for r in results)
+
+    baseline = {Benchmark.result_key(r): dict(r) for r in results}
+    assert Benchmark.compare(results, baseline) == []
+
+    key = Benchmark.result_key(results[0])
+    baseline[key]["output_size"] -= 1
+    baseline[key]["median_seconds"] /= 100
+    baseline[key]["median_seconds"] -= 1
+    regressions = Benchmark.compare(results, baseline)
+    assert len(regressions) == 2 and all(r.startswith(key) for r in regressions)
@@ -0,0 +1,72 @@
+from copy import deepcopy
+import json
+import pytest
+
+from src.timeseriesencoder import JSONEncoder, CSVEncoder, CodecRegistry, ZlibCodec, ZstdCodec
+
+def get_sample_file():
+    with open('./tests/sample.json', 'r') as ifile:
+        return json.load(ifile)
+
+def get_csv_sample():
+    with open("./tests/bebez.csv", 'r') as ifile:
+        return ifile.read()
+
+def get_series(obj, ts_key):
+    if type(obj) == dict:
+        for k in obj:
+            yield from get_series(obj[k], ts_key)
+    elif type(obj) == list:
+        if len(obj) > 0 and type(obj[0]) == dict and ts_key in obj[0]:
+            yield obj
+        else:
+            for item in obj:
+                yield from get_series(item, ts_key)
+
+def test_frame_roundtrip():
+    payload = b'timeseriesencoder' * 100
+    for codec in ['gzip', 'zlib', 'zlib:1', 'zlib:9', ZlibCodec(level=3)]:
+        framed = CodecRegistry.compress(payload, codec)
+        assert CodecRegistry.is_framed(framed)
+        assert CodecRegistry.decompress(framed) == payload
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        CodecRegistry.get_codec('brotli')
+
+def test_encode_decode_json_codecs():
+    sample = get_sample_file()
+    codecs = ['gzip', 'zlib:1', 'zlib:9']
+    for optional, name in [('zstandard', 'zstd'), ('lz4', 'lz4')]:
+        try:
+            __import__(optional)
+            codecs.append(name)
+        except ImportError:
+            pass
+    for codec in codecs:
+        encoded = JSONEncoder.encode_json(deepcopy(sample), ts_key="UTC", ts_value="Value", compression=codec)
+        assert CodecRegistry.is_framed(encoded)
+        assert JSONEncoder.decode_json(encoded) == sample
+
+def test_encode_decode_csv_codecs():
+    csv = get_csv_sample()
+    expected = CSVEncoder.decode_csv(CSVEncoder.encode_csv(csv, time_column="UTC", key_columns=["Attribute"]))
+    encoded = CSVEncoder.encode_csv(csv, time_column="UTC", key_columns=["Attribute"], compression='zlib:9')
+    assert CSVEncoder.decode_csv(encoded) == expected
+
+def test_zstd_dictionary():
+    pytest.importorskip('zstandard')
+    sample = get_sample_file()
+    series = [{"Values": s} for s in get_series(sample, 'UTC')]
+    encoded = [JSONEncoder.encode_json(deepcopy(s), ts_key="UTC", ts_value="Value") for s in series]
+    codec = ZstdCodec.train(encoded * 10, dict_size=4096)
+    assert codec.dictionary_id != 0
+
+    plain = JSONEncoder.encode_json(deepcopy(series[0]), ts_key="UTC", ts_value="Value", compression='zstd')
+    trained = JSONEncoder.encode_json(deepcopy(series[0]), ts_key="UTC", ts_value="Value", compression=codec)
+    assert len(trained) < len(plain)
+    assert JSONEncoder.decode_json(trained) == series[0]
+
+    # A fresh codec built from the stored dictionary decodes the frame as well
+    restored = ZstdCodec(dictionary=codec.dictionary.as_bytes())
+    assert JSONEncoder.decode_json(trained, compression=restored) == series[0]
@@ -1,6 +1,8 @@
 from src.timeseriesencoder  import NumericEncoder
+import copy
 import pytest
 import numpy as np
+import json
 
 def runner(encoder, verbose=False):
     if encoder.signed:
@@ -89,6 +91,53 @@ def test_all():
             encoder = NumericEncoder(signed = True, encoding_depth = depth+1, numeric_type = 'float', float_precision = prec+1)
             runner(encoder)
 
+def test_step_and_delta():
+    values = np.asarray([1000.1, 1000.4, 1003.2, 999.7, 1001.0])
+    encoder = NumericEncoder(signed = True, encoding_depth = 3, numeric_type = 'float', float_precision = 1, delta = True)
+    assert encoder.decode(encoder.encode(values)) == values.tolist()
+
+    encoder = NumericEncoder(encoding_depth = 2, numeric_type = 'float', float_precision = 0, step = 5)
+    assert encoder.decode(encoder.encode(values)) == [1000.0, 1000.0, 1005.0, 1000.0, 1000.0]
+
+    encoder = NumericEncoder.deserialize(NumericEncoder.serialize(encoder))
+    assert encoder.step == 5 and encoder.delta == False
+
+def test_wide_values():
+    # Depths whose states exceed 64 bits stay exact for integral values and small signed floats
+    values = np.asarray([0.0, 1.0, -1.0, 2.0 ** 70, -(2.0 ** 70) + 2 ** 20, 2.0 ** 100])
+    for encoding_size, encoding_depth in [(16, 27), (64, 18), (91, 16)]:
+        encoder = NumericEncoder(signed = True, encoding_depth = encoding_depth, numeric_type = 'float', encoding_size = encoding_size)
+        assert encoder.decode(encoder.encode(values)) == values.tolist()
+
+    encoder = NumericEncoder(signed = True, encoding_depth = 13, numeric_type = 'float', float_precision = 18)
+    values = np.asarray([0.5, -0.25, 1.0, -1000.125])
+    assert encoder.decode(encoder.encode(values)) == values.tolist()
+
+    encoder = NumericEncoder(signed = False, encoding_depth = 12, numeric_type = 'int')
+    assert encoder.decode(encoder.encode(np.asarray([3.0, 2.0 ** 70]))) == [3, 2 ** 70]
+
+    # Between 2 ** 63 and 2 ** 64 the decode must not wrap around
+    encoder = NumericEncoder(signed = False, encoding_depth = 16, numeric_type = 'int', encoding_size = 16)
+    assert encoder.decode(encoder.encode(np.asarray([2.0 ** 63, 2.0 ** 64 - 2 ** 12]))) == [2 ** 63, 2 ** 64 - 2 ** 12]
+
+def test_wide_bounds():
+    # Signed states past the word used to wrap around and decode to different values
+    encoder = NumericEncoder(signed = True, encoding_depth = 12, numeric_type = 'float', float_precision = 18)
+    with pytest.raises(AssertionError):
+        encoder.encode(np.asarray([-1e4, 1.0]))
+    with pytest.raises(AssertionError):
+        encoder.encode(np.asarray([1e4]))
+
+    encoder = NumericEncoder(signed = False, encoding_depth = 12, numeric_type = 'int')
+    with pytest.raises(AssertionError):
+        encoder.encode(np.asarray([2.0 ** 72]))
+
+    # Signed integers come back as integers
+    encoder = NumericEncoder(signed = True, encoding_depth = 12, numeric_type = 'int')
+    decoded = encoder.decode(encoder.encode(np.asarray([-(2.0 ** 70), 5.0, -3.0])))
+    assert decoded == [-(2 ** 70), 5, -3]
+    assert all(type(value) is int for value in decoded)
+
 def test_base16():
     encoding_size = 16
     encoder = NumericEncoder(signed = True, encoding_depth = 3, numeric_type = 'int', encoding_size = encoding_size)
@@ -153,4 +202,140 @@ def test_base91():
     runner(encoder)
 
     encoder = NumericEncoder(signed = False, encoding_depth = 1, numeric_type = 'float', float_precision = 2, encoding_size = encoding_size)
-    runner(encoder)
\ No newline at end of file
+    runner(encoder)
+
+def test_shared_encoders():
+    encoder = NumericEncoder(signed = True, encoding_depth = 2, numeric_type = 'float', float_precision = 1, encoding_size = 91)
+    msg = NumericEncoder.serialize(encoder)
+    assert msg == {'numeric_type': 'float', 'encoding_depth': 2, 'float_precision': 1, 'signed': True, 'encoding_size': 91}
+    shared = NumericEncoder.deserialize(msg)
+    assert shared is NumericEncoder.deserialize(dict(msg))
+    assert NumericEncoder.serialize(shared) == msg
+    assert not hasattr(shared, '__dict__')
+    # Tables are shared by all encoders of a size and cannot be changed
+    assert shared.encoding_table is encoder.encoding_table
+    with pytest.raises(ValueError):
+        shared.decoding_table[0] = 1
+    runner(shared)
+    # Shared encoders cannot be changed either
+    with pytest.raises(AttributeError):
+        shared.float_precision = 3
+    assert copy.deepcopy(shared) is shared
+
+def test_shared_encoders_bounded():
+    from src.timeseriesencoder.encoders import numeric_encoder
+    first = NumericEncoder.cached('int', 0, False, 3, 64, reference=-1)
+    for reference in range(numeric_encoder.MAX_CACHED_ENCODERS + 10):
+        NumericEncoder.cached('int', 0, False, 3, 64, reference=reference)
+    assert len(NumericEncoder.instances) <= numeric_encoder.MAX_CACHED_ENCODERS
+    # The least recently used encoders are dropped, later calls build an equal one
+    assert NumericEncoder.cached('int', 0, False, 3, 64, reference=-1) is not first
+    assert NumericEncoder.cached('int', 0, False, 3, 64, reference=5) is NumericEncoder.cached('int', 0, False, 3, 64, reference=5)
+
+def test_larger_bases():
+    for encoding_size in [85, 93, 128, 256]:
+        for signed in [True, False]:
+            encoder = NumericEncoder(signed = signed, encoding_depth = 1, numeric_type = 'int', encoding_size = encoding_size)
+            runner(encoder)
+            encoder = NumericEncoder(signed = signed, encoding_depth = 2, numeric_type = 'float', float_precision = 1, encoding_size = encoding_size)
+            runner(encoder)
+
+    # The json safe alphabets need no escaping
+    for encoding_size in [85, 93]:
+        encoder = NumericEncoder(signed = False, encoding_depth = 1, numeric_type = 'int', encoding_size = encoding_size)
+        encoded = encoder.encode(np.arange(encoding_size))
+        assert json.dumps(encoded) == f'"{encoded}"'
+
+@pytest.fixture
+def alphabet_registry():
+    # Registered alphabets are global, restore them so other tests see the built in ones only
+    from src.timeseriesencoder.encoders import numeric_encoder
+    alphabets = dict(numeric_encoder.ALPHABETS)
+    tables = dict(numeric_encoder.CHARACTER_TABLES)
+    instances = numeric_encoder.NumericEncoder.instances.copy()
+    yield
+    numeric_encoder.ALPHABETS.clear()
+    numeric_encoder.ALPHABETS.update(alphabets)
+    numeric_encoder.CHARACTER_TABLES.clear()
+    numeric_encoder.CHARACTER_TABLES.update(tables)
+    with numeric_encoder.CACHE_LOCK:
+        numeric_encoder.NumericEncoder.instances.clear()
+        numeric_encoder.NumericEncoder.instances.update(instances)
+
+def test_register_alphabet(alphabet_registry):
+    with pytest.raises(ValueError):
+        NumericEncoder(encoding_size = 42)
+    with pytest.raises(ValueError):
+        NumericEncoder.register_alphabet('0123456789ABCDEF')
+    # Built in alphabets stay fixed, data serialized with them only records the encoding size
+    with pytest.raises(ValueError):
+        NumericEncoder.register_alphabet('FEDCBA9876543210', replace = True)
+    with pytest.raises(ValueError):
+        NumericEncoder.register_alphabet('aab')
+    with pytest.raises(ValueError):
+        NumericEncoder.register_alphabet('abc"')
+
+    assert NumericEncoder.register_alphabet('ACGT', replace = True) == 4
+    encoder = NumericEncoder(signed = True, encoding_depth = 3, numeric_type = 'int', encoding_size = 4)
+    runner(encoder)
+    assert set(encoder.encode(np.arange(-10, 10))) <= set('ACGT')
+
+    NumericEncoder.register_alphabet('TGCA', replace = True)
+    replaced = NumericEncoder.cached('int', 0, True, 3, 4)
+    assert replaced is not encoder
+    assert replaced.encode(np.asarray([0])) != encoder.encode(np.asarray([0]))
+    runner(replaced)
+
+def test_packed():
+    values = np.asarray([0, 1, 5, 127, 64, 3, 99])
+    for encoding_size in [16, 64, 91, 256]:
+        encoder = NumericEncoder(numeric_type = 'int', encoding_size = encoding_size, bit_width = 7)
+        encoded = encoder.encode(values)
+        assert len(encoded) == encoder.packed_length(len(values)) == -(-7 * 7 // (encoding_size.bit_length() - 1))
+        assert encoder.decode(encoded, len(values)) == values.tolist()
+
+    # Padding can hold whole values, which only the count tells apart
+    encoder = NumericEncoder(numeric_type = 'int', bit_width = 2)
+    assert encoder.decode(encoder.encode(np.asarray([3])), 1) == [3]
+    assert len(encoder.decode(encoder.encode(np.asarray([3])))) == 3
+
+    encoder = NumericEncoder(signed = True, numeric_type = 'float', float_precision = 2, bit_width = 11, delta = True)
+    values = np.asarray([1.25, 1.3, -2.5, 3.01])
+    assert encoder.decode(encoder.encode(values), 4) == values.tolist()
+    msg = NumericEncoder.serialize(encoder)
+    assert msg["bit_width"] == 11
+    assert NumericEncoder.deserialize(msg).bit_width == 11
+
+    encoder = NumericEncoder(signed = True, numeric_type = 'int', bit_width = 64)
+    values = np.asarray([-2 ** 53, -1, 0, 2 ** 53])
+    assert encoder.decode(encoder.encode(values), 4) == values.tolist()
+
+    with pytest.raises(AssertionError):
+        NumericEncoder(numeric_type = 'int', bit_width = 3).encode(np.asarray([8]))
+    with pytest.raises(ValueError):
+        NumericEncoder(numeric_type = 'int', bit_width = 65)
+    with pytest.raises(ValueError):
+        NumericEncoder(numeric_type = 'int', bit_width = 3).encode(np.asarray([1, 2]), joined = False)
+
+def test_packed_chunks():
+    # Long series are packed in chunks, which must join into the same bitstream
+    from src.timeseriesencoder.encoders import numeric_encoder
+    rng = np.random.default_rng(0)
+    for encoding_size, bit_width in [(16, 3), (64, 41), (91, 64), (256, 13)]:
+        encoder = NumericEncoder(numeric_type = 'int', encoding_size = encoding_size, bit_width = bit_width)
+        count = (encoding_size.bit_length() - 1) * numeric_encoder.PACK_CHUNK * 2 + 5
+        values = rng.integers(0, 2 ** min(bit_width, 53), count).astype(np.float64)
+        encoded = encoder.encode(values)
+        assert len(encoded) == encoder.packed_length(count)
+        assert np.array_equal(encoder.decode_array(encoded, count), values)
+        assert encoder.decode(encoder.encode(values[:7]), 7) == values[:7].tolist()
+
+def test_reference():
+    values = np.asarray([1000.1, 1000.4, 1003.2, 1010.9, 1001.0])
+    encoder = NumericEncoder(encoding_depth = 2, numeric_type = 'float', float_precision = 1, reference = 10001)
+    assert encoder.decode(encoder.encode(values)) == values.tolist()
+    assert NumericEncoder.serialize(encoder)["reference"] == 10001
+
+    encoder = NumericEncoder(encoding_depth = 1, numeric_type = 'int', reference = -5000, bit_width = 4)
+    values = np.asarray([-5000, -4990, -4985])
+    assert encoder.decode(encoder.encode(values), 3) == values.tolist()
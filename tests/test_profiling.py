@@ -0,0 +1,58 @@
+from copy import deepcopy
+import json
+
+from src.timeseriesencoder import JSONEncoder, CSVEncoder, Profiler
+
+def get_sample_file():
+    with open('./tests/sample.json', 'r') as ifile:
+        return json.load(ifile)
+
+def get_csv_sample():
+    with open("./tests/bebez.csv", 'r') as ifile:
+        return ifile.read()
+
+def test_profile_json():
+    sample = get_sample_file()
+    exported = []
+    with Profiler(callback=exported.append) as profiler:
+        encoded = JSONEncoder.encode_json(deepcopy(sample), ts_key='UTC', ts_value='Value', gzip=True)
+        decoded = JSONEncoder.decode_json(encoded, gzip=True)
+    assert decoded == sample
+    assert exported == profiler.records
+
+    summary = profiler.summary()
+    for stage in ['parse_timestamps', 'analyze', 'encode_values', 'serialize', 'compress', 'decompress', 'parse_json', 'decode_series']:
+        assert stage in summary
+    assert summary['compress']['bytes'] == len(encoded)
+
+    analyses = [r for r in profiler.records if r['stage'] == 'analyze']
+    decodes = [r for r in profiler.records if r['stage'] == 'decode_series']
+    assert len(analyses) == len(decodes) > 0
+    assert all(r['series'].startswith('$.') and 'encoding' in r for r in analyses)
+    assert sorted(r['series'] for r in analyses) == sorted(r['series'] for r in decodes)
+    assert sum(r['points'] for r in analyses) == summary['decode_series']['points']
+
+def test_profile_csv():
+    csv = get_csv_sample()
+    with Profiler() as profiler:
+        encoded = CSVEncoder.encode_csv(csv, time_column='UTC', key_columns=['Attribute'])
+        CSVEncoder.decode_csv(encoded)
+    summary = profiler.summary()
+    for stage in ['read_csv', 'encode_time', 'encode_keys', 'encode_value', 'serialize', 'parse_json', 'decode_values', 'format_csv']:
+        assert stage in summary
+    assert summary['serialize']['bytes'] == len(encoded)
+    columns = {r['column'] for r in profiler.records if r['stage'] == 'encode_value'}
+    assert columns == {'AverageNumericValue', 'AsOfDateUTC', 'ForecastHorizonHour'}
+
+def test_profiler_disabled():
+    sample = get_sample_file()
+    with Profiler() as profiler:
+        pass
+    JSONEncoder.encode_json(deepcopy(sample), ts_key='UTC', ts_value='Value')
+    assert profiler.records == [] and Profiler.active() is None
+
+    with Profiler() as outer:
+        with Profiler() as inner:
+            JSONEncoder.encode_json(deepcopy(sample), ts_key='UTC', ts_value='Value')
+        assert Profiler.active() is outer
+    assert outer.records == [] and len(inner.records) > 0
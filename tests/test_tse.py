@@ -2,6 +2,8 @@ from copy import deepcopy
 from numpyencoder import NumpyEncoder
 
 from src.timeseriesencoder import TimeSeriesEncoder
+from src.timeseriesencoder.encoders.time_series_encoder import EncoderHelpers
+import numpy as np
 import sys
 
 def get_size(obj, seen=None):
@@ -92,6 +94,31 @@ def test_base_91():
     for i, k in enumerate(unsorted_test):
         assert k == decoding[i]
 
+def test_calculate_bit_depth():
+    for encoding_size in [16, 64, 91]:
+        for depth in range(1, 8):
+            assert EncoderHelpers._calculate_bit_depth(encoding_size ** depth - 1, encoding_size) == depth
+            assert EncoderHelpers._calculate_bit_depth(encoding_size ** depth, encoding_size) == depth + 1
+        assert EncoderHelpers._calculate_bit_depth(0.5, encoding_size) == 0
+
+def test_decimal_scale():
+    values = np.asarray([75.0, 73.4, 0.07, -2.25, 0.123456, 0.0])
+    assert [EncoderHelpers.max_decimal_scale([value]) for value in values] == [0, 1, 2, 2, 6, 0]
+    assert EncoderHelpers.max_decimal_scale(values) == 6
+    assert EncoderHelpers.max_decimal_scale(values[:3]) == 2
+    assert EncoderHelpers.max_decimal_scale(np.round(np.linspace(0, 100, 10000), 3)) == 3
+    assert EncoderHelpers.max_decimal_scale([0.1234567]) == 6
+
+def test_decimal_scale_large_magnitudes():
+    # Scaling by 10 ** 6 goes past 2 ** 53, integer valued floats must not gain decimals
+    assert EncoderHelpers.max_decimal_scale([892792317557.0, 51.0]) == 0
+    assert EncoderHelpers.calculate_value_range(np.asarray([892792317557.0, 51.0])) == (892792317557.0, 0, 'int', False)
+    assert EncoderHelpers.max_decimal_scale([892792317557.0, 51.25]) == 2
+
+def test_calculate_bit_depth_values():
+    assert EncoderHelpers.calculate_bit_depth(np.asarray([75.0, 73.4, 54.2]), 64) == (2, 1, 'float', False)
+    assert EncoderHelpers.calculate_bit_depth(np.asarray([1, 2, -3]), 64) == (1, 0, 'int', True)
+
 def get_sample():
     import json
     return json.loads('''{
@@ -1,10 +1,11 @@
 from gc import get_count
 import hashlib
+import io
 from io import StringIO
 import json
 import numpy as np
 import pandas as pd
-from src.timeseriesencoder import CSVEncoder
+from src.timeseriesencoder import CSVEncoder, IncrementalCSVEncoder
 
 def test_encode_keys():
     csv = get_csv_sample()
@@ -85,6 +86,106 @@ def test_decode_values():
     assert np.all(set(values.columns) == set(["AsOfDateUTC", "AverageNumericValue", "ForecastHorizonHour"]))
     assert values.shape == (9143, 3)
 
+def test_encode_decode_csv_file():
+    csv = get_csv_sample()
+    expected = CSVEncoder.decode_csv(CSVEncoder.encode_csv(csv, time_column="UTC", key_columns=["Attribute"]))
+    for z in [True, False]:
+        buffer = io.BytesIO()
+        CSVEncoder.encode_csv_to_file(StringIO(csv), buffer, time_column="UTC", key_columns=["Attribute"], gzip=z, compresslevel=1)
+        buffer.seek(0)
+        decoded = CSVEncoder.decode_csv_from_file(buffer, gzip=z)
+        assert decoded == expected
+
+def test_encode_decode_csv_auto_size():
+    csv = get_csv_sample()
+    expected = CSVEncoder.decode_csv(CSVEncoder.encode_csv(csv, time_column="UTC", key_columns=["Attribute"]))
+    encoded = CSVEncoder.encode_csv(csv, time_column="UTC", key_columns=["Attribute"], encoding_size='auto')
+    assert json.loads(encoded)["encoding_size"] == 'auto'
+    assert CSVEncoder.decode_csv(encoded) == expected
+
+def test_encode_decode_csv_larger_bases():
+    csv = get_csv_sample()
+    expected = CSVEncoder.decode_csv(CSVEncoder.encode_csv(csv, time_column="UTC", key_columns=["Attribute"]))
+    for encoding_size in [93, 256]:
+        encoded = CSVEncoder.encode_csv(csv, time_column="UTC", key_columns=["Attribute"], encoding_size=encoding_size)
+        assert CSVEncoder.decode_csv(encoded) == expected
+
+def test_encode_decode_csv_error_bound():
+    csv = get_csv_sample()
+    original = pd.read_csv(StringIO(csv)).sort_values(["UTC", "Attribute"])
+    encoded = CSVEncoder.encode_csv(csv, time_column="UTC", key_columns=["Attribute"], error_bound=0.5, functional_compression=False)
+    assert len(encoded) < len(CSVEncoder.encode_csv(csv, time_column="UTC", key_columns=["Attribute"], functional_compression=False))
+    decoded = pd.read_csv(StringIO(CSVEncoder.decode_csv(encoded))).sort_values(["UTC", "Attribute"])
+    assert np.max(np.abs(decoded["AverageNumericValue"].values - original["AverageNumericValue"].values)) <= 0.5 + 1e-9
+
+def test_encode_decode_csv_error_bound_near_zero():
+    values = [-0.004, 0.5, 1.2, 0.7]
+    csv = 'UTC,Attribute,Value\n' + ''.join(f'2022-01-01T00:0{i}:00Z,a,{v}\n' for i, v in enumerate(values))
+    encoded = CSVEncoder.encode_csv(csv, time_column="UTC", key_columns=["Attribute"], error_bound=0.01, functional_compression=False)
+    decoded = pd.read_csv(StringIO(CSVEncoder.decode_csv(encoded)))
+    assert np.max(np.abs(decoded["Value"].values - values)) <= 0.01 + 1e-9
+
+def find_numpy_types(obj):
+    if isinstance(obj, dict):
+        return any(find_numpy_types(v) for v in obj.values())
+    if isinstance(obj, list):
+        return any(find_numpy_types(v) for v in obj)
+    return isinstance(obj, np.generic)
+
+def test_encoded_packet_types_are_native():
+    csv = get_csv_sample()
+    packet = CSVEncoder._encode_packet(csv, "UTC", ["Attribute"], True, 64, True, 6, False)
+    assert not find_numpy_types(packet)
+    encoder = IncrementalCSVEncoder(time_column="UTC", key_columns=["Attribute"])
+    encoder.add(csv)
+    assert not find_numpy_types(encoder.packet())
+
+def sorted_frame(csv, columns):
+    return pd.read_csv(StringIO(csv)).sort_values(columns).reset_index(drop=True)
+
+def test_incremental_encoder():
+    csv = get_csv_sample()
+    df = pd.read_csv(StringIO(csv)).sort_values("UTC", kind="stable")
+    # A string column that changes between rows has to go through the shared lookup
+    df["Source"] = np.where(np.arange(len(df)) % 3 == 0, "model_a", "model_b")
+    split = len(df) // 2
+
+    encoder = IncrementalCSVEncoder(time_column="UTC", key_columns=["Attribute"])
+    first = encoder.add(df.iloc[:split].to_csv(index=False))
+    data = first["data"]
+    keys = list(encoder.keys)
+
+    later = df.iloc[split:].copy()
+    later.loc[later.index[:5], "Attribute"] = [f"new_attribute_{i}" for i in range(5)]
+    later.loc[later.index[5:8], "Source"] = "model_c"
+    encoder.add(later.to_csv(index=False))
+
+    # Earlier blocks and codes are not rewritten
+    assert encoder.blocks[0]["data"] == data
+    assert encoder.keys[:len(keys)] == keys
+    assert encoder.lookups["Source"] == ["model_a", "model_b", "model_c"]
+
+    expected = pd.concat([df.iloc[:split], later]).to_csv(index=False)
+    columns = ["UTC", "Attribute", "Source"]
+    for encoded in [encoder.encode(), encoder.encode(gzip=True)]:
+        decoded = CSVEncoder.decode_csv(encoded, gzip=not isinstance(encoded, str))
+        assert sorted_frame(decoded, columns).equals(sorted_frame(CSVEncoder.decode_csv(CSVEncoder.encode_csv(expected, time_column="UTC", key_columns=["Attribute"])), columns))
+
+    resumed = IncrementalCSVEncoder.load(encoder.encode())
+    resumed.add(df.iloc[:10].to_csv(index=False))
+    assert len(resumed.blocks) == 3 and resumed.keys == encoder.keys
+    assert len(pd.read_csv(StringIO(CSVEncoder.decode_csv(resumed.encode())))) == len(df) + 10
+
+def test_incremental_encoder_widens_keys():
+    rows = ["UTC,Key,Value"] + [f"2022-01-01T00:00:{i:02d}Z,k{i},{i}" for i in range(60)]
+    encoder = IncrementalCSVEncoder(time_column="UTC", key_columns=["Key"])
+    encoder.add("\n".join(rows))
+    more = ["UTC,Key,Value"] + [f"2022-01-01T00:01:{i:02d}Z,k{i + 60},{i}" for i in range(10)]
+    encoder.add("\n".join(more))
+    assert [b["keys"]["depth"] for b in encoder.blocks] == [1, 2]
+    decoded = pd.read_csv(StringIO(CSVEncoder.decode_csv(encoder.encode())))
+    assert decoded["Key"].tolist() == [f"k{i}" for i in range(70)]
+
 def get_count_of_key(obj, key):
     if type(obj) == dict:
         n = 0
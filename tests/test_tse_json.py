@@ -1,10 +1,12 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
 import os
 from copy import deepcopy
 from numpyencoder import NumpyEncoder
 import json
 import numpy as np
 
-from src.timeseriesencoder import JSONEncoder
+from src.timeseriesencoder import JSONEncoder, EncodingPlan, LazySeries, DecodedSeries
 import sys
 
 def get_size(obj, seen=None):
@@ -31,7 +33,7 @@ def test_encode_decode_json_all_sizes():
     sample = get_sample_file()
     sample_sorted = sortvalues(deepcopy(sample), 'UTC')
     sort_values = [True, False]
-    encoding_sizes = [16, 64, 91]
+    encoding_sizes = [16, 64, 85, 91, 93, 128, 256]
     for k in sort_values:
         for s in encoding_sizes:
             if k == True:
@@ -49,7 +51,7 @@ def test_encode_decode_json_all_sizes_gzip():
     sample = get_sample_file()
     sample_sorted = sortvalues(deepcopy(sample), 'UTC')
     sort_values = [True, False]
-    encoding_sizes = [16, 64, 91]
+    encoding_sizes = [16, 64, 85, 91, 93, 128, 256]
     for k in sort_values:
         for s in encoding_sizes:
             if k == True:
@@ -214,8 +216,754 @@ def test_static_value_neg_nonzero():
     assert "data" not in encoded["Values"]
     assert "static" in encoded["Values"]
 
+def test_encode_decode_json_file():
+    sample = get_sample_file()
+    for z in [True, False]:
+        for level in [1, 9]:
+            buffer = io.BytesIO()
+            JSONEncoder.encode_json_to_file(deepcopy(sample), buffer, ts_key="UTC", ts_value="Value", gzip=z, compresslevel=level)
+            buffer.seek(0)
+            decoded = JSONEncoder.decode_json_from_file(buffer, gzip=z)
+            assert sample == decoded
+
+def test_encode_json_file_matches_gzip():
+    sample = get_sample_file()
+    buffer = io.BytesIO()
+    JSONEncoder.encode_json_to_file(deepcopy(sample), buffer, ts_key="UTC", ts_value="Value", gzip=True)
+    encoded = JSONEncoder.encode_json(deepcopy(sample), ts_key="UTC", ts_value="Value", gzip=True)
+    assert JSONEncoder.decode_json(buffer.getvalue(), gzip=True) == JSONEncoder.decode_json(encoded, gzip=True)
+
+
+def test_encode_decode_json_auto_size():
+    sample = get_sample_file()
+    sample_sorted = sortvalues(deepcopy(sample), 'UTC')
+    for z in [True, False]:
+        encoded = JSONEncoder.encode_json(deepcopy(sample), ts_key="UTC", ts_value="Value", sort_values=True, encoding_size='auto', gzip=z)
+        assert sample_sorted == JSONEncoder.decode_json(encoded, gzip=z)
+
+def test_auto_size_not_larger():
+    sample = get_sample_file()
+    auto = json.dumps(JSONEncoder.encode_json(deepcopy(sample), ts_key="UTC", ts_value="Value", sort_values=True, encoding_size='auto'))
+    for s in [16, 64, 91]:
+        fixed = json.dumps(JSONEncoder.encode_json(deepcopy(sample), ts_key="UTC", ts_value="Value", sort_values=True, encoding_size=s))
+        assert len(auto) <= len(fixed)
+
+
+def get_series_values(obj, ts_key, ts_value):
+    if type(obj) == dict:
+        for key in obj:
+            yield from get_series_values(obj[key], ts_key, ts_value)
+    elif type(obj) == list:
+        if len(obj) > 0 and type(obj[0]) == dict and ts_key in obj[0]:
+            yield [item[ts_value] for item in obj]
+        else:
+            for item in obj:
+                yield from get_series_values(item, ts_key, ts_value)
+
+def test_encode_decode_json_error_bound():
+    sample = get_sample_file()
+    lossless = json.dumps(JSONEncoder.encode_json(deepcopy(sample), ts_key="UTC", ts_value="Value"))
+    for delta in [True, False]:
+        for bound, mode in [(0.5, 'absolute'), (0.05, 'absolute'), (0.01, 'relative')]:
+            encoded = JSONEncoder.encode_json(deepcopy(sample), ts_key="UTC", ts_value="Value", error_bound=bound, error_mode=mode, delta=delta)
+            size = len(json.dumps(encoded))
+            decoded = JSONEncoder.decode_json(encoded)
+            for original, values in zip(get_series_values(sample, "UTC", "Value"), get_series_values(decoded, "UTC", "Value")):
+                original = np.asarray(original)
+                limit = bound if mode == 'absolute' else bound * np.max(np.abs(original))
+                assert np.max(np.abs(original - np.asarray(values))) <= limit + 1e-9
+            if delta == False and mode == 'absolute':
+                assert size < len(lossless)
+
+def test_error_bound_rounds_to_zero():
+    # Values just below zero quantize to the zero state, as does everything when the bound exceeds the range
+    for values, bound in [([-0.004, 0.5, 1.2, 0.7], 0.01), ([-0.2, 0.1, -0.3, 0.4], 2.0)]:
+        points = make_points(np.arange(4) * 60, values)
+        for delta in [True, False]:
+            encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value="Value", error_bound=bound, delta=delta)
+            decoded = [point["Value"] for point in JSONEncoder.decode_json(encoded)["s"]]
+            assert np.max(np.abs(np.asarray(decoded) - values)) <= bound + 1e-9
+
+def test_error_bound_finer_than_precision():
+    # Decimals past the precision cap are quantized, so a fine bound still holds
+    rng = np.random.default_rng(0)
+    values = rng.uniform(1, 10, 50)
+    points = make_points(np.arange(50) * 60, values.tolist())
+    for bound, mode in [(9.9e-8, 'relative'), (3e-8, 'absolute')]:
+        encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value="Value", error_bound=bound, error_mode=mode)
+        decoded = np.asarray([point["Value"] for point in JSONEncoder.decode_json(encoded)["s"]])
+        limit = bound if mode == 'absolute' else bound * np.max(np.abs(values))
+        assert np.max(np.abs(decoded - values)) <= limit
+
+def test_encode_decode_json_delta():
+    sample = get_sample_file()
+    encoded = JSONEncoder.encode_json(deepcopy(sample), ts_key="UTC", ts_value="Value", delta=True)
+    assert sample == JSONEncoder.decode_json(encoded)
+
+
+
+
+
+def make_points(offsets, values, ts_key="UTC", ts_value="Value"):
+    times = np.datetime_as_string((np.asarray(offsets) + 1640995200).astype('datetime64[s]'), unit='s')
+    return [{ts_key: t + 'Z', ts_value: v} for t, v in zip(times, values)]
+
+def test_encode_decode_json_sorted_irregular():
+    points = make_points([30, 0, 9, 5, 600], [4.0, 1.0, 3.0, 2.0, 5.0], ts_key="Time", ts_value="V")
+    for sort_values in [True, False]:
+        encoded = JSONEncoder.encode_json({"s": deepcopy(points)}, ts_key="Time", ts_value="V", sort_values=sort_values)
+        expected = sorted(points, key=lambda x: x["Time"]) if sort_values else points
+        assert JSONEncoder.decode_json(encoded)["s"] == expected
+
+def test_append():
+    cases = [
+        # Regular static series that stays static
+        (make_points(range(0, 600, 60), [1.5] * 10), make_points(range(600, 900, 60), [1.5] * 5)),
+        # Static series that gains values
+        (make_points(range(0, 600, 60), [1.5] * 10), make_points(range(600, 900, 60), [2.5, 1.5, 3, 4, 5])),
+        # Regular series whose new points fit the encoder
+        (make_points(range(0, 600, 60), np.arange(10) + 0.5), make_points(range(600, 900, 60), [3.5, 4.5, 5.5, 6.5, 7.5])),
+        # New points need more precision, a sign and a wider value
+        (make_points(range(0, 600, 60), np.arange(10) + 0.5), make_points(range(600, 900, 60), [3.25, -4, 5000, 6, 7])),
+        # Regular series that becomes irregular
+        (make_points(range(0, 600, 60), np.arange(10) + 0.5), make_points([700, 1000], [3.5, 4.5])),
+        # Irregular series, fitting and then a point before the start and far after it
+        (make_points([0, 5, 9, 30], [1, 2, 3, 4]), make_points([31, 40], [5, 6])),
+        (make_points([0, 5, 9, 30], [1, 2, 3, 4]), make_points([-100, 100000], [5, 6])),
+    ]
+    for existing, new_points in cases:
+        encoded = JSONEncoder.encode_json({"s": deepcopy(existing)}, ts_key="UTC", ts_value="Value")["s"]
+        original = deepcopy(encoded)
+        appended = JSONEncoder.append(encoded, deepcopy(new_points))
+        assert encoded == original
+        assert JSONEncoder.decode_json({"s": appended})["s"] == existing + new_points
+
+        # Appending produces the same size as encoding everything at once
+        full = JSONEncoder.encode_json({"s": existing + new_points}, ts_key="UTC", ts_value="Value")["s"]
+        assert len(appended.get("data", "")) == len(full.get("data", ""))
+
+def test_append_inplace_extends_data():
+    existing = make_points(range(0, 600, 60), np.arange(10) + 0.5)
+    encoded = JSONEncoder.encode_json({"s": deepcopy(existing)}, ts_key="UTC", ts_value="Value")["s"]
+    data = encoded["data"]
+    new_points = make_points(range(600, 900, 60), [3.5, 4.5, 5.5, 6.5, 7.5])
+    JSONEncoder.append(encoded, new_points, inplace=True)
+    assert encoded["data"].startswith(data)
+    assert JSONEncoder.decode_json({"s": encoded})["s"] == existing + new_points
+
+def test_append_lossy_and_delta():
+    existing = make_points(range(0, 600, 60), np.arange(10) + 0.5)
+    new_points = make_points(range(600, 900, 60), [30.25, 4, 5, 6, 7])
+    encoded = JSONEncoder.encode_json({"s": deepcopy(existing)}, ts_key="UTC", ts_value="Value", delta=True)["s"]
+    assert JSONEncoder.decode_json({"s": JSONEncoder.append(encoded, new_points)})["s"] == existing + new_points
+
+    encoded = JSONEncoder.encode_json({"s": deepcopy(existing)}, ts_key="UTC", ts_value="Value", error_bound=0.5)["s"]
+    decoded = JSONEncoder.decode_json({"s": JSONEncoder.append(encoded, new_points)})["s"]
+    for point, expected in zip(decoded, existing + new_points):
+        assert abs(point["Value"] - expected["Value"]) <= 0.5
+
+def test_packed():
+    sample = get_sample_file()
+    for s in [16, 64, 91, 256]:
+        for k in [True, False]:
+            expected = JSONEncoder.decode_json(JSONEncoder.encode_json(sample, ts_key = 'UTC', ts_value = 'Value', sort_values = k, encoding_size = s))
+            encoded = JSONEncoder.encode_json(sample, ts_key = 'UTC', ts_value = 'Value', sort_values = k, encoding_size = s, packed = True)
+            assert JSONEncoder.decode_json(encoded) == expected
+            assert JSONEncoder.decode_json_to_bytes(encoded) == json.dumps(expected).encode()
+
+    # Seven bit values take two base 64 characters as words, but seven bits packed
+    document = {"s": make_points(np.arange(60) * 60, np.arange(60) * 2 + 1)}
+    words = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value")["s"]
+    packed = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value", packed=True)["s"]
+    assert packed["packed"] == True and packed["count"] == 60
+    assert packed["encoder"]["bit_width"] == 7
+    assert len(packed["data"]) == 70 < len(words["data"]) == 120
+    assert JSONEncoder.decode_json({"s": packed})["s"] == document["s"]
+
+def test_packed_append_and_plan():
+    cases = [
+        (make_points(range(0, 600, 60), [1.5] * 10), make_points(range(600, 900, 60), [2.5, 1.5, 3, 4, 5])),
+        (make_points(range(0, 600, 60), np.arange(10) + 0.5), make_points(range(600, 900, 60), [3.5, 4.5, 5.5, 6.5, 7.5])),
+        (make_points(range(0, 600, 60), np.arange(10) + 0.5), make_points([700, 1000], [3.25, -4])),
+        (make_points([0, 5, 9, 30], [1, 2, 3, 4]), make_points([31, 40], [5, 6])),
+        (make_points([0, 5, 9, 30], [1, 2, 3, 4]), make_points([-100, 100000], [5, 6])),
+    ]
+    for existing, new_points in cases:
+        encoded = JSONEncoder.encode_json({"s": existing}, ts_key="UTC", ts_value="Value", packed=True)["s"]
+        appended = JSONEncoder.append(encoded, new_points)
+        assert appended["count"] == len(existing) + len(new_points)
+        assert JSONEncoder.decode_json({"s": appended})["s"] == existing + new_points
+
+    plan = JSONEncoder.create_plan(make_document(0), ts_key="UTC", ts_value="Value", packed=True)
+    document = make_document(1)
+    encoded = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value", plan=plan)
+    assert "plan" in encoded["regular"] and encoded["regular"]["count"] == 50
+    assert JSONEncoder.decode_json(encoded) == document
+    assert JSONEncoder.decode_json(encoded, as_numpy=True)["irregular"][0].to_list() == document["irregular"][0]
+
+def test_frame_of_reference():
+    rng = np.random.default_rng(0)
+    document = {
+        "band": make_points(np.arange(100) * 60, np.round(rng.uniform(1000.1, 1010.9, 100), 1).tolist()),
+        "negative": make_points(np.cumsum(rng.integers(1, 600, 100)), np.round(rng.uniform(-5010, -5000, 100), 2).tolist()),
+        "zero": make_points(np.arange(10) * 60, np.arange(10).tolist()),
+    }
+    plain = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value")
+    for options in [{}, {"packed": True}, {"delta": True}, {"gzip": True}]:
+        encoded = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value", frame_of_reference=True, **options)
+        assert JSONEncoder.decode_json(encoded, gzip=options.get("gzip", False)) == document
+
+    encoded = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value", frame_of_reference=True)
+    assert encoded["band"]["encoder"]["reference"] == 10001
+    assert encoded["band"]["encoder"]["encoding_depth"] == 2 < plain["band"]["encoder"]["encoding_depth"]
+    assert "signed" not in encoded["negative"]["encoder"]
+    assert len(encoded["negative"]["data"]) < len(plain["negative"]["data"])
+    # A reference that does not shorten the words is left out
+    assert encoded["zero"] == plain["zero"]
+
+    # Points below the reference refit the encoder
+    appended = JSONEncoder.append(encoded["band"], make_points([6000, 6060], [1010.5, 900.5]))
+    assert appended["encoder"]["reference"] == 9005
+    assert JSONEncoder.decode_json({"s": appended})["s"] == document["band"] + make_points([6000, 6060], [1010.5, 900.5])
+
+def test_frame_of_reference_random():
+    # Values at the bottom of a narrow band must not round below the reference
+    rng = np.random.default_rng(0)
+    for _ in range(100):
+        points = make_points(np.arange(50) * 60, np.round(rng.uniform(20000, 20200, 50), 4).tolist())
+        for options in [{}, {"packed": True}, {"delta": True}]:
+            encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value="Value", frame_of_reference=True, **options)
+            assert JSONEncoder.decode_json(encoded)["s"] == points
+
+def test_blocks():
+    rng = np.random.default_rng(0)
+    values = np.round(rng.uniform(0, 10, 250), 1)
+    values[120] = 12345.6
+    document = {
+        "regular": make_points(np.arange(250) * 60, values.tolist()),
+        "irregular": make_points(np.cumsum(rng.integers(1, 600, 250)), values.tolist()),
+        "short": make_points([0, 5, 7], [1, 2, 3]),
+    }
+    plain = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value")
+    for options in [{}, {"packed": True}, {"delta": True}, {"encoding_size": "auto"}, {"gzip": True}]:
+        encoded = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value", block_size=100, **options)
+        gzip = options.get("gzip", False)
+        assert JSONEncoder.decode_json(encoded, gzip=gzip) == document
+        assert json.loads(JSONEncoder.decode_json_to_bytes(encoded, gzip=gzip)) == document
+
+    encoded = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value", block_size=100)
+    assert encoded["short"] == plain["short"]
+    # Only the block with the spike pays for it
+    series = encoded["regular"]
+    assert [block["encoder"]["encoding_depth"] for block in series["blocks"]] == [2, 3, 2]
+    assert [block["length"] for block in series["blocks"]] == [200, 300, 100]
+    assert len(series["data"]) < len(plain["regular"]["data"])
+    assert JSONEncoder.decode_json(encoded, as_numpy=True)["irregular"].to_list() == document["irregular"]
+    assert JSONEncoder.decode_json(encoded, lazy=True)["regular"][120]["Value"] == 12345.6
+
+def test_blocks_value_types():
+    # Later blocks get a signed float encoder, every point still decodes with the same type
+    points = make_points(np.arange(7) * 60, [1, 2, 3, 4, -5.0, 6.0, -7.0])
+    encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value="Value", block_size=4)
+    assert len(encoded["s"]["blocks"]) == 2
+    decoded = JSONEncoder.decode_json(encoded)
+    assert decoded["s"] == points
+    assert len(set(type(point["Value"]) for point in decoded["s"])) == 1
+    assert JSONEncoder.decode_json_to_bytes(encoded) == json.dumps(decoded).encode()
+
+def test_decode_blocks():
+    points = make_points(np.cumsum(np.arange(1, 251)), np.arange(250) * 0.5)
+    encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value="Value", block_size=100)["s"]
+    assert JSONEncoder.decode_blocks(encoded, [1])[0] == points[100:200]
+    with ThreadPoolExecutor(2) as executor:
+        blocks = JSONEncoder.decode_blocks(encoded, as_numpy=True, executor=executor)
+    assert [len(block) for block in blocks] == [100, 100, 50]
+    assert sum([block.to_list() for block in blocks], []) == points
+    # A series without blocks is a single block
+    assert JSONEncoder.decode_blocks(JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value="Value")["s"]) == [points]
+
+def test_append_blocks():
+    points = make_points(np.cumsum(np.arange(1, 251)), np.arange(250) * 0.5)
+    new_points = make_points(np.arange(1, 180) * 7 + 2000000, np.arange(179) * -1.5)
+    for options in [{}, {"packed": True}, {"delta": True}]:
+        encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value="Value", block_size=100, **options)["s"]
+        appended = JSONEncoder.append(encoded, new_points)
+        assert len(appended["blocks"]) == 5
+        assert [len(block) for block in JSONEncoder.decode_blocks(appended)] == [100, 100, 100, 100, 29]
+        assert JSONEncoder.decode_json({"s": appended})["s"] == points + new_points
+
+def test_blocks_single_point():
+    # A last block of one point has no gaps to take the interval from
+    points = make_points(np.cumsum(np.arange(1, 1026)), np.arange(1025) * 0.5)
+    for options in [{}, {"packed": True}, {"encoding_size": "auto"}, {"delta": True}]:
+        encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value="Value", block_size=1024, **options)
+        assert [len(block) for block in JSONEncoder.decode_blocks(encoded["s"])] == [1024, 1]
+        assert JSONEncoder.decode_json(json.loads(json.dumps(encoded)))["s"] == points
+
+def test_append_blocks_single_point():
+    points = make_points(np.arange(200) * 60, np.arange(200) * 0.5)
+    new_point = make_points([12000], [3.5])
+    next_point = make_points([12007], [1.5])
+    for options in [{}, {"packed": True}, {"delta": True}]:
+        encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value="Value", block_size=100, **options)["s"]
+        appended = JSONEncoder.append(encoded, new_point)
+        assert len(appended["blocks"]) == 3
+        assert JSONEncoder.decode_json({"s": appended})["s"] == points + new_point
+        appended = JSONEncoder.append(appended, next_point)
+        assert JSONEncoder.decode_json({"s": appended})["s"] == points + new_point + next_point
+
+def make_multi_points(offsets, seed=0):
+    rng = np.random.default_rng(seed)
+    values = np.round(rng.uniform(0, 100, len(offsets)), 2)
+    points = make_points(offsets, values.tolist())
+    for point, value in zip(points, values.tolist()):
+        point.update({"Min": round(value - 1.5, 2), "Max": int(value) + 3, "Quality": 192})
+    return points
+
+def test_multi_value():
+    keys = ["Value", "Min", "Max", "Quality"]
+    for offsets in [np.arange(200) * 60, np.cumsum(np.arange(1, 201))]:
+        points = make_multi_points(offsets)
+        for options in [{}, {"packed": True}, {"encoding_size": "auto"}, {"block_size": 64}, {"delta": True, "frame_of_reference": True}]:
+            encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value=keys, **options)
+            assert len(json.dumps(encoded)) < len(json.dumps(points)) / 4
+            assert JSONEncoder.decode_json(json.loads(json.dumps(encoded)))["s"] == points
+            assert JSONEncoder.decode_json_to_bytes(encoded) == json.dumps(JSONEncoder.decode_json(encoded)).encode()
+
+            decoded = JSONEncoder.decode_json(encoded, as_numpy=True)["s"]
+            assert decoded.to_numpy().shape == (200, 5)
+            assert decoded[7] == points[7]
+            assert decoded[10:20] == points[10:20]
+
+    # The constant column is stored once, the others get their own encoder
+    encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value=keys)["s"]
+    assert encoded["value_columns"]["Quality"] == {"static": 192}
+    assert encoded["value_columns"]["Max"]["encoder"]["numeric_type"] == "int"
+
+def test_multi_value_mixed_keys():
+    # Lists whose points do not hold exactly the time and the value keys are left as they are
+    points = make_multi_points(np.arange(20) * 60)
+    document = {"full": points, "partial": [{"UTC": p["UTC"], "Value": p["Value"]} for p in points]}
+    encoded = JSONEncoder.encode_json(document, ts_key="UTC", ts_value=["Value", "Min", "Max", "Quality"])
+    assert "encoding_start" in encoded["full"]
+    assert encoded["partial"] == document["partial"]
+    assert JSONEncoder.decode_json(encoded) == document
+
+def test_append_multi_value():
+    keys = ["Value", "Min", "Max", "Quality"]
+    points = make_multi_points(np.cumsum(np.arange(1, 101)))
+    new_points = make_multi_points(np.arange(1, 41) * 300 + 10000, seed=1)
+    for options in [{}, {"packed": True}, {"block_size": 64}]:
+        encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value=keys, **options)["s"]
+        appended = JSONEncoder.append(encoded, new_points)
+        assert JSONEncoder.decode_json({"s": appended})["s"] == points + new_points
+
+def test_lookup_values():
+    statuses = ["OK", "WARNING, check pressure", "ALARM", None, True, 1]
+    rng = np.random.default_rng(0)
+    points = make_points(np.cumsum(rng.integers(1, 600, 300)), [statuses[i] for i in rng.integers(0, len(statuses), 300)], ts_value="Status")
+    for options in [{}, {"packed": True}, {"block_size": 100}, {"error_bound": 0.5}]:
+        encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value="Status", **options)
+        # Every distinct value is written once, the points hold codes
+        assert sorted(map(json.dumps, encoded["s"]["lookups"]["Status"])) == sorted(map(json.dumps, statuses))
+        assert len(json.dumps(encoded)) < len(json.dumps(points)) / 4
+        assert JSONEncoder.decode_json(json.loads(json.dumps(encoded)))["s"] == points
+        assert JSONEncoder.decode_json_to_bytes(encoded) == json.dumps({"s": points}).encode()
+        decoded = JSONEncoder.decode_json(encoded, as_numpy=True)["s"]
+        assert decoded[5] == points[5]
+        assert decoded[:10] == points[:10]
+
+    static = make_points(np.arange(10) * 60, ["OK"] * 10, ts_value="Status")
+    encoded = JSONEncoder.encode_json({"s": static}, ts_key="UTC", ts_value="Status")
+    assert "data" not in encoded["s"]
+    assert JSONEncoder.decode_json(encoded)["s"] == static
+
+def test_lookup_value_types():
+    # Numeric strings, booleans and None are not numbers and come back with their own type
+    for values in [["200", "404", "200", "500"], [True, False, True, True], [None, 1.5, None, 2.5], [1, None, "1", True, 2.0]]:
+        points = make_points(np.arange(len(values)) * 60, values, ts_value="Status")
+        for ts_value in ["Status", ["Status"]]:
+            encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value=ts_value)
+            assert "lookups" in encoded["s"]
+            decoded = JSONEncoder.decode_json(json.loads(json.dumps(encoded)))["s"]
+            assert [(type(point["Status"]), point["Status"]) for point in decoded] == [(type(value), value) for value in values]
+
+def test_lookup_multi_value():
+    points = make_multi_points(np.arange(100) * 60)
+    for i, point in enumerate(points):
+        point["Quality"] = ["good", "bad", "uncertain"][i % 3]
+    encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value=["Value", "Min", "Max", "Quality"])
+    assert encoded["s"]["lookups"] == {"Quality": ["good", "bad", "uncertain"]}
+    assert JSONEncoder.decode_json(encoded)["s"] == points
+    assert JSONEncoder.decode_json_to_bytes(encoded) == json.dumps(JSONEncoder.decode_json(encoded)).encode()
+
+def test_append_lookup_values():
+    points = make_points(np.arange(150) * 60, ["OK", "ALARM", "OK"] * 50, ts_value="Status")
+    new_points = make_points(np.arange(150, 200) * 60, ["OK", "OFFLINE"] * 25, ts_value="Status")
+    for options in [{}, {"packed": True}, {"block_size": 100}]:
+        encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value="Status", **options)["s"]
+        appended = JSONEncoder.append(encoded, new_points)
+        # Known values keep their code, new ones are added to the lookup
+        assert appended["lookups"]["Status"] == ["OK", "ALARM", "OFFLINE"]
+        assert JSONEncoder.decode_json({"s": appended})["s"] == points + new_points
+
+    numeric = JSONEncoder.encode_json({"s": make_points(np.arange(10) * 60, np.arange(10) * 0.5)}, ts_key="UTC", ts_value="Value")["s"]
+    try:
+        JSONEncoder.append(numeric, make_points([600], ["OK"]))
+        assert False
+    except ValueError:
+        pass
+
+def make_document(seed, static=False):
+    rng = np.random.default_rng(seed)
+    return {
+        "regular": make_points(np.arange(50) * 60, np.round(rng.uniform(0, 100, 50), 2).tolist()),
+        "irregular": [make_points(np.cumsum(rng.integers(1, 600, 40)), np.round(rng.uniform(-10, 10, 40), 1).tolist())],
+        "static": make_points(np.arange(20) * 30, [float(seed)] * 20),
+    }
+
+def test_plan_roundtrip():
+    plan = JSONEncoder.create_plan(make_document(0), ts_key="UTC", ts_value="Value")
+    for seed in [1, 2, 3]:
+        document = make_document(seed)
+        encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", plan=plan)
+        assert encoded["regular"]["plan"] == f'{plan.plan_id}/{plan.paths["$.regular"]}'
+        assert encoded["irregular"][0]["plan"].startswith(plan.plan_id)
+        assert encoded["static"]["static"]["value"] == seed
+        unplanned = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value")
+        assert len(json.dumps(encoded)) < len(json.dumps(unplanned))
+        assert JSONEncoder.decode_json(encoded) == document
+
+def test_plan_fallback():
+    plan = JSONEncoder.create_plan(make_document(0), ts_key="UTC", ts_value="Value")
+    document = make_document(1)
+    # More decimals and a different interval than the plan allows
+    document["regular"][0]["Value"] = 0.12345
+    document["irregular"][0] = make_points(np.arange(40) * 10, np.arange(40).tolist())
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", plan=plan)
+    assert "plan" not in encoded["regular"]
+    assert "plan" in encoded["static"]
+    assert JSONEncoder.decode_json(encoded) == document
+
+def test_plan_delta():
+    plan = JSONEncoder.create_plan(make_document(0), ts_key="UTC", ts_value="Value", delta=True)
+    document = make_document(4)
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", plan=plan)
+    assert "plan" in encoded["regular"]
+    assert JSONEncoder.decode_json(encoded) == document
+
+def test_plans_bounded():
+    from src.timeseriesencoder.encoders import time_series_encoder
+    first = JSONEncoder.create_plan(make_document(0), ts_key="UTC", ts_value="Value")
+    for i in range(time_series_encoder.MAX_REGISTERED_PLANS + 10):
+        EncodingPlan.register(EncodingPlan(["$.s%d" % i], [{"encoding_depth": 1}]))
+    assert len(EncodingPlan.plans) == time_series_encoder.MAX_REGISTERED_PLANS
+    assert first.plan_id not in EncodingPlan.plans
+
+    # Encoding with a plan registers it again
+    document = make_document(1)
+    encoded = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value", plan=first)
+    assert JSONEncoder.decode_json(encoded) == document
+
+def test_append_planned():
+    new_points = make_points([3000, 3060], [1.5, 2.5])
+    for options in [{}, {"packed": True}]:
+        plan = JSONEncoder.create_plan(make_document(0), ts_key="UTC", ts_value="Value", **options)
+        document = make_document(1)
+        encoded = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value", plan=plan)
+        for key in ["regular", "static"]:
+            assert "plan" in encoded[key]
+            appended = JSONEncoder.append(encoded[key], new_points)
+            assert "plan" not in appended
+            assert JSONEncoder.decode_json({"s": appended})["s"] == document[key] + new_points
+
+def test_plan_serialize():
+    plan = JSONEncoder.create_plan(make_document(0), ts_key="UTC", ts_value="Value")
+    document = make_document(5)
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", plan=plan, gzip=True)
+    msg = json.loads(json.dumps(EncodingPlan.serialize(plan), cls=NumpyEncoder))
+    del EncodingPlan.plans[plan.plan_id]
+    try:
+        JSONEncoder.decode_json(encoded, gzip=True)
+        assert False
+    except ValueError:
+        pass
+    restored = EncodingPlan.deserialize(msg)
+    assert restored.plan_id == plan.plan_id
+    assert JSONEncoder.decode_json(encoded, gzip=True) == document
+
+def make_station_document():
+    return {
+        "meta": {"name": "station", "points": [{"UTC": "x", "Value": "y"}]},
+        "stations": [{"id": i, "series": make_points(np.arange(10) * 60 + i, np.arange(10) * 1.5 + i)} for i in range(3)],
+        "odd.key": make_points([0, 5, 7], [1.0, 2.0, 3.0]),
+    }
+
+def test_encode_paths():
+    document = make_station_document()
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", paths=["$.stations[*].series", "$['odd.key']"])
+    # Unselected parts are left untouched, even when they look like a series
+    assert encoded["meta"] == document["meta"]
+    assert "encoding_start" in encoded["stations"][2]["series"]
+    assert "encoding_start" in encoded["odd.key"]
+    assert JSONEncoder.decode_json(encoded)["stations"] == document["stations"]
+
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", paths=["$.stations[1]", "$.missing.key"])
+    assert "encoding_start" in encoded["stations"][1]["series"]
+    assert type(encoded["stations"][0]["series"]) == list
+
+def test_series_index():
+    document = make_station_document()
+    del document["meta"]["points"]
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", index=True)
+    assert encoded["__series__"] == ["$.stations[0].series", "$.stations[1].series", "$.stations[2].series", "$['odd.key']"]
+    assert JSONEncoder.decode_json(encoded) == document
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", paths=["$.stations[*].series"], index=True, gzip=True)
+    assert JSONEncoder.decode_json(encoded, gzip=True) == document
+    try:
+        JSONEncoder.encode_json([make_points([0, 1], [1, 2])], ts_key="UTC", ts_value="Value", index=True)
+        assert False
+    except ValueError:
+        pass
+
+def test_parse_path():
+    assert JSONEncoder._parse_path("$") == []
+    assert JSONEncoder._parse_path("$.a[2].*['b.c'][*]") == ["a", 2, None, "b.c", None]
+    for selector in ["a.b", "$.a[x]", "$..a"]:
+        try:
+            JSONEncoder._parse_path(selector)
+            assert False
+        except ValueError:
+            pass
+
+def test_partial_decode():
+    document = make_station_document()
+    del document["meta"]["points"]
+    for index in [False, True]:
+        encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", index=index)
+        decoded = JSONEncoder.decode_json(deepcopy(encoded), paths=["$.stations[1]"])
+        assert decoded["stations"][1] == document["stations"][1]
+        assert decoded["stations"][0]["series"] == encoded["stations"][0]["series"]
+        assert decoded["odd.key"] == encoded["odd.key"]
+
+        decoded = JSONEncoder.decode_json(deepcopy(encoded), paths=["$.stations[*].series"], drop=True)
+        assert decoded["stations"] == document["stations"]
+        assert "odd.key" not in decoded
+
+        decoded = JSONEncoder.decode_json(deepcopy(encoded), predicate=lambda path, series: path.endswith("series") and "interval" in series, drop=True)
+        assert [station.get("series") for station in decoded["stations"]] == [station["series"] for station in document["stations"]]
+        assert "odd.key" not in decoded
+
+def test_partial_decode_root_list():
+    document = [make_points([0, 60, 120], [1.0, 2.0, 3.0]), make_points([0, 5, 7], [1.0, 2.0, 3.0])]
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value")
+    assert JSONEncoder.decode_json(deepcopy(encoded), paths=["$[1]"], drop=True) == [document[1]]
+    assert JSONEncoder.decode_json(deepcopy(encoded[0]), paths=["$"]) == document[0]
+
+def test_lazy_decode():
+    document = make_station_document()
+    del document["meta"]["points"]
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", gzip=True)
+    decoded = JSONEncoder.decode_json(encoded, gzip=True, lazy=True)
+    series = decoded["stations"][2]["series"]
+    assert isinstance(series, LazySeries)
+    assert not series.is_decoded()
+    assert series[0] == document["stations"][2]["series"][0]
+    assert series.is_decoded()
+    assert not decoded["odd.key"].is_decoded()
+    assert len(decoded["odd.key"]) == 3
+    assert decoded == document
+
+def test_decode_as_numpy():
+    document = make_station_document()
+    del document["meta"]["points"]
+    document["static"] = make_points([0, 7, 9], [2, 2, 2])
+    document["regular_static"] = make_points([0, 60, 120], [-1.5, -1.5, -1.5])
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value")
+    decoded = JSONEncoder.decode_json(deepcopy(encoded), as_numpy=True)
+    series = decoded["stations"][1]["series"]
+    assert isinstance(series, DecodedSeries)
+    assert decoded == document
+    assert len(series) == 10
+    assert series[-1] == document["stations"][1]["series"][-1]
+    assert series[2:5] == document["stations"][1]["series"][2:5]
+    assert series.to_numpy().shape == (10, 2)
+    assert series.to_numpy()[3, 1] == document["stations"][1]["series"][3]["Value"]
+
+    lazy = JSONEncoder.decode_json(deepcopy(encoded), lazy=True, as_numpy=True)
+    assert isinstance(lazy["static"].decode(), DecodedSeries)
+    assert lazy == document
+
+def test_decode_as_numpy_memory():
+    import tracemalloc
+    points = make_points(np.arange(20000) * 60, np.round(np.random.default_rng(0).uniform(0, 100, 20000), 2))
+    encoded = JSONEncoder.encode_json({"s": points}, ts_key="UTC", ts_value="Value")
+    sizes = []
+    for as_numpy in [False, True]:
+        data = deepcopy(encoded)
+        tracemalloc.start()
+        decoded = JSONEncoder.decode_json(data, as_numpy=as_numpy)
+        sizes.append(tracemalloc.get_traced_memory()[0])
+        tracemalloc.stop()
+        del decoded
+    assert sizes[1] * 10 < sizes[0]
+
+def test_decode_json_to_bytes():
+    document = make_station_document()
+    del document["meta"]["points"]
+    document["static"] = make_points([0, 7, 9], [2, 2, 2])
+    document["meta"]["nested"] = [None, True, 1.5, "quote\"d", {"é": []}]
+    for options in [{}, {"index": True}, {"gzip": True}, {"compression": "zlib"}]:
+        encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", **options)
+        gzip = options.get("gzip", False)
+        expected = json.dumps(JSONEncoder.decode_json(deepcopy(encoded), gzip=gzip)).encode()
+        assert JSONEncoder.decode_json_to_bytes(deepcopy(encoded), gzip=gzip) == expected
+        stream = io.BytesIO()
+        JSONEncoder.decode_json_to_bytes(deepcopy(encoded), gzip=gzip, fileobj=stream)
+        assert json.loads(stream.getvalue()) == document
+
+def test_decode_json_to_bytes_plan():
+    plan = JSONEncoder.create_plan(make_document(0), ts_key="UTC", ts_value="Value")
+    document = make_document(6)
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", plan=plan)
+    assert json.loads(JSONEncoder.decode_json_to_bytes(encoded)) == document
+
+def test_json_backends():
+    from src.timeseriesencoder.encoders import time_series_encoder
+    helpers = time_series_encoder.EncoderHelpers
+    default = time_series_encoder.JSON_BACKEND
+    document = make_station_document()
+    del document["meta"]["points"]
+    available = [b for b in time_series_encoder.JSON_BACKENDS if b == 'json' or getattr(time_series_encoder, b) is not None]
+    try:
+        for backend in available:
+            helpers.set_json_backend(backend)
+            encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", gzip=True)
+            assert JSONEncoder.decode_json(encoded, gzip=True) == document
+            stream = io.BytesIO()
+            JSONEncoder.encode_json_to_file(deepcopy(document), stream, ts_key="UTC", ts_value="Value", gzip=True)
+            stream.seek(0)
+            assert JSONEncoder.decode_json_from_file(stream, gzip=True) == document
+            # Numpy values from the caller still serialize
+            assert helpers.json_loads(helpers.json_dumps({"a": np.float32(1.5), "b": np.arange(2)})) == {"a": 1.5, "b": [0, 1]}
+    finally:
+        helpers.set_json_backend(default)
+    try:
+        helpers.set_json_backend('simplejson')
+        assert False
+    except ValueError:
+        pass
+
+def test_encoded_types_are_native():
+    document = make_document(7)
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value")
+    assert all(check_numpy_types(series) == False for series in [encoded["regular"], encoded["irregular"][0], encoded["static"]])
+    plan = JSONEncoder.create_plan(make_document(0), ts_key="UTC", ts_value="Value")
+    planned = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", plan=plan)
+    assert "plan" in planned["regular"] and check_numpy_types(planned) == False
+
+def test_plan_output_with_orjson():
+    # The fast backend must serialize plan output itself, rather than fall back to NumpyEncoder
+    from src.timeseriesencoder.encoders import time_series_encoder
+    if time_series_encoder.orjson is None:
+        return
+    plan = JSONEncoder.create_plan(make_document(0), ts_key="UTC", ts_value="Value")
+    document = make_document(1)
+    encoded = JSONEncoder.encode_json(deepcopy(document), ts_key="UTC", ts_value="Value", plan=plan)
+    assert JSONEncoder.decode_json(time_series_encoder.orjson.loads(time_series_encoder.orjson.dumps(encoded))) == document
+
+def test_encode_decode_leave_input_unchanged():
+    document = make_station_document()
+    del document["meta"]["points"]
+    original = deepcopy(document)
+    options = [{}, {"index": True}, {"paths": ["$.stations[*].series"]}]
+    for option in options:
+        encoded = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value", **option)
+        assert document == original
+        # Subtrees without a series are shared, not copied
+        assert encoded["meta"] is document["meta"]
+        encoded_copy = deepcopy(encoded)
+        for decode_option in [{}, {"paths": ["$.stations[0]"]}, {"drop": True, "predicate": lambda path, series: "interval" in series}, {"lazy": True}]:
+            JSONEncoder.decode_json(encoded, **decode_option)
+            assert encoded == encoded_copy
+        assert JSONEncoder.decode_json(encoded) == original
+
+def test_encode_decode_inplace():
+    document = make_station_document()
+    del document["meta"]["points"]
+    original = deepcopy(document)
+    encoded = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value", inplace=True)
+    assert encoded is document
+    assert "encoding_start" in document["stations"][0]["series"]
+    decoded = JSONEncoder.decode_json(encoded, inplace=True)
+    assert decoded is document
+    assert document == original
+
+def make_batch(n, seed=0):
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(2, 30, n)
+    times, values = [], []
+    for i, count in enumerate(counts):
+        if i % 2 == 0:
+            t = np.arange(count) * 60.0
+        else:
+            t = np.cumsum(rng.integers(-20, 600, count)).astype(float)
+        values.append([np.round(rng.uniform(0, 100, count), 2), np.full(count, -3.5), np.round(rng.normal(0, 1e6, count), 4), rng.integers(0, 5, count).astype(float)][i % 4])
+        times.append(t + 1640995200)
+    return np.concatenate(times), np.concatenate(values), np.concatenate([[0], np.cumsum(counts)])
+
+def test_encode_batch():
+    times, values, offsets = make_batch(200)
+    document = {}
+    for i in range(len(offsets) - 1):
+        t = np.datetime_as_string(times[offsets[i]:offsets[i + 1]].astype('datetime64[s]'), unit='s')
+        document[str(i)] = [{"UTC": s + 'Z', "Value": v} for s, v in zip(t, values[offsets[i]:offsets[i + 1]].tolist())]
+    for encoding_size in [16, 64, 91]:
+        batch = JSONEncoder.encode_batch(times, values, offsets, encoding_size=encoding_size)
+        expected = JSONEncoder.encode_json(document, ts_key="UTC", ts_value="Value", encoding_size=encoding_size)
+        assert batch == [expected[str(i)] for i in range(len(batch))]
+        decoded_times, decoded_values, decoded_offsets = JSONEncoder.decode_batch(batch)
+        assert np.array_equal(decoded_times, times)
+        assert np.array_equal(decoded_values, values)
+        assert np.array_equal(decoded_offsets, offsets)
+    assert JSONEncoder.decode_json(batch)[3] == document["3"]
+
+def test_encode_batch_large_values():
+    # Large integer valued floats must get the precision encode_json gives them
+    rng = np.random.default_rng(1)
+    counts = rng.integers(2, 20, 400)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    times = np.concatenate([np.arange(count) * 60.0 + 1640995200 for count in counts])
+    values = np.concatenate([np.rint(rng.uniform(-1e12, 1e12, count)) if i % 2 == 0 else np.round(rng.uniform(0, 1e6, count), 3) for i, count in enumerate(counts)])
+    batch = JSONEncoder.encode_batch(times, values, offsets)
+    for i in range(len(counts)):
+        t = np.datetime_as_string(times[offsets[i]:offsets[i + 1]].astype('datetime64[s]'), unit='s')
+        series = [{"UTC": s + 'Z', "Value": v} for s, v in zip(t, values[offsets[i]:offsets[i + 1]].tolist())]
+        assert batch[i] == JSONEncoder.encode_json({"s": series}, ts_key="UTC", ts_value="Value")["s"]
+    assert np.array_equal(JSONEncoder.decode_batch(batch)[1], values)
 
+def test_encode_batch_single_points():
+    # Single points encode like encode_json does, as a static value with interval 0, wherever they sit in the batch
+    times = np.asarray([1640995200.0, 1640995260.0, 1640995320.0, 1640995500.0, 1640995200.0])
+    values = np.asarray([2.0, 1.5, 2.5, 7.25, -3.0])
+    offsets = np.asarray([0, 1, 4, 5])
+    batch = JSONEncoder.encode_batch(times, values, offsets, encoding_size=16)
+    for i in range(len(offsets) - 1):
+        t = np.datetime_as_string(times[offsets[i]:offsets[i + 1]].astype('datetime64[s]'), unit='s')
+        series = [{"UTC": s + 'Z', "Value": v} for s, v in zip(t, values[offsets[i]:offsets[i + 1]].tolist())]
+        assert batch[i] == JSONEncoder.encode_json({"s": series}, ts_key="UTC", ts_value="Value", encoding_size=16)["s"]
+    decoded_times, decoded_values, decoded_offsets = JSONEncoder.decode_batch(batch)
+    assert np.array_equal(decoded_times, times)
+    assert np.array_equal(decoded_values, values)
+    assert np.array_equal(decoded_offsets, offsets)
 
+def test_encode_batch_errors():
+    for times, values, offsets in [([0, 1, 2], [1, 2, 3], [0, 0, 3]), ([0, 1], [1, 2, 3], [0, 3]), ([0, 1, 2], [1, 2, 3], [0, 2])]:
+        try:
+            JSONEncoder.encode_batch(times, values, offsets)
+            assert False
+        except ValueError:
+            pass
 
 def get_encoded_sample_unsorted_base91():
     import json